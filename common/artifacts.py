@@ -0,0 +1,310 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: DANH MỤC (CATALOG) FILE KẾT QUẢ CỦA TỪNG BƯỚC — SQLite
+#
+# Trước đây preprocess.py, analyzer.py và web/app.py mỗi nơi 1 bản FNAME_RE + quét thư mục
+# để tìm file mới nhất theo (slug, gid, loc). Giờ:
+#   - bước nào ghi xong 1 file thì register() vào catalog (kind: detail / preprocessed / analyzed)
+#   - bảng `latest` giữ file mới nhất cho mỗi (kind, slug, gid, loc) -> tra cứu không cần quét thư mục
+#   - prune() xoá các bản cũ (giữ N bản mới nhất mỗi khoá) để output/ không phình mãi
+# File có sẵn từ trước (chưa có catalog) được backfill bằng cách quét tên file: 1 lần cho mỗi
+# (kind, thư mục) — bảng `backfilled` ghi nhớ thư mục nào đã quét, nên thư mục khác (JOBSDETAIL_DIR /
+# PREPROCESS_DIR trỏ nơi khác) vẫn được quét lần đầu dù catalog đã có file của kind đó ở chỗ khác.
+#
+#       python common/artifacts.py backfill
+#       python common/artifacts.py latest analyzed
+#       python common/artifacts.py prune --keep 3 [--dry-run]
+# ===========================================================
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+OUTPUT_DIR = ROOT / "output"
+CATALOG_DB = Path(os.getenv("ARTIFACT_DB", OUTPUT_DIR / "catalog.sqlite"))
+
+# Thư mục mặc định của từng loại file (dùng khi backfill)
+KIND_DIRS = {
+    "detail": OUTPUT_DIR / "jobsdetail",
+    "preprocessed": OUTPUT_DIR / "preprocess",
+    "analyzed": OUTPUT_DIR / "analyzer",
+}
+
+# MẪU TÊN FILE DUY NHẤT cho mọi bước:
+#   job_detail_output_<slug>_g<gid>_<loc>_<YYYY-mm-dd>_<HHMMSS>[_processed|_preprocessed|_analyzed].<parquet|xlsx>
+# (.parquet là định dạng trung gian chuẩn; .xlsx: file cũ, bản xuất cho người đọc, báo cáo analyzer)
+ARTIFACT_RE = re.compile(
+    r"^job_detail_output_(?P<slug>.+?)_g(?P<gid>\d+)_(?P<loc>\d{4})_"
+    r"(?P<date>\d{4}-\d{2}-\d{2})_(?P<time>\d{6})"
+    r"(?:_(?P<suffix>(?:pre)?processed|analyzed))?\.(?:xlsx|parquet)$",
+    re.IGNORECASE,
+)
+
+_SUFFIX_KIND = {None: "detail", "processed": "preprocessed", "preprocessed": "preprocessed", "analyzed": "analyzed"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind        TEXT NOT NULL,
+    slug        TEXT NOT NULL,
+    gid         TEXT NOT NULL,
+    loc         TEXT NOT NULL,
+    run_ts      TEXT NOT NULL,          -- YYYY-mm-dd_HHMMSS (so sánh chuỗi = so sánh thời gian)
+    path        TEXT NOT NULL UNIQUE,
+    rows        INTEGER,
+    parent      TEXT,                   -- file đầu vào sinh ra file này
+    created_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS latest (
+    kind        TEXT NOT NULL,
+    slug        TEXT NOT NULL,
+    gid         TEXT NOT NULL,
+    loc         TEXT NOT NULL,
+    artifact_id INTEGER NOT NULL REFERENCES artifacts(id),
+    PRIMARY KEY (kind, slug, gid, loc)
+);
+CREATE INDEX IF NOT EXISTS ix_artifacts_key ON artifacts(kind, slug, gid, loc, run_ts);
+CREATE TABLE IF NOT EXISTS backfilled (
+    kind        TEXT NOT NULL,
+    dir         TEXT NOT NULL,          -- thư mục đã quét (resolve)
+    at          REAL NOT NULL,
+    PRIMARY KEY (kind, dir)
+);
+"""
+
+
+def norm_slug(slug: str) -> str:
+    """Slug chuẩn hoá làm khoá: thường, '_' -> ' ', gộp khoảng trắng (giống web/app.py)."""
+    return re.sub(r"\s+", " ", str(slug or "").strip().lower().replace("_", " "))
+
+
+def parse_artifact_name(name: str) -> Optional[Dict]:
+    m = ARTIFACT_RE.match(Path(name).name)
+    if not m:
+        return None
+    suffix = (m.group("suffix") or "").lower() or None
+    return {"kind": _SUFFIX_KIND[suffix], "slug": norm_slug(m.group("slug")), "gid": m.group("gid"),
+            "loc": m.group("loc"), "run_ts": f"{m.group('date')}_{m.group('time')}"}
+
+
+class ArtifactCatalog:
+    """Thread-safe (lock + kết nối ngắn); nhiều tiến trình ghi chung được nhờ WAL + busy timeout."""
+
+    def __init__(self, db_path: Path = CATALOG_DB):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        con = self._connect()
+        try:
+            con.executescript(_SCHEMA)
+        finally:
+            con.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    # ---------- ghi ----------
+    def register(self, path, kind: Optional[str] = None, rows: Optional[int] = None,
+                 parent=None) -> Optional[Dict]:
+        """Ghi nhận 1 file vừa tạo và cập nhật `latest` nếu nó mới hơn. Tên file không đúng mẫu -> None."""
+        path = Path(path).resolve()
+        meta = parse_artifact_name(path.name)
+        if meta is None:
+            return None
+        if kind:
+            meta["kind"] = kind
+        with self._lock:
+            con = self._connect()
+            try:
+                with con:
+                    self._upsert(con, meta, path, rows, parent)
+            finally:
+                con.close()
+        return meta
+
+    @staticmethod
+    def _upsert(con: sqlite3.Connection, meta: Dict, path: Path, rows: Optional[int], parent) -> None:
+        con.execute(
+            "INSERT INTO artifacts(kind, slug, gid, loc, run_ts, path, rows, parent, created_at) "
+            "VALUES (?,?,?,?,?,?,?,?,?) ON CONFLICT(path) DO UPDATE SET "
+            "rows=COALESCE(excluded.rows, rows), parent=COALESCE(excluded.parent, parent), created_at=excluded.created_at",
+            (meta["kind"], meta["slug"], meta["gid"], meta["loc"], meta["run_ts"], str(path), rows,
+             str(parent) if parent else None, time.time()))
+        ArtifactCatalog._recompute_latest(con, meta["kind"], meta["slug"], meta["gid"], meta["loc"])
+
+    @staticmethod
+    def _recompute_latest(con: sqlite3.Connection, kind: str, slug: str, gid: str, loc: str) -> None:
+        row = con.execute("SELECT id FROM artifacts WHERE kind=? AND slug=? AND gid=? AND loc=? "
+                          "ORDER BY run_ts DESC, id DESC LIMIT 1", (kind, slug, gid, loc)).fetchone()
+        if row is None:
+            con.execute("DELETE FROM latest WHERE kind=? AND slug=? AND gid=? AND loc=?", (kind, slug, gid, loc))
+        else:
+            con.execute("INSERT OR REPLACE INTO latest(kind, slug, gid, loc, artifact_id) VALUES (?,?,?,?,?)",
+                        (kind, slug, gid, loc, row["id"]))
+
+    def backfill(self, kind: Optional[str] = None, base_dir: Optional[Path] = None) -> int:
+        """Quét thư mục để đưa các file có sẵn vào catalog và ghi nhớ (kind, thư mục) đã quét.
+        Trả về số file đã ghi nhận."""
+        kinds = [k for k in KIND_DIRS if kind in (None, k)]
+        targets = [(k, Path(base_dir) if base_dir else KIND_DIRS[k]) for k in kinds]
+        n = 0
+        with self._lock:
+            con = self._connect()
+            try:
+                with con:
+                    for k, d in targets:
+                        d = d.resolve()
+                        if d.exists():
+                            for p in d.iterdir():
+                                meta = parse_artifact_name(p.name) if p.is_file() else None
+                                if meta is None or meta["kind"] != k:
+                                    continue
+                                if p.suffix.lower() == ".xlsx" and p.with_suffix(".parquet").exists():
+                                    continue   # bản Excel xuất kèm (EXPORT_XLSX) -> file chính là .parquet
+                                self._upsert(con, meta, p.resolve(), None, None)
+                                n += 1
+                        con.execute("INSERT OR REPLACE INTO backfilled(kind, dir, at) VALUES (?,?,?)",
+                                    (k, str(d), time.time()))
+            finally:
+                con.close()
+        return n
+
+    def _is_backfilled(self, kind: str, d: Path) -> bool:
+        with self._lock:
+            con = self._connect()
+            try:
+                return con.execute("SELECT 1 FROM backfilled WHERE kind=? AND dir=?",
+                                   (kind, str(d))).fetchone() is not None
+            finally:
+                con.close()
+
+    # ---------- đọc ----------
+    def latest(self, kind: str, base_dir: Optional[Path] = None) -> List[Dict]:
+        """
+        File mới nhất cho mỗi (slug, gid, loc) của `kind`, trong base_dir nếu có (chỉ xét file nằm
+        trong thư mục đó, không phải lọc bảng `latest` toàn cục). Thư mục chưa từng quét thì backfill
+        trước. Bản ghi có file đã mất bị gỡ và tính lại `latest`.
+        """
+        d = Path(base_dir).resolve() if base_dir is not None else KIND_DIRS[kind].resolve()
+        if not self._is_backfilled(kind, d):
+            self.backfill(kind, d)
+        rows = self._latest_rows(kind, d if base_dir is not None else None)
+        missing = [r for r in rows if not Path(r["path"]).exists()]
+        if missing:
+            self.forget([r["path"] for r in missing])
+            rows = self._latest_rows(kind, d if base_dir is not None else None)
+        return rows
+
+    def latest_paths(self, kind: str, base_dir: Optional[Path] = None) -> List[Path]:
+        return [Path(r["path"]) for r in self.latest(kind, base_dir)]
+
+    def _latest_rows(self, kind: str, base_dir: Optional[Path] = None) -> List[Dict]:
+        with self._lock:
+            con = self._connect()
+            try:
+                if base_dir is None:
+                    return [dict(r) for r in con.execute(
+                        "SELECT a.* FROM latest l JOIN artifacts a ON a.id = l.artifact_id WHERE l.kind=? "
+                        "ORDER BY a.slug, a.gid, a.loc", (kind,))]
+                rows = [dict(r) for r in con.execute(
+                    "SELECT * FROM artifacts WHERE kind=? ORDER BY slug, gid, loc, run_ts DESC, id DESC", (kind,))]
+            finally:
+                con.close()
+        # Mới nhất theo từng khoá, chỉ trong base_dir (đã sắp run_ts giảm dần -> bản đầu tiên gặp)
+        best: Dict[tuple, Dict] = {}
+        for r in rows:
+            if Path(r["path"]).parent == base_dir:
+                best.setdefault((r["slug"], r["gid"], r["loc"]), r)
+        return list(best.values())
+
+    # ---------- dọn dẹp ----------
+    def forget(self, paths: Iterable[str]) -> None:
+        with self._lock:
+            con = self._connect()
+            try:
+                with con:
+                    for p in paths:
+                        row = con.execute("SELECT * FROM artifacts WHERE path=?", (str(p),)).fetchone()
+                        if row is None:
+                            continue
+                        con.execute("DELETE FROM latest WHERE artifact_id=?", (row["id"],))
+                        con.execute("DELETE FROM artifacts WHERE id=?", (row["id"],))
+                        self._recompute_latest(con, row["kind"], row["slug"], row["gid"], row["loc"])
+            finally:
+                con.close()
+
+    def prune(self, keep: int = 3, dry_run: bool = False) -> List[str]:
+        """Giữ `keep` bản mới nhất cho mỗi (kind, slug, gid, loc); xoá file + bản ghi các bản cũ hơn."""
+        keep = max(1, keep)
+        with self._lock:
+            con = self._connect()
+            try:
+                old = [r["path"] for r in con.execute(
+                    "SELECT path FROM (SELECT path, ROW_NUMBER() OVER (PARTITION BY kind, slug, gid, loc "
+                    "ORDER BY run_ts DESC, id DESC) AS rn FROM artifacts) WHERE rn > ?", (keep,))]
+            finally:
+                con.close()
+        if dry_run:
+            return old
+        for p in old:
+            try:
+                Path(p).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[CATALOG] Không xoá được {p}: {e}")
+        self.forget(old)
+        return old
+
+
+_default: Optional[ArtifactCatalog] = None
+
+
+def catalog() -> ArtifactCatalog:
+    global _default
+    if _default is None:
+        _default = ArtifactCatalog()
+    return _default
+
+
+def register(path, kind: Optional[str] = None, rows: Optional[int] = None, parent=None) -> None:
+    """Tiện ích cho các bước: ghi nhận file vào catalog mặc định; lỗi catalog không làm hỏng bước."""
+    try:
+        catalog().register(path, kind=kind, rows=rows, parent=parent)
+    except Exception as e:
+        print(f"[CATALOG] Không ghi nhận được {path}: {e}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Catalog file kết quả (output/catalog.sqlite)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("backfill", help="quét output/ và ghi nhận các file có sẵn")
+    p_latest = sub.add_parser("latest", help="liệt kê file mới nhất theo (slug, gid, loc)")
+    p_latest.add_argument("kind", choices=sorted(KIND_DIRS))
+    p_prune = sub.add_parser("prune", help="xoá bản cũ, giữ N bản mới nhất mỗi khoá")
+    p_prune.add_argument("--keep", type=int, default=int(os.getenv("ARTIFACT_KEEP", "3")))
+    p_prune.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    cat = catalog()
+    if args.cmd == "backfill":
+        print(f"Đã ghi nhận {cat.backfill()} file.")
+    elif args.cmd == "latest":
+        for r in cat.latest(args.kind):
+            print(f"{r['slug']:<45} g{r['gid']:<4} {r['loc']} {r['run_ts']}  {Path(r['path']).name}")
+    elif args.cmd == "prune":
+        removed = cat.prune(keep=args.keep, dry_run=args.dry_run)
+        verb = "Sẽ xoá" if args.dry_run else "Đã xoá"
+        print(f"{verb} {len(removed)} file cũ.")
+        for p in removed:
+            print(" -", p)
+    sys.exit(0)
@@ -0,0 +1,93 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: CHẠY 1 HÀM THUẦN TRÊN DANH SÁCH LỚN BẰNG NHIỀU TIẾN TRÌNH, THEO TỪNG KHÚC, GIỮ THỨ TỰ
+#
+# Một số bước preprocess (gắn nhãn phúc lợi, nhận diện ngôn ngữ) là vòng Python thuần chạy regex
+# trên mô tả công việc dài -> 1 file lớn chỉ dùng 1 lõi. map_chunked(fn, items):
+#   - cắt items thành các khúc liên tiếp, gửi từng khúc sang pool tiến trình, nối kết quả đúng thứ tự
+#   - chỉ gửi dữ liệu cần thiết (list chuỗi / tuple chuỗi), không gửi cả DataFrame
+#   - fn phải là hàm cấp module (pickle được theo tên), không phải hàm lồng / lambda
+#   - ít phần tử (< CHUNK_MIN_ITEMS) hoặc tắt -> chạy ngay tại chỗ như vòng for thường
+# Pool tạo 1 lần cho cả tiến trình (dùng lại giữa các bước / các file), đóng khi thoát.
+#
+#   CHUNK_WORKERS   = 1 (mặc định, tắt) | N | auto (= số lõi)
+#   CHUNK_MIN_ITEMS = 2000   ít hơn thì không đáng chi phí gửi/nhận giữa tiến trình
+#   CHUNK_ITEMS     = 500    kích thước tối thiểu 1 khúc
+# Tự tắt trong tiến trình daemon (warm worker) và trong tiến trình con của preprocess song song
+# theo file (PREPROCESS_WORKERS > 1 đặt CHUNK_WORKERS=1) -> không lồng pool trong pool.
+# ===========================================================
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Sequence
+
+_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+
+
+def workers() -> int:
+    """Số tiến trình cho map_chunked; đọc biến môi trường mỗi lần gọi (tiến trình con có thể đặt lại)."""
+    raw = os.getenv("CHUNK_WORKERS", "1").strip().lower()
+    cores = os.cpu_count() or 1
+    if raw in ("auto", "0", ""):
+        n = cores
+    else:
+        try:
+            n = int(raw)
+        except ValueError:
+            return 1
+    if multiprocessing.current_process().daemon:
+        return 1
+    return max(1, min(n, cores))
+
+
+def _get_pool(n: int) -> ProcessPoolExecutor:
+    global _pool, _pool_size
+    with _lock:
+        if _pool is None or _pool_size != n:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool, _pool_size = ProcessPoolExecutor(max_workers=n), n
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown)
+
+
+def _run_chunk(fn: Callable[[Any], Any], chunk: Sequence[Any]) -> List[Any]:
+    return [fn(x) for x in chunk]
+
+
+def map_chunked(fn: Callable[[Any], Any], items: Sequence[Any], n_workers: Optional[int] = None) -> List[Any]:
+    """Tương đương [fn(x) for x in items], chia khúc chạy song song khi đủ lớn. Lỗi trong fn được ném lại."""
+    items = list(items)
+    n = n_workers or workers()
+    min_items = int(os.getenv("CHUNK_MIN_ITEMS", "2000"))
+    if n <= 1 or len(items) < max(2, min_items):
+        return _run_chunk(fn, items)
+
+    # ~4 khúc / tiến trình: khúc nào văn bản dài hơn thì tiến trình khác lấy khúc tiếp, đỡ lệch tải
+    size = max(int(os.getenv("CHUNK_ITEMS", "500")), -(-len(items) // (n * 4)))
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    try:
+        pool = _get_pool(n)
+        out: List[Any] = []
+        for part in pool.map(_run_chunk, [fn] * len(chunks), chunks):
+            out.extend(part)
+        return out
+    except BrokenProcessPool as e:
+        # Tiến trình con chết (hết RAM...) -> bỏ pool, tính lại tại chỗ cho xong bước
+        print(f"[CHUNK][WARN] Pool tiến trình hỏng ({e}) -> chạy tuần tự {len(items)} mục")
+        shutdown()
+        return _run_chunk(fn, items)
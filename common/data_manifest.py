@@ -0,0 +1,91 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: MANIFEST PHIÊN BẢN DỮ LIỆU CHO WEB APP
+#
+# Pipeline phân tích xong -> publish_manifest() ghi output/analyzer/manifest.json:
+#   - mỗi ngành (slug, gid, loc): file *_analyzed.xlsx mới nhất + sha256 nội dung
+#   - "version": hash của toàn bộ danh sách trên (đổi khi có ngành nào đổi dữ liệu)
+# Ghi ra file tạm rồi os.replace -> web app không bao giờ đọc phải manifest ghi dở.
+#
+# web/app.py theo dõi manifest: version đổi thì nạp lại danh sách ngành và chỉ bỏ cache
+# của ngành có sha256 đổi. Không còn phải `systemctl restart fastapi` sau mỗi lần chạy.
+# ===========================================================
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from common import artifacts
+from common.stage_cache import file_sha256
+
+ROOT = Path(__file__).resolve().parents[1]
+ANALYZER_DIR = Path(os.getenv("ANALYZER_DIR", ROOT / "output" / "analyzer"))
+MANIFEST_NAME = "manifest.json"
+
+_publish_lock = threading.Lock()
+
+
+def manifest_path(analyzer_dir: Path = ANALYZER_DIR) -> Path:
+    return Path(analyzer_dir) / MANIFEST_NAME
+
+
+def read_manifest(path: Path) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) and "version" in data else None
+
+
+def build_manifest(analyzer_dir: Path = ANALYZER_DIR, previous: Optional[Dict] = None) -> Dict:
+    """
+    File mới nhất cho mỗi (slug, gid, loc) lấy từ catalog (common/artifacts.py), không quét thư mục.
+    sha256 lấy lại từ manifest cũ nếu file không đổi (cùng tên, size, mtime) để khỏi băm lại.
+    """
+    old = {e["file"]: e for e in (previous or {}).get("industries", {}).values()}
+    latest: Dict[str, Dict] = {}
+    for r in artifacts.catalog().latest("analyzed", analyzer_dir):
+        p = Path(r["path"])
+        dt = datetime.strptime(r["run_ts"], "%Y-%m-%d_%H%M%S")
+        latest[f"{r['slug']}|{r['gid']}|{r['loc']}"] = {
+            "slug": r["slug"], "gid": r["gid"], "loc": r["loc"],
+            "file": p.name, "dt": dt.isoformat(), "_path": p}
+
+    for e in latest.values():
+        p = e.pop("_path")
+        st = p.stat()
+        prev = old.get(e["file"])
+        if prev and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns:
+            e["sha256"] = prev["sha256"]
+        else:
+            e["sha256"] = file_sha256(p)
+        e["size"], e["mtime_ns"] = st.st_size, st.st_mtime_ns
+
+    h = hashlib.sha256()
+    for key in sorted(latest):
+        h.update(f"{key}\x1f{latest[key]['file']}\x1f{latest[key]['sha256']}\n".encode("utf-8"))
+    return {"version": h.hexdigest()[:16], "industries": latest}
+
+
+def publish_manifest(analyzer_dir: Path = ANALYZER_DIR, run_id: Optional[str] = None) -> Tuple[Dict, bool]:
+    """Ghi manifest mới (nguyên tử) nếu dữ liệu đổi. Trả về (manifest, có_đổi_không)."""
+    path = manifest_path(analyzer_dir)
+    with _publish_lock:
+        previous = read_manifest(path)
+        manifest = build_manifest(analyzer_dir, previous)
+        if previous and previous.get("version") == manifest["version"]:
+            return previous, False
+        manifest.update(published_at=round(time.time(), 3), run_id=run_id,
+                        previous_version=(previous or {}).get("version"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{MANIFEST_NAME}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    return manifest, True
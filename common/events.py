@@ -0,0 +1,88 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: SỰ KIỆN MÁY-ĐỌC-ĐƯỢC GIỮA CÁC BƯỚC PIPELINE
+#
+# Các script con (crawler/preprocess/analyzer) vẫn chỉ in ra stdout như cũ;
+# riêng các mốc quan trọng (xong 1 ngành, xong 1 file...) được in thêm 1 dòng
+#       @@EVENT {"event": "group_done", ...}
+# main.py đọc stdout theo từng dòng nên bắt được sự kiện NGAY khi xảy ra,
+# không cần chờ script con kết thúc.
+#
+# Tiến độ (done/total/rate) dùng ProgressReporter -> sự kiện "progress", tự giãn nhịp
+# (tối đa 1 dòng / PROGRESS_EVERY_S giây cho mỗi reporter) để không làm ngập log.
+# ===========================================================
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+EVENT_PREFIX = "@@EVENT "
+PROGRESS_EVERY_S = float(os.getenv("PROGRESS_EVERY_S", "5"))
+
+
+def emit_event(event: str, **fields) -> None:
+    """In 1 dòng sự kiện (JSON 1 dòng) ra stdout và flush ngay."""
+    payload = {"event": event, "ts": round(time.time(), 3), **fields}
+    sys.stdout.write(EVENT_PREFIX + json.dumps(payload, ensure_ascii=False, default=str) + "\n")
+    sys.stdout.flush()
+
+
+def parse_event(line: str) -> Optional[Dict]:
+    """Trả về dict sự kiện nếu `line` là dòng @@EVENT hợp lệ, ngược lại None."""
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    try:
+        payload = json.loads(line[len(EVENT_PREFIX):])
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) and "event" in payload else None
+
+
+class ProgressReporter:
+    """
+    Tiến độ của 1 pha (vd. scraper/detail của 1 ngành):
+
+        prog = ProgressReporter("scraper", "detail", total=len(links), group="Kế toán")
+        for ...:
+            prog.update(inc=1)
+        prog.finish()
+
+    Thread-safe; rate = đơn vị/giây tính từ lúc bắt đầu pha.
+    """
+
+    def __init__(self, stage: str, phase: str, total: Optional[int] = None, group: Optional[str] = None,
+                 group_id: Optional[int] = None, unit: str = "item", every_s: float = PROGRESS_EVERY_S):
+        self.stage = stage
+        self.phase = phase
+        self.total = total
+        self.group = group
+        self.group_id = group_id
+        self.unit = unit
+        self.every_s = every_s
+        self.done = 0
+        self._t0 = time.monotonic()
+        self._last_emit = 0.0
+        self._lock = threading.Lock()
+        self._emit(force=True)
+
+    def _emit(self, force: bool = False, final: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_emit < self.every_s:
+            return
+        self._last_emit = now
+        elapsed = now - self._t0
+        emit_event("progress", stage=self.stage, phase=self.phase, group=self.group, group_id=self.group_id,
+                   done=self.done, total=self.total, unit=self.unit, elapsed_s=round(elapsed, 1),
+                   rate=round(self.done / elapsed, 3) if elapsed > 0 else None, final=final)
+
+    def update(self, done: Optional[int] = None, inc: int = 0, total: Optional[int] = None) -> None:
+        with self._lock:
+            self.done = done if done is not None else self.done + inc
+            if total is not None:
+                self.total = total
+            self._emit()
+
+    def finish(self) -> None:
+        with self._lock:
+            self._emit(force=True, final=True)
@@ -0,0 +1,112 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: ĐỊNH DẠNG TRUNG GIAN GIỮA CÁC BƯỚC (crawl -> preprocess -> analyzer)
+#
+# Trước đây mọi bước bàn giao qua .xlsx (openpyxl đọc/ghi chậm 10–100 lần so với định dạng cột,
+# và mất kiểu dữ liệu: số thành chuỗi, NaN thành ô rỗng...). Giờ định dạng chuẩn là Parquet:
+#   - write_frame(df, path): ghi .parquet (nguyên tử: file tạm + os.replace); EXPORT_XLSX=1 thì ghi
+#     thêm bản .xlsx cùng tên cho người đọc (bản này không được bước sau đọc lại)
+#   - read_frame(path, columns=[...]): đọc .parquet chỉ các cột cần (column projection);
+#     vẫn đọc được .xlsx cũ (file từ trước khi đổi định dạng)
+#
+# INTERCHANGE_FORMAT=xlsx -> quay lại như cũ. Thiếu pyarrow -> tự dùng xlsx (có cảnh báo).
+# File kết quả của analyzer vẫn là .xlsx nhiều sheet: đó là báo cáo cho web/người đọc, không phải trung gian.
+# ===========================================================
+import os
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+INTERCHANGE_FORMAT = os.getenv("INTERCHANGE_FORMAT", "parquet").strip().lower()
+EXPORT_XLSX = os.getenv("EXPORT_XLSX", "0").strip().lower() in ("1", "true", "yes")
+
+_warned_no_arrow = False
+
+
+def interchange_suffix() -> str:
+    """Đuôi file trung gian hiện dùng: .parquet (mặc định) hoặc .xlsx."""
+    global _warned_no_arrow
+    if INTERCHANGE_FORMAT != "parquet":
+        return ".xlsx"
+    if pa is None:
+        if not _warned_no_arrow:
+            print("[FRAMES][WARN] Chưa cài pyarrow -> dùng .xlsx làm định dạng trung gian (pip install pyarrow)")
+            _warned_no_arrow = True
+        return ".xlsx"
+    return ".parquet"
+
+
+def arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cột object lẫn kiểu (vd. số + chuỗi + list) Arrow không suy ra được schema -> ép về chuỗi (giữ ô trống).
+    Cột thuần số/ngày/chuỗi giữ nguyên kiểu. Trả về bản sao nông nếu có cột phải đổi.
+    """
+    bad: List[str] = []
+    for c in df.columns:
+        if df[c].dtype != object:
+            continue
+        try:
+            pa.array(df[c], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+            bad.append(c)
+    if not bad:
+        return df
+    out = df.copy(deep=False)
+    for c in bad:
+        out[c] = out[c].map(lambda v: None if v is None or (isinstance(v, float) and pd.isna(v)) else str(v))
+    return out
+
+
+def write_frame(df: pd.DataFrame, path, export_xlsx: Optional[bool] = None) -> Path:
+    """Ghi df theo đuôi của `path` (.parquet / .xlsx). Trả về đường dẫn file chính đã ghi."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() != ".parquet":
+        df.to_excel(path, index=False)
+        return path
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        arrow_safe(df).to_parquet(tmp, index=False, engine="pyarrow")
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    if EXPORT_XLSX if export_xlsx is None else export_xlsx:
+        try:
+            df.to_excel(path.with_suffix(".xlsx"), index=False)
+        except Exception as e:
+            print(f"[FRAMES][WARN] Không xuất được bản Excel {path.with_suffix('.xlsx').name}: {e}")
+    return path
+
+
+def frame_columns(path) -> List[str]:
+    """Tên cột của file mà không đọc dữ liệu (parquet: chỉ đọc schema)."""
+    path = Path(path)
+    if path.suffix.lower() == ".parquet":
+        return list(pq.read_schema(path).names)
+    return list(pd.read_excel(path, nrows=0, engine="openpyxl").columns)
+
+
+def read_frame(path, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Đọc file trung gian. columns: chỉ đọc các cột này (cột không có trong file thì bỏ qua);
+    với Parquet chỉ các cột đó được giải nén -> nhanh + nhẹ RAM hơn nhiều so với đọc cả bảng.
+    """
+    path = Path(path)
+    wanted = list(dict.fromkeys(columns)) if columns is not None else None
+    if path.suffix.lower() == ".parquet":
+        if wanted is not None:
+            have = set(pq.read_schema(path).names)
+            wanted = [c for c in wanted if c in have]
+        return pd.read_parquet(path, columns=wanted, engine="pyarrow")
+    if wanted is not None:
+        keep = set(wanted)
+        return pd.read_excel(path, engine="openpyxl", usecols=lambda c: c in keep)
+    return pd.read_excel(path, engine="openpyxl")
@@ -0,0 +1,189 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: KHO TỶ GIÁ (-> VND) TRÊN ĐĨA, CÓ TTL + SNAPSHOT ĐÓNG GÓI SẴN
+#
+# Trước đây preprocess hỏi open.er-api.com / exchangerate.host mỗi lần chạy, từng loại tiền,
+# ngay giữa vòng quy đổi lương (timeout 15s × retry) -> mạng chập chờn là cả bước bị treo.
+# Giờ:
+#   - refresh_if_stale(): gọi 1 lần ở đầu tiến trình preprocess. Kho quá FX_TTL_S thì lấy lại
+#     TẤT CẢ mã SUPPORTED song song (mỗi request timeout FX_TIMEOUT_S), ghi nguyên tử
+#     output/cache/fx_rates.json. Lỗi mạng -> giữ tỷ giá cũ, FX_RETRY_AFTER_S sau mới thử lại.
+#   - rate_to_vnd(base): chỉ đọc bộ nhớ (kho trên đĩa, thiếu thì snapshot) -> không bao giờ chờ mạng.
+#   - common/fx_snapshot.json: tỷ giá "biết gần nhất" đi kèm mã nguồn cho máy chạy offline lần đầu
+#     (cập nhật: python common/fx_rates.py refresh --snapshot).
+# FX_OFFLINE=1: không gọi mạng, chỉ dùng kho/snapshot.
+# ===========================================================
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+FX_STORE = Path(os.getenv("FX_STORE", ROOT / "output" / "cache" / "fx_rates.json"))
+FX_SNAPSHOT = Path(__file__).resolve().with_name("fx_snapshot.json")
+FX_TTL_S = float(os.getenv("FX_TTL_S", str(24 * 3600)))
+FX_TIMEOUT_S = float(os.getenv("FX_TIMEOUT_S", "8"))
+FX_RETRY_AFTER_S = float(os.getenv("FX_RETRY_AFTER_S", "900"))
+FX_OFFLINE = os.getenv("FX_OFFLINE", "0").strip().lower() in ("1", "true", "yes")
+
+# Tập mã tiền tệ được hỗ trợ khi quy đổi lương.
+SUPPORTED = {"VND", "USD", "EUR", "GBP", "JPY", "CNY", "KRW", "SGD", "THB", "AUD", "CAD"}
+
+_lock = threading.Lock()
+_data: Optional[Dict] = None
+
+
+# ---------- nguồn tỷ giá ----------
+def _fetch_rate_open_erapi(base: str, timeout: float = FX_TIMEOUT_S) -> Optional[float]:
+    """Nguồn 1: open.er-api.com (free, ổn định). /v6/latest/{base} -> rates['VND']."""
+    r = requests.get(f"https://open.er-api.com/v6/latest/{base}", timeout=timeout)
+    r.raise_for_status()
+    data = r.json()
+    if data.get("result") == "success":
+        vnd = data.get("rates", {}).get("VND")
+        if isinstance(vnd, (int, float)) and vnd > 0:
+            return float(vnd)
+    return None
+
+
+def _fetch_rate_exchangerate_host(base: str, timeout: float = FX_TIMEOUT_S) -> Optional[float]:
+    """Nguồn 2 (fallback): exchangerate.host /latest?base={base}&symbols=VND."""
+    r = requests.get(f"https://api.exchangerate.host/latest?base={base}&symbols=VND", timeout=timeout)
+    r.raise_for_status()
+    vnd = r.json().get("rates", {}).get("VND")
+    if isinstance(vnd, (int, float)) and vnd > 0:
+        return float(vnd)
+    return None
+
+
+def _fetch_one(base: str, timeout: float) -> Optional[float]:
+    """Thử lần lượt 2 nguồn; lỗi thì trả None (không ném) để refresh gộp được kết quả các mã khác."""
+    for fetch in (_fetch_rate_open_erapi, _fetch_rate_exchangerate_host):
+        try:
+            rate = fetch(base, timeout)
+            if rate:
+                return rate
+        except Exception as e:
+            print(f"[FX][WARN] {fetch.__name__}({base}): {e}")
+    return None
+
+
+# ---------- kho trên đĩa ----------
+def _read_json(path: Path) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) and isinstance(data.get("rates"), dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: Path, data: Dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def load() -> Dict:
+    """Tỷ giá hiện dùng: kho trên đĩa, mã nào thiếu thì lấy từ snapshot đóng gói. Nạp 1 lần/tiến trình."""
+    global _data
+    with _lock:
+        if _data is None:
+            snap = _read_json(FX_SNAPSHOT) or {"rates": {}}
+            store = _read_json(FX_STORE)
+            if store:
+                _data = {**store, "rates": {**snap["rates"], **store["rates"]}}
+            else:
+                _data = {"rates": dict(snap["rates"]), "fetched_at": None,
+                         "source": f"snapshot {snap.get('as_of', '?')}"}
+        return _data
+
+
+def is_stale(data: Optional[Dict] = None) -> bool:
+    data = data or load()
+    fetched_at = data.get("fetched_at")
+    return not fetched_at or time.time() - fetched_at > FX_TTL_S
+
+
+def refresh(timeout: float = FX_TIMEOUT_S) -> Dict:
+    """Lấy lại tỷ giá mọi mã SUPPORTED song song rồi ghi kho. Mã lỗi giữ giá cũ."""
+    global _data
+    bases = sorted(SUPPORTED - {"VND"})
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(bases)) as ex:
+        got = {b: r for b, r in zip(bases, ex.map(lambda b: _fetch_one(b, timeout), bases)) if r}
+    missing = [b for b in bases if b not in got]
+
+    old = load()
+    data = {
+        "rates": {**old["rates"], **got},
+        "fetched_at": time.time() if got else old.get("fetched_at"),
+        "last_attempt": time.time(),
+        "source": "open.er-api.com / exchangerate.host" if got else old.get("source"),
+        "missing": missing,
+    }
+    try:
+        _write_json(FX_STORE, data)
+    except OSError as e:
+        print(f"[FX][WARN] Không ghi được {FX_STORE}: {e}")
+    with _lock:
+        _data = data
+    print(f"[FX] Làm mới tỷ giá: {len(got)}/{len(bases)} mã trong {time.perf_counter() - t0:.1f}s"
+          + (f" (thiếu: {', '.join(missing)} -> dùng giá cũ)" if missing else ""))
+    return data
+
+
+def refresh_if_stale() -> Dict:
+    """Gọi ở đầu bước (ngoài vòng dữ liệu). Kho còn hạn / offline / vừa thử lỗi gần đây -> không gọi mạng."""
+    data = load()
+    if FX_OFFLINE or not is_stale(data):
+        return data
+    last_attempt = data.get("last_attempt") or 0
+    if time.time() - last_attempt < FX_RETRY_AFTER_S:
+        return data
+    return refresh()
+
+
+def rate_to_vnd(base: str) -> float:
+    """1 BASE = ? VND, chỉ đọc bộ nhớ (không gọi mạng)."""
+    base = (base or "").upper().strip()
+    if base == "VND":
+        return 1.0
+    if base not in SUPPORTED:
+        raise ValueError(f"Unsupported currency: {base}")
+    rate = load()["rates"].get(base)
+    if not rate or rate <= 0:
+        raise RuntimeError(f"Không có tỷ giá cho {base} (kho {FX_STORE.name} và snapshot đều thiếu)")
+    return float(rate)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Kho tỷ giá -> VND")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("show")
+    p_ref = sub.add_parser("refresh")
+    p_ref.add_argument("--snapshot", action="store_true", help="ghi luôn vào common/fx_snapshot.json")
+    args = ap.parse_args()
+
+    if args.cmd == "refresh":
+        data = refresh()
+        if args.snapshot:
+            _write_json(FX_SNAPSHOT, {"as_of": time.strftime("%Y-%m-%d"), "source": data.get("source"),
+                                      "rates": {b: data["rates"][b] for b in sorted(data["rates"])}})
+            print(f"[FX] Đã cập nhật {FX_SNAPSHOT}")
+    data = load()
+    age = f"{(time.time() - data['fetched_at']) / 3600:.1f}h trước" if data.get("fetched_at") else "chưa lấy"
+    print(f"Nguồn: {data.get('source')} | lấy: {age} | hết hạn: {'có' if is_stale(data) else 'không'}")
+    for b in sorted(data["rates"]):
+        print(f"  {b}: {data['rates'][b]:,.4f} VND")
+
+
+if __name__ == "__main__":
+    main()
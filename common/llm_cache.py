@@ -0,0 +1,159 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: CACHE BỀN CHO KẾT QUẢ GỌI LLM (GPT) — SQLite
+#
+# Preprocess hỏi GPT loại tiền tệ cho các chuỗi lương regex không đoán được. Các chuỗi mập mờ này
+# lặp lại gần như y nguyên mỗi tuần -> lưu lại (task, model, khoá) -> kết quả, lần sau khỏi gọi.
+#   - khoá = văn bản đã chuẩn hoá (normalize_text), do bên gọi quyết định
+#   - chỉ lưu kết quả hợp lệ; lỗi mạng / trả lời rác không lưu -> lần sau hỏi lại
+#
+# Xem nhanh:
+#       python common/llm_cache.py stats
+#       python common/llm_cache.py clear [--task currency] [--model gpt-4o-mini]
+# ===========================================================
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+LLM_CACHE_DB = Path(os.getenv("LLM_CACHE_DB", ROOT / "output" / "cache" / "llm_cache.sqlite"))
+ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    task        TEXT NOT NULL,          -- vd. currency
+    model       TEXT NOT NULL,
+    key         TEXT NOT NULL,          -- văn bản đã chuẩn hoá
+    value       TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (task, model, key)
+);
+"""
+
+# SQLite giới hạn số tham số mỗi câu lệnh -> tra theo từng lô
+_LOOKUP_CHUNK = 500
+
+
+class LLMCache:
+    """Thread-safe: mỗi thao tác mở kết nối ngắn (WAL) dưới 1 lock, như run_ledger / artifacts."""
+
+    def __init__(self, db_path: Path = LLM_CACHE_DB):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        con = self._connect()
+        try:
+            con.executescript(_SCHEMA)
+        finally:
+            con.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    def get_many(self, task: str, model: str, keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, str] = {}
+        with self._lock:
+            con = self._connect()
+            try:
+                with con:
+                    for i in range(0, len(keys), _LOOKUP_CHUNK):
+                        chunk = keys[i:i + _LOOKUP_CHUNK]
+                        marks = ",".join("?" * len(chunk))
+                        params = (task, model, *chunk)
+                        for r in con.execute(f"SELECT key, value FROM llm_cache WHERE task=? AND model=? "
+                                             f"AND key IN ({marks})", params):
+                            found[r["key"]] = r["value"]
+                        con.execute(f"UPDATE llm_cache SET hits = hits + 1 WHERE task=? AND model=? "
+                                    f"AND key IN ({marks})", params)
+            finally:
+                con.close()
+        return found
+
+    def put_many(self, task: str, model: str, items: Dict[str, str]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            con = self._connect()
+            try:
+                with con:
+                    con.executemany("INSERT OR REPLACE INTO llm_cache(task, model, key, value, created_at) "
+                                    "VALUES (?,?,?,?,?)",
+                                    [(task, model, k, v, now) for k, v in items.items()])
+            finally:
+                con.close()
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            con = self._connect()
+            try:
+                return [dict(r) for r in con.execute(
+                    "SELECT task, model, COUNT(*) AS entries, SUM(hits) AS hits, "
+                    "MIN(created_at) AS oldest, MAX(created_at) AS newest "
+                    "FROM llm_cache GROUP BY task, model ORDER BY task, model")]
+            finally:
+                con.close()
+
+    def clear(self, task: Optional[str] = None, model: Optional[str] = None) -> int:
+        sql, params = "DELETE FROM llm_cache WHERE 1=1", []
+        if task:
+            sql, params = sql + " AND task=?", params + [task]
+        if model:
+            sql, params = sql + " AND model=?", params + [model]
+        with self._lock:
+            con = self._connect()
+            try:
+                with con:
+                    return con.execute(sql, params).rowcount
+            finally:
+                con.close()
+
+
+_default: Optional[LLMCache] = None
+
+
+def cache() -> Optional[LLMCache]:
+    """Cache mặc định; None nếu tắt (LLM_CACHE=0) hoặc không mở được DB (khi đó chỉ gọi thẳng LLM)."""
+    global _default
+    if not ENABLED:
+        return None
+    if _default is None:
+        try:
+            _default = LLMCache()
+        except (OSError, sqlite3.Error) as e:
+            print(f"[LLM_CACHE][WARN] Không mở được {LLM_CACHE_DB}: {e}")
+            return None
+    return _default
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Cache kết quả LLM")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats")
+    p_clear = sub.add_parser("clear")
+    p_clear.add_argument("--task")
+    p_clear.add_argument("--model")
+    args = ap.parse_args()
+
+    c = LLMCache()
+    if args.cmd == "stats":
+        rows = c.stats()
+        if not rows:
+            print("(cache trống)")
+        for r in rows:
+            print(f"{r['task']:<10} {r['model']:<20} {r['entries']:>7} mục  {r['hits'] or 0:>8} lượt trúng  "
+                  f"mới nhất {time.strftime('%Y-%m-%d %H:%M', time.localtime(r['newest']))}")
+    elif args.cmd == "clear":
+        print(f"Đã xoá {c.clear(args.task, args.model)} mục")
+
+
+if __name__ == "__main__":
+    main()
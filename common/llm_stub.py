@@ -0,0 +1,102 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: SERVER GIẢ LẬP OPENAI (chat.completions) ĐỂ CHẠY/THỬ PREPROCESS KHÔNG CẦN MẠNG
+#
+# Trả lời các prompt phân loại tiền tệ theo lô của preprocess (dòng "ITEMS_JSON: [...]")
+# bằng luật đơn giản (có $ -> USD, có ₫/đ/tr/triệu -> VND, ... mặc định VND), có thể giả độ trễ.
+#
+#   python common/llm_stub.py --port 8765 --latency 1.5
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python processor/preprocess.py
+#
+# Mỗi request in 1 dòng log (số chuỗi trong lô) -> đếm được số lần gọi thật.
+# ===========================================================
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_ITEMS_RE = re.compile(r"ITEMS_JSON:\s*(\[.*\])", re.DOTALL)
+
+# Thứ tự giống regex_currency_guess: ký hiệu đặc thù trước, $ sau, mặc định VND
+_RULES = [
+    ("EUR", ("€", "eur")), ("GBP", ("£", "gbp")), ("KRW", ("₩", "krw", "won")),
+    ("THB", ("฿", "thb", "baht")), ("USD", ("us$", "usd", "dollar")), ("SGD", ("s$", "sgd")), ("USD", ("$",)),
+    ("JPY", ("¥", "jpy", "yen")), ("CNY", ("cny", "rmb", "yuan", "元")),
+]
+
+
+def classify(text: str) -> str:
+    t = str(text).lower()
+    for code, toks in _RULES:
+        if any(tok in t for tok in toks):
+            return code
+    return "VND"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    latency_s = 0.0
+    n_requests = 0
+    _lock = threading.Lock()
+
+    def log_message(self, fmt, *args):   # log gọn, tự in trong do_POST
+        pass
+
+    def _send(self, code: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": {"message": "invalid json"}})
+
+        prompt = "\n".join(str(m.get("content", "")) for m in req.get("messages", []) if m.get("role") == "user")
+        m = _ITEMS_RE.search(prompt)
+        items = json.loads(m.group(1)) if m else []
+        answer = json.dumps({str(it["id"]): classify(it["text"]) for it in items}) if m else classify(prompt)
+
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        with self._lock:
+            _Handler.n_requests += 1
+            n = _Handler.n_requests
+        print(f"[LLM_STUB] #{n} model={req.get('model')} items={len(items)}", flush=True)
+        self._send(200, {
+            "id": f"stub-{n}", "object": "chat.completion", "created": int(time.time()),
+            "model": req.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": answer}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Server giả lập OpenAI chat.completions (phân loại tiền tệ)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.0, help="giả độ trễ mỗi request (giây)")
+    args = ap.parse_args()
+
+    _Handler.latency_s = args.latency
+    srv = ThreadingHTTPServer((args.host, args.port), _Handler)
+    print(f"[LLM_STUB] Nghe tại http://{args.host}:{args.port}/v1 (latency={args.latency}s)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        print(f"[LLM_STUB] Dừng sau {_Handler.n_requests} request")
+
+
+if __name__ == "__main__":
+    main()
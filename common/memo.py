@@ -0,0 +1,175 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: PARSE MỖI GIÁ TRỊ KHÁC NHAU ĐÚNG 1 LẦN (factorize -> parse -> trải ngược về dòng)
+#
+# Các cột luong, ngay_lam_viec, gio_lam_viec, do_tuoi, quy_mo_cong_ty, het_han... có rất ít giá trị
+# khác nhau so với số dòng (vài chục mẫu "Thương lượng", "T2 - T6", "08:00 - 17:00" lặp hàng nghìn lần),
+# nhưng các parser trong preprocess lại chạy theo từng dòng.
+#   - memo_apply(series, fn): pd.factorize cột, gọi fn 1 lần cho mỗi giá trị khác nhau (NaN gọi 1 lần),
+#     rồi trải kết quả về đúng vị trí từng dòng. Kết quả giống hệt series.apply(fn).
+#   - memo_apply_rows(df, cols, fn): như trên nhưng khoá là bộ giá trị của nhiều cột (fn nhận tuple).
+#   - parallel=True: các giá trị khác nhau chưa có kết quả được tính qua common/chunked.map_chunked
+#     (chia khúc, nhiều tiến trình); fn khi đó phải là hàm cấp module.
+#   - name="...": dùng thêm bảng nhớ lưu qua các lần chạy (output/cache/memo/<name>_<version>.pkl).
+#     version = hash mã nguồn parser (stage_cache.code_version) -> sửa parser thì bảng cũ tự bỏ.
+#     Bảng được ghi ở cuối mỗi file (save_all), gộp với bản trên đĩa rồi os.replace
+#     -> nhiều tiến trình preprocess chạy song song không ghi đè mất của nhau (tối đa mất vài mục).
+#
+# Chỉ nên đặt name cho parser thuần (cùng đầu vào -> cùng kết quả, không gọi mạng/GPT).
+# Tắt lưu đĩa bằng PARSE_MEMO_PERSIST=0 (vẫn nhớ trong lần chạy).
+# ===========================================================
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from common import chunked
+
+ROOT = Path(__file__).resolve().parents[1]
+MEMO_DIR = Path(os.getenv("PARSE_MEMO_DIR", ROOT / "output" / "cache" / "memo"))
+PERSIST = os.getenv("PARSE_MEMO_PERSIST", "1") != "0"
+# Giới hạn số mục mỗi bảng khi ghi đĩa (giữ các mục mới nhất) -> file pickle không phình mãi
+MAX_ENTRIES = int(os.getenv("PARSE_MEMO_MAX_ENTRIES", "200000"))
+
+_lock = threading.Lock()
+_memos: Dict[Tuple[str, str], "ParseMemo"] = {}
+
+
+class ParseMemo:
+    """Bảng {giá trị gốc: kết quả parse} của 1 parser ở 1 phiên bản mã nguồn."""
+
+    def __init__(self, name: str, version: str, persist: bool = PERSIST):
+        self.name = name
+        self.version = version
+        self.persist = persist
+        self.path = MEMO_DIR / f"{name}_{version[:16]}.pkl"
+        self.table: Dict[Hashable, Any] = self._load() if persist else {}
+        self._n_loaded = len(self.table)
+        self._dirty = False
+
+    def _load(self) -> Dict[Hashable, Any]:
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return {}
+
+    def get_or_compute(self, key: Hashable, fn: Callable[[Any], Any]) -> Any:
+        try:
+            return self.table[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Giá trị không băm được (list/dict trong ô) -> không nhớ
+            return fn(key)
+        val = fn(key)
+        self.table[key] = val
+        self._dirty = True
+        return val
+
+    def put(self, key: Hashable, val: Any) -> None:
+        try:
+            self.table[key] = val
+            self._dirty = True
+        except TypeError:
+            pass
+
+    def save(self) -> None:
+        if not (self.persist and self._dirty):
+            return
+        table = {**self._load(), **self.table}
+        if len(table) > MAX_ENTRIES:
+            table = dict(list(table.items())[-MAX_ENTRIES:])
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except (OSError, pickle.PicklingError, TypeError) as e:
+            print(f"[MEMO][WARN] Không ghi được bảng nhớ {self.path.name}: {e}")
+
+
+def get_memo(name: str, version: str) -> ParseMemo:
+    """Bảng nhớ dùng chung trong tiến trình cho (name, version)."""
+    with _lock:
+        memo = _memos.get((name, version))
+        if memo is None:
+            memo = _memos[(name, version)] = ParseMemo(name, version)
+        return memo
+
+
+def save_all() -> None:
+    """Ghi mọi bảng nhớ có mục mới xuống đĩa (gọi sau mỗi file)."""
+    with _lock:
+        memos = list(_memos.values())
+    for memo in memos:
+        memo.save()
+
+
+def _compute_parallel(uniques, fn: Callable[[Any], Any], memo: Optional[ParseMemo]) -> list:
+    """fn cho từng giá trị khác nhau, phần chưa có trong bảng nhớ chạy qua chunked.map_chunked."""
+    out = [None] * len(uniques)
+    todo = []
+    for i, u in enumerate(uniques):
+        try:
+            if memo is not None and u in memo.table:
+                out[i] = memo.table[u]
+                continue
+        except TypeError:
+            pass
+        todo.append(i)
+    computed = chunked.map_chunked(fn, [uniques[i] for i in todo])
+    for i, val in zip(todo, computed):
+        out[i] = val
+        if memo is not None:
+            memo.put(uniques[i], val)
+    return out
+
+
+def memo_apply(values: pd.Series, fn: Callable[[Any], Any],
+               name: Optional[str] = None, version: Optional[str] = None, parallel: bool = False) -> pd.Series:
+    """
+    Tương đương values.apply(fn) nhưng fn chỉ chạy 1 lần cho mỗi giá trị khác nhau.
+    name + version: dùng bảng nhớ lưu qua các lần chạy (chỉ cho parser thuần).
+    parallel: tính các giá trị khác nhau bằng nhiều tiến trình (common/chunked.py, fn cấp module).
+    Kết quả là tuple vẫn giữ nguyên tuple trong từng ô (như .apply), không bị tách cột.
+    """
+    try:
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    except TypeError:
+        # Ô chứa list/dict (không băm được) -> chạy từng dòng như cũ
+        return pd.Series([fn(v) for v in values], index=values.index, dtype=object)
+
+    memo = get_memo(name, version) if name and version else None
+    results = np.empty(len(uniques) + 1, dtype=object)
+    if parallel:
+        for i, val in enumerate(_compute_parallel(uniques, fn, memo)):
+            results[i] = val
+    else:
+        for i, u in enumerate(uniques):
+            results[i] = memo.get_or_compute(u, fn) if memo is not None else fn(u)
+    na_pos = np.flatnonzero(codes == -1)
+    if len(na_pos):
+        # NaN/None không vào bảng nhớ; gọi fn với đúng giá trị thiếu đầu tiên
+        results[-1] = fn(values.iloc[na_pos[0]])
+    return pd.Series(results[codes].tolist(), index=values.index)
+
+
+def memo_apply_rows(df: pd.DataFrame, cols: Iterable[str], fn: Callable[[tuple], Any],
+                    name: Optional[str] = None, version: Optional[str] = None,
+                    parallel: bool = False) -> pd.Series:
+    """
+    Như memo_apply nhưng khoá là bộ giá trị (tuple) của các cột `cols` trên mỗi dòng; fn nhận tuple đó.
+    Thay cho df.apply(f, axis=1) khi f chỉ đọc vài cột.
+    """
+    cols = list(cols)
+    keys = pd.Series(list(zip(*(df[c].tolist() for c in cols))), index=df.index, dtype=object)
+    if keys.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    return memo_apply(keys, fn, name=name, version=version, parallel=parallel)
@@ -0,0 +1,132 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: BẢNG TIẾN ĐỘ CỦA LẦN CHẠY HIỆN TẠI (orchestrator -> web)
+#
+# main.py đưa mọi sự kiện @@EVENT (progress / group_done / crawl_plan ...) của các
+# bước con vào ProgressBoard. Bảng gộp lại: bước nào đang chạy, tiến độ từng pha
+# từng ngành (done/total, tốc độ), tổng job đã bóc, throughput và ETA của cả lần crawl,
+# rồi ghi output/progress.json (ghi nguyên tử, giãn nhịp PROGRESS_WRITE_S).
+# web/app.py đọc file này và đẩy ra trình duyệt qua SSE (/api/progress/stream).
+# ===========================================================
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+PROGRESS_PATH = Path(os.getenv("PROGRESS_PATH", ROOT / "output" / "progress.json"))
+PROGRESS_WRITE_S = float(os.getenv("PROGRESS_WRITE_S", "2"))
+
+
+def read_progress(path: Path = PROGRESS_PATH) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _eta_s(done: Optional[float], total: Optional[float], rate: Optional[float]) -> Optional[float]:
+    if not total or done is None or not rate or rate <= 0:
+        return None
+    return round(max(0.0, (total - done) / rate), 1)
+
+
+class ProgressBoard:
+    def __init__(self, path: Path = PROGRESS_PATH, write_every_s: float = PROGRESS_WRITE_S):
+        self.path = Path(path)
+        self.write_every_s = write_every_s
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self._state: Dict = {}
+
+    # ---------- vòng đời lần chạy ----------
+    def start_run(self, run_id: Optional[str], mode: str) -> None:
+        with self._lock:
+            self._state = {
+                "run_id": run_id, "mode": mode, "status": "running", "started_at": time.time(),
+                "stages": {}, "phases": {},
+                "crawl": {"n_groups": None, "groups_done": 0, "groups_failed": 0,
+                          "expected_jobs": None, "jobs_done": 0, "started_at": None},
+            }
+            self._write(force=True)
+
+    def finish_run(self, status: str) -> None:
+        with self._lock:
+            if self._state:
+                self._state.update(status=status, ended_at=time.time())
+                self._write(force=True)
+
+    def stage(self, name: str, status: str) -> None:
+        with self._lock:
+            if not self._state:
+                return
+            st = self._state["stages"].setdefault(name, {"started_at": time.time()})
+            st["status"] = status
+            if status != "running":
+                st["ended_at"] = time.time()
+                st["duration_s"] = round(st["ended_at"] - st["started_at"], 1)
+            self._write(force=True)
+
+    # ---------- sự kiện từ bước con ----------
+    def on_event(self, evt: Dict) -> None:
+        kind = evt.get("event")
+        with self._lock:
+            if not self._state:
+                return
+            crawl = self._state["crawl"]
+            if kind == "crawl_plan":
+                crawl.update(n_groups=evt.get("n_groups"), expected_jobs=evt.get("expected_jobs"),
+                             started_at=crawl["started_at"] or time.time())
+            elif kind == "group_done":
+                crawl["groups_done"] += 1
+            elif kind == "group_failed":
+                crawl["groups_failed"] += 1
+            elif kind == "progress":
+                key = "/".join(str(x) for x in (evt.get("stage"), evt.get("phase"), evt.get("group_id"))
+                               if x is not None)
+                ph = {k: evt.get(k) for k in ("stage", "phase", "group", "group_id", "done", "total",
+                                               "unit", "rate", "elapsed_s", "final")}
+                ph["eta_s"] = None if evt.get("final") else _eta_s(ph["done"], ph["total"], ph["rate"])
+                ph["updated_at"] = evt.get("ts") or time.time()
+                self._state["phases"][key] = ph
+                if evt.get("stage") == "scraper" and evt.get("phase") == "detail":
+                    crawl["started_at"] = crawl["started_at"] or time.time()
+                    crawl["jobs_done"] = sum(p.get("done") or 0 for k, p in self._state["phases"].items()
+                                             if k.startswith("scraper/detail"))
+            else:
+                return
+            self._refresh_crawl_eta()
+            self._write(force=kind != "progress")
+
+    def _refresh_crawl_eta(self) -> None:
+        crawl = self._state["crawl"]
+        elapsed = time.time() - crawl["started_at"] if crawl["started_at"] else 0
+        rate = crawl["jobs_done"] / elapsed if elapsed > 0 else None
+        crawl["jobs_per_min"] = round(rate * 60, 1) if rate else None
+        crawl["eta_s"] = _eta_s(crawl["jobs_done"], crawl["expected_jobs"], rate)
+        if crawl["eta_s"] is None and crawl["n_groups"]:
+            # Không biết tổng job: ước lượng theo số ngành đã xong
+            done = crawl["groups_done"] + crawl["groups_failed"]
+            crawl["eta_s"] = _eta_s(done, crawl["n_groups"], done / elapsed if elapsed > 0 else None)
+
+    # ---------- ghi file ----------
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return json.loads(json.dumps(self._state, default=str))
+
+    def _write(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_write < self.write_every_s:
+            return
+        self._last_write = now
+        self._state["updated_at"] = time.time()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, ensure_ascii=False, default=str)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[PROGRESS] Không ghi được {self.path}: {e}")
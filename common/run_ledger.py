@@ -0,0 +1,291 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: SỔ CÁI (LEDGER) CÁC LẦN CHẠY PIPELINE — SQLite
+#
+# Mỗi lần pipeline chạy = 1 dòng `runs`; mỗi bước (scraper, preprocess, analyzer)
+# và mỗi ngành crawl = 1 dòng `stage_runs` với: giờ bắt đầu/kết thúc, số dòng vào/ra,
+# RSS đỉnh, trạng thái. Thay cho việc lục từng file logs/*.log.
+#
+# Báo cáo hồi quy hiệu năng (chạy tay hoặc sau job hàng tuần):
+#       python main.py report [--baseline 5] [--threshold 20]
+# -> so lần chạy mới nhất với trung vị N lần trước, đánh dấu bước chậm hơn > X%.
+#
+# Ledger cũng là trạng thái bền để TIẾP TỤC lần chạy dở: completed_stages() cho biết
+# bước/ngành nào đã xong (kèm file kết quả ở cột `output`). Mỗi lần chạy ghi host + PID của tiến trình
+# đang giữ nó: resume_run() từ chối lần chạy còn 'running' mà tiến trình chủ vẫn sống
+# (vd. `main.py retry` trong lúc orchestrator đang chạy chính lần đó).
+# ===========================================================
+import os
+import socket
+import sqlite3
+import statistics
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+LEDGER_DB = Path(os.getenv("RUN_LEDGER_DB", ROOT / "output" / "telemetry" / "run_ledger.sqlite"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    started_at  REAL NOT NULL,
+    ended_at    REAL,
+    status      TEXT NOT NULL,          -- running | ok | partial (có ngành lỗi) | failed
+    mode        TEXT,
+    host        TEXT,
+    error       TEXT,
+    pid         INTEGER,                -- tiến trình đang giữ lần chạy (start_run / resume_run)
+    claimed_at  REAL                    -- lúc tiến trình đó nhận lần chạy (chống PID bị tái sử dụng)
+);
+CREATE TABLE IF NOT EXISTS stage_runs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id      TEXT NOT NULL REFERENCES runs(run_id),
+    stage       TEXT NOT NULL,          -- scraper | crawl_group | preprocess | analyzer
+    name        TEXT NOT NULL,          -- tên tác vụ, vd. preprocess_g5
+    group_id    INTEGER,
+    started_at  REAL NOT NULL,
+    ended_at    REAL,
+    duration_s  REAL,
+    rows_in     INTEGER,
+    rows_out    INTEGER,
+    peak_rss_mb REAL,
+    status      TEXT NOT NULL,          -- running | ok | failed | cached | interrupted
+    error       TEXT,
+    output      TEXT                    -- file kết quả chính (file chi tiết / file preprocess)
+);
+CREATE INDEX IF NOT EXISTS ix_stage_runs_run ON stage_runs(run_id);
+CREATE INDEX IF NOT EXISTS ix_stage_runs_name ON stage_runs(name, status);
+"""
+
+
+class RunInProgressError(RuntimeError):
+    """Lần chạy cần tiếp tục vẫn đang được 1 tiến trình khác chạy."""
+
+
+def _pid_alive(pid: int, since: Optional[float]) -> bool:
+    """PID còn sống và đúng là tiến trình đã nhận lần chạy (tạo trước claimed_at, không phải PID tái sử dụng)."""
+    try:
+        import psutil
+        try:
+            proc = psutil.Process(pid)
+            return since is None or proc.create_time() <= since + 1.0
+        except psutil.NoSuchProcess:
+            return False
+        except psutil.AccessDenied:
+            return True
+    except ImportError:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+
+def _live_owner(run: Dict) -> Optional[str]:
+    """Mô tả tiến trình đang giữ lần chạy nếu (có thể) còn sống; None nếu đã chết / không rõ chủ trên máy này."""
+    host, pid = run.get("host"), run.get("pid")
+    if host and host != socket.gethostname():
+        return f"host {host}, pid {pid}"   # không kiểm tra được tiến trình ở máy khác
+    if not pid or pid == os.getpid():
+        return None                        # bản ghi cũ chưa có PID / chính tiến trình này
+    return f"pid {pid}" if _pid_alive(int(pid), run.get("claimed_at")) else None
+
+
+class RunLedger:
+    """
+    Ghi/đọc ledger. Thread-safe: mỗi thao tác mở kết nối ngắn (WAL) dưới 1 lock,
+    dùng được từ các luồng stage của chế độ pipelined.
+    """
+
+    def __init__(self, db_path: Path = LEDGER_DB):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        con = self._connect()
+        try:
+            con.executescript(_SCHEMA)
+            cols = {r["name"] for r in con.execute("PRAGMA table_info(stage_runs)")}
+            if "output" not in cols:   # DB tạo từ phiên bản cũ
+                con.execute("ALTER TABLE stage_runs ADD COLUMN output TEXT")
+                con.commit()
+            run_cols = {r["name"] for r in con.execute("PRAGMA table_info(runs)")}
+            for col, typ in (("pid", "INTEGER"), ("claimed_at", "REAL")):
+                if col not in run_cols:
+                    con.execute(f"ALTER TABLE runs ADD COLUMN {col} {typ}")
+            con.commit()
+        finally:
+            con.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    def _exec(self, sql: str, params=()) -> int:
+        """Chạy 1 lệnh ghi (tự commit). Trả về lastrowid."""
+        with self._lock:
+            con = self._connect()
+            try:
+                with con:
+                    return con.execute(sql, params).lastrowid
+            finally:
+                con.close()
+
+    def _query(self, sql: str, params=()) -> List[Dict]:
+        with self._lock:
+            con = self._connect()
+            try:
+                return [dict(r) for r in con.execute(sql, params).fetchall()]
+            finally:
+                con.close()
+
+    # ---------- ghi ----------
+    def start_run(self, mode: str = "", run_id: Optional[str] = None) -> str:
+        run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+        now = time.time()
+        self._exec("INSERT OR REPLACE INTO runs(run_id, started_at, status, mode, host, pid, claimed_at) "
+                   "VALUES (?,?,?,?,?,?,?)", (run_id, now, "running", mode, socket.gethostname(), os.getpid(), now))
+        return run_id
+
+    def resume_run(self, run_id: str, force: bool = False) -> None:
+        """
+        Mở lại lần chạy dở: bước nào còn 'running' (tiến trình cũ đã chết) -> 'interrupted'.
+        Lần chạy còn 'running' mà tiến trình chủ còn sống (hoặc ở host khác, không kiểm tra được)
+        -> RunInProgressError, không đụng gì tới ledger. force=True bỏ qua kiểm tra.
+        Kiểm tra + nhận quyền trong 1 transaction -> 2 tiến trình không cùng tiếp tục 1 lần chạy.
+        """
+        with self._lock:
+            con = self._connect()
+            try:
+                con.execute("BEGIN IMMEDIATE")
+                row = con.execute("SELECT * FROM runs WHERE run_id=?", (run_id,)).fetchone()
+                if row is not None and row["status"] == "running" and not force:
+                    owner = _live_owner(dict(row))
+                    if owner:
+                        con.rollback()
+                        raise RunInProgressError(f"Lần chạy {run_id} đang chạy ({owner}), không tiếp tục song song")
+                now = time.time()
+                con.execute("UPDATE stage_runs SET status='interrupted', ended_at=COALESCE(ended_at, ?) "
+                            "WHERE run_id=? AND status='running'", (now, run_id))
+                con.execute("UPDATE runs SET status='running', ended_at=NULL, error=NULL, host=?, pid=?, "
+                            "claimed_at=? WHERE run_id=?", (socket.gethostname(), os.getpid(), now, run_id))
+                con.commit()
+            finally:
+                con.close()
+
+    def finish_run(self, run_id: str, status: str = "ok", error: Optional[str] = None) -> None:
+        self._exec("UPDATE runs SET ended_at=?, status=?, error=? WHERE run_id=?",
+                   (time.time(), status, error, run_id))
+
+    def start_stage(self, run_id: str, stage: str, name: str, group_id: Optional[int] = None,
+                    rows_in: Optional[int] = None) -> int:
+        return self._exec("INSERT INTO stage_runs(run_id, stage, name, group_id, started_at, rows_in, status) "
+                          "VALUES (?,?,?,?,?,?,?)", (run_id, stage, name, group_id, time.time(), rows_in, "running"))
+
+    def finish_stage(self, stage_run_id: int, status: str = "ok", rows_in: Optional[int] = None,
+                     rows_out: Optional[int] = None, peak_rss_mb: Optional[float] = None,
+                     error: Optional[str] = None, output: Optional[str] = None) -> None:
+        now = time.time()
+        self._exec("UPDATE stage_runs SET ended_at=?, duration_s=ROUND(? - started_at, 3), status=?, "
+                   "rows_in=COALESCE(?, rows_in), rows_out=?, peak_rss_mb=?, error=?, output=? WHERE id=?",
+                   (now, now, status, rows_in, rows_out,
+                    round(peak_rss_mb, 1) if peak_rss_mb else None, error, output, stage_run_id))
+
+    def record_stage(self, run_id: str, stage: str, name: str, started_at: float, ended_at: float,
+                     status: str = "ok", group_id: Optional[int] = None, rows_in: Optional[int] = None,
+                     rows_out: Optional[int] = None, peak_rss_mb: Optional[float] = None,
+                     error: Optional[str] = None, output: Optional[str] = None) -> None:
+        """Ghi 1 bước đã xong (biết sẵn giờ bắt đầu/kết thúc), vd. 1 ngành crawl từ sự kiện group_done."""
+        self._exec("INSERT INTO stage_runs(run_id, stage, name, group_id, started_at, ended_at, duration_s, "
+                   "rows_in, rows_out, peak_rss_mb, status, error, output) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                   (run_id, stage, name, group_id, started_at, ended_at, round(ended_at - started_at, 3),
+                    rows_in, rows_out, peak_rss_mb, status, error, output))
+
+    # ---------- đọc ----------
+    def runs(self, limit: int = 20, status: Optional[str] = None) -> List[Dict]:
+        if status:
+            return self._query("SELECT * FROM runs WHERE status=? ORDER BY started_at DESC LIMIT ?", (status, limit))
+        return self._query("SELECT * FROM runs ORDER BY started_at DESC LIMIT ?", (limit,))
+
+    def stages(self, run_id: str) -> List[Dict]:
+        return self._query("SELECT * FROM stage_runs WHERE run_id=? ORDER BY started_at", (run_id,))
+
+    def completed_stages(self, run_id: str) -> Dict[str, Dict]:
+        """name -> bản ghi mới nhất đã xong (ok/cached) của lần chạy; dùng để bỏ qua khi tiếp tục."""
+        done: Dict[str, Dict] = {}
+        for r in self._query("SELECT * FROM stage_runs WHERE run_id=? AND status IN ('ok','cached') "
+                             "ORDER BY started_at", (run_id,)):
+            done[r["name"]] = r
+        return done
+
+    def failed_groups(self, run_id: str) -> List[int]:
+        """group_id có bước (crawl/preprocess/analyze) lỗi hoặc dở mà chưa có lần thử nào thành công."""
+        done = self.completed_stages(run_id)
+        gids = set()
+        for r in self._query("SELECT name, group_id FROM stage_runs WHERE run_id=? AND group_id IS NOT NULL "
+                             "AND status IN ('failed','interrupted','running')", (run_id,)):
+            if r["name"] not in done:
+                gids.add(int(r["group_id"]))
+        return sorted(gids)
+
+    # ---------- báo cáo hồi quy ----------
+    def regression_report(self, baseline_runs: int = 5, threshold_pct: float = 20.0) -> Dict:
+        """
+        So thời gian từng bước (theo `name`, chỉ bước status=ok) của lần chạy mới nhất đã kết thúc
+        với trung vị của `baseline_runs` lần chạy trước đó. Bước chậm hơn > threshold_pct% bị đánh dấu.
+        """
+        finished = self._query("SELECT * FROM runs WHERE status IN ('ok','partial','failed') ORDER BY started_at DESC LIMIT ?",
+                               (baseline_runs + 1,))
+        if not finished:
+            return {"latest": None, "baseline_runs": [], "stages": [], "regressions": []}
+        latest, baseline = finished[0], finished[1:]
+        base_ids = [r["run_id"] for r in baseline]
+        history: Dict[str, List[float]] = {}
+        if base_ids:
+            marks = ",".join("?" * len(base_ids))
+            for r in self._query(f"SELECT name, duration_s FROM stage_runs WHERE status='ok' "
+                                 f"AND duration_s IS NOT NULL AND run_id IN ({marks})", base_ids):
+                history.setdefault(r["name"], []).append(r["duration_s"])
+
+        rows = []
+        for st in self.stages(latest["run_id"]):
+            base = history.get(st["name"])
+            median = statistics.median(base) if base else None
+            delta = ((st["duration_s"] - median) / median * 100.0
+                     if median and st["duration_s"] is not None else None)
+            rows.append({
+                "stage": st["stage"], "name": st["name"], "status": st["status"],
+                "duration_s": st["duration_s"], "baseline_median_s": median, "baseline_n": len(base or []),
+                "delta_pct": round(delta, 1) if delta is not None else None,
+                "rows_in": st["rows_in"], "rows_out": st["rows_out"], "peak_rss_mb": st["peak_rss_mb"],
+                "regression": bool(delta is not None and delta > threshold_pct and st["status"] == "ok"),
+            })
+        return {"latest": latest, "baseline_runs": base_ids, "threshold_pct": threshold_pct,
+                "stages": rows, "regressions": [r for r in rows if r["regression"]]}
+
+
+def format_report(rep: Dict) -> str:
+    latest = rep.get("latest")
+    if not latest:
+        return "Ledger chưa có lần chạy nào đã kết thúc."
+    dur = (latest["ended_at"] or latest["started_at"]) - latest["started_at"]
+    lines = [f"Run {latest['run_id']} ({latest['status']}, {dur:.0f}s) so với trung vị "
+             f"{len(rep['baseline_runs'])} lần trước, ngưỡng +{rep['threshold_pct']:g}%",
+             f"{'BƯỚC':<28}{'TT':<8}{'THỜI GIAN':>10}{'BASELINE':>10}{'Δ%':>8}{'VÀO':>8}{'RA':>8}{'RSS MB':>8}"]
+
+    def _f(v, fmt):
+        return format(v, fmt) if v is not None else "-"
+
+    for r in rep["stages"]:
+        flag = "  ⚠️ CHẬM" if r["regression"] else ""
+        lines.append(f"{r['name'][:27]:<28}{r['status']:<8}{_f(r['duration_s'], '.1f'):>10}"
+                     f"{_f(r['baseline_median_s'], '.1f'):>10}{_f(r['delta_pct'], '+.1f'):>8}"
+                     f"{_f(r['rows_in'], 'd'):>8}{_f(r['rows_out'], 'd'):>8}{_f(r['peak_rss_mb'], '.0f'):>8}{flag}")
+    n = len(rep["regressions"])
+    lines.append(f"=> {n} bước chậm hơn ngưỡng." if n else "=> Không có hồi quy hiệu năng.")
+    return "\n".join(lines)
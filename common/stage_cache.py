@@ -0,0 +1,98 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: CACHE THEO NỘI DUNG CHO TỪNG BƯỚC (preprocess / analyzer)
+#
+# Khoá cache = hash nội dung đầu vào + "phiên bản" của bước (hash mã nguồn + cấu hình).
+# - Đầu vào giống hệt từng byte      -> khoá "bytes:<sha256 file>"
+#   (không có khoá "cùng tập dòng, khác ID/thứ tự": kết quả cũ mang ID + thứ tự dòng của lần crawl trước)
+# - Phiên bản phải gồm MỌI file mã nguồn/dữ liệu ảnh hưởng tới kết quả (file của bước + các module
+#   common.* nó dùng), nếu không sửa module dùng chung vẫn trả kết quả cũ qua hard link.
+# Trúng cache: không chạy lại bước, chỉ "link" file kết quả cũ sang tên file mới
+# (hard link, không được thì copy). Chạy lại sau khi lỗi giữa chừng cũng rẻ:
+# các file đã xong sẽ trúng cache.
+#
+# Mỗi mục cache là 1 file JSON nhỏ: output/cache/<stage>/<version>/<hash khoá>.json
+# -> nhiều tiến trình (chế độ pipelined) ghi song song không cần khoá.
+# Tắt bằng STAGE_CACHE=0.
+# ===========================================================
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = Path(os.getenv("STAGE_CACHE_DIR", ROOT / "output" / "cache"))
+ENABLED = os.getenv("STAGE_CACHE", "1") != "0"
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def code_version(*files: Path, config: Optional[Dict] = None) -> str:
+    """Phiên bản bước = hash mã nguồn các file liên quan + cấu hình ảnh hưởng tới kết quả."""
+    h = hashlib.sha256()
+    for fp in files:
+        h.update(Path(fp).read_bytes())
+    h.update(json.dumps(config or {}, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def link_forward(src: Path, dst: Path) -> Path:
+    """Đưa kết quả cũ sang tên mới: hard link (không tốn dung lượng), lỗi thì copy."""
+    src, dst = Path(src), Path(dst)
+    if src.resolve() == dst.resolve():
+        return dst
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+class StageCache:
+    def __init__(self, stage: str, version: str, root: Path = CACHE_DIR):
+        self.stage = stage
+        self.version = version
+        self.dir = Path(root) / stage / version
+
+    def _entry_path(self, key: str) -> Path:
+        return self.dir / (hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def lookup(self, *keys: str) -> Optional[List[Path]]:
+        """Trả về danh sách file kết quả của khoá đầu tiên trúng (mọi file còn tồn tại), ngược lại None."""
+        if not ENABLED:
+            return None
+        for key in keys:
+            entry = self._entry_path(key)
+            if not entry.exists():
+                continue
+            try:
+                outputs = [Path(p) for p in json.loads(entry.read_text(encoding="utf-8"))["outputs"]]
+            except Exception:
+                continue
+            if outputs and all(p.exists() for p in outputs):
+                print(f"[CACHE][{self.stage}] HIT {key.split(':', 1)[0]} -> {outputs[0].name}")
+                return outputs
+        return None
+
+    def store(self, keys: Iterable[str], outputs: Iterable[Path]) -> None:
+        if not ENABLED:
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        payload = {"stage": self.stage, "version": self.version, "created": time.time(),
+                   "outputs": [str(Path(p).resolve()) for p in outputs]}
+        for key in keys:
+            entry = self._entry_path(key)
+            tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(dict(payload, key=key), ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, entry)   # ghi nguyên tử
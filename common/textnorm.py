@@ -0,0 +1,87 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: BỎ DẤU TIẾNG VIỆT NHANH — DÙNG CHUNG CHO CRAWLER / PREPROCESS / ANALYZER / WEB
+#
+# Trước đây mỗi nơi tự viết 1 bản: unicodedata.normalize("NFD") rồi lặp từng ký tự gọi
+# unicodedata.category(ch) != "Mn" bằng Python (chậm), và chỉ vài bản nhớ đổi 'đ/Đ' -> 'd/D'.
+# Ở đây bảng str.translate được dựng 1 lần: mỗi ký tự có dấu -> ký tự gốc (đúng như NFD + bỏ Mn),
+# dấu rời (combining) -> xoá, và 'đ/Đ' -> 'd/D'. translate chạy trong C -> nhanh hơn nhiều lần.
+#   - fold(s)                 : bỏ dấu, giữ hoa/thường
+#   - strip_accents(s)        : như fold, đầu vào không phải str -> ""
+#   - no_accent_lower(s)      : bỏ dấu + lower (+ strip); None/NaN -> ""; chuỗi ngắn dùng LRU cache
+#   - fold_series(series)     : bản vector cho cột pandas
+# ===========================================================
+import os
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Optional
+
+TEXTNORM_CACHE = int(os.getenv("TEXTNORM_CACHE", "65536"))
+# Chỉ nhớ chuỗi ngắn (tên ngành, nhãn, token...): mô tả công việc dài hiếm lặp lại, nhớ chỉ tốn RAM
+CACHE_MAX_LEN = 128
+
+_TABLE: Optional[Dict[int, Optional[str]]] = None
+
+
+def _build_table() -> Dict[int, Optional[str]]:
+    """Bảng translate cho toàn bộ BMP: kết quả của từng ký tự giống hệt NFD + bỏ ký tự Mn."""
+    table: Dict[int, Optional[str]] = {}
+    for cp in range(0x80, 0x10000):
+        if 0xD800 <= cp <= 0xDFFF:   # surrogate
+            continue
+        ch = chr(cp)
+        if unicodedata.category(ch) == "Mn":
+            table[cp] = None
+            continue
+        folded = "".join(c for c in unicodedata.normalize("NFD", ch) if unicodedata.category(c) != "Mn")
+        if folded != ch:
+            table[cp] = folded
+    # NFD không tách được 'đ/Đ' (là chữ riêng, không phải d + dấu)
+    table[ord("đ")] = "d"
+    table[ord("Đ")] = "D"
+    return table
+
+
+def table() -> Dict[int, Optional[str]]:
+    global _TABLE
+    if _TABLE is None:
+        _TABLE = _build_table()
+    return _TABLE
+
+
+def fold(s: str) -> str:
+    """Bỏ dấu tiếng Việt (kể cả đ/Đ), giữ nguyên hoa/thường và khoảng trắng."""
+    return s if s.isascii() else s.translate(table())
+
+
+def strip_accents(s) -> str:
+    """Như fold; đầu vào không phải str -> ""."""
+    if not isinstance(s, str):
+        return ""
+    return fold(s)
+
+
+@lru_cache(maxsize=TEXTNORM_CACHE)
+def _fold_lower_cached(s: str) -> str:
+    return fold(s.lower())
+
+
+def _is_missing(s) -> bool:
+    return s is None or (isinstance(s, float) and s != s)
+
+
+def no_accent_lower(s, strip: bool = True) -> str:
+    """Bỏ dấu + lower (+ strip 2 đầu). None/NaN -> ""; giá trị khác ép str."""
+    if _is_missing(s):
+        return ""
+    s = str(s)
+    out = _fold_lower_cached(s) if len(s) <= CACHE_MAX_LEN else fold(s.lower())
+    return out.strip() if strip else out
+
+
+def fold_series(series, lower: bool = True, strip: bool = True):
+    """Bản vector cho pandas Series: NaN/None -> "", ép str, bỏ dấu (+ lower, + strip)."""
+    s = series.fillna("").astype(str)
+    if lower:
+        s = s.str.lower()
+    s = s.str.translate(table())
+    return s.str.strip() if strip else s
@@ -0,0 +1,218 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: TIẾN TRÌNH WORKER "ẤM" CHO CÁC BƯỚC PREPROCESS / ANALYZER
+#
+# run_script() mỗi bước sinh 1 interpreter mới -> import lại pandas/numpy/openpyxl,
+# analyzer còn import torch + sentence-transformers và nạp model embedding
+# (vài giây + vài trăm MB mỗi lần). WarmWorker giữ 1 tiến trình con sống lâu:
+# - nạp sẵn module + model 1 lần, nhận job qua Queue;
+# - mỗi job ghi log riêng (logs/<name>_<ts>.log) + in ra terminal như run_script;
+# - dòng @@EVENT trong lúc chạy được chuyển về tiến trình cha (on_event);
+# - worker chết (segfault/OOM) hoặc quá hạn -> kill, khởi động worker mới, job báo lỗi.
+# ===========================================================
+import io
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from common.events import parse_event
+
+ROOT = Path(__file__).resolve().parents[1]
+LOG_DIR = ROOT / "logs"
+
+# stage -> (module, hàm main). main() của từng script đọc cấu hình từ biến môi trường như khi chạy độc lập.
+STAGES = {
+    "preprocess": ("processor.preprocess", "main"),
+    "analyzer": ("processor.analyzer", "main"),
+}
+
+
+class _Tee(io.TextIOBase):
+    """stdout của job: ghi file log + terminal, và đẩy dòng @@EVENT về tiến trình cha."""
+
+    def __init__(self, log_file, job_id: int, out_q):
+        self._log = log_file
+        self._job_id = job_id
+        self._out_q = out_q
+        self._buf = ""
+
+    def write(self, s: str) -> int:
+        sys.__stdout__.write(s)
+        self._log.write(s)
+        self._buf += s
+        while "\n" in self._buf:
+            line, self._buf = self._buf.split("\n", 1)
+            evt = parse_event(line + "\n")
+            if evt is not None:
+                self._out_q.put(("event", self._job_id, evt))
+        return len(s)
+
+    def flush(self) -> None:
+        sys.__stdout__.flush()
+        self._log.flush()
+
+
+def _worker_main(job_q, out_q, preload_model: bool) -> None:
+    """Vòng lặp của tiến trình con: nạp sẵn 1 lần, sau đó nhận job đến khi gặp None."""
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    t0 = time.monotonic()
+    import importlib
+
+    modules = {stage: importlib.import_module(mod) for stage, (mod, _) in STAGES.items()}
+    t_import = time.monotonic() - t0
+    t_model = 0.0
+    if preload_model:
+        t1 = time.monotonic()
+        try:
+            modules["analyzer"].get_embedder()
+        except Exception as e:
+            print(f"[WARM] Không nạp sẵn được model embedding: {e}")
+        t_model = time.monotonic() - t1
+    out_q.put(("ready", os.getpid(), {"import_s": round(t_import, 2), "model_s": round(t_model, 2)}))
+
+    while True:
+        job = job_q.get()
+        if job is None:
+            return
+        job_id, stage, name, env_extra = job["id"], job["stage"], job["name"], job.get("env") or {}
+        log_path = LOG_DIR / f"{name}_{datetime.now():%Y%m%d_%H%M%S}.log"
+        saved_env = {k: os.environ.get(k) for k in env_extra}
+        os.environ.update(env_extra)
+        ok, err = True, None
+        t_job = time.monotonic()
+        with open(log_path, "w", buffering=1, encoding="utf-8") as lf:
+            tee = _Tee(lf, job_id, out_q)
+            old_out, old_err = sys.stdout, sys.stderr
+            sys.stdout = sys.stderr = tee
+            try:
+                getattr(modules[stage], STAGES[stage][1])()
+            except SystemExit as e:
+                if e.code not in (None, 0):
+                    ok, err = False, f"exit {e.code}"
+            except Exception:
+                ok, err = False, traceback.format_exc(limit=5)
+                print(err)
+            finally:
+                sys.stdout, sys.stderr = old_out, old_err
+                for k, v in saved_env.items():
+                    if v is None:
+                        os.environ.pop(k, None)
+                    else:
+                        os.environ[k] = v
+        out_q.put(("done", job_id, {"ok": ok, "error": err, "elapsed_s": round(time.monotonic() - t_job, 2),
+                                    "log": str(log_path)}))
+
+
+class WarmWorker:
+    """
+    Phía orchestrator. Mỗi lúc chạy 1 job (các luồng gọi run() xếp hàng qua lock).
+
+        ww = WarmWorker(); ww.run("preprocess", "preprocess_g5", env_extra={...}, timeout=7200)
+    """
+
+    def __init__(self, preload_model: bool = True, log=print):
+        self.preload_model = preload_model
+        self._log = log
+        self._ctx = mp.get_context("spawn")   # không fork orchestrator (đang có thread scheduler)
+        self._lock = threading.Lock()
+        self._proc = None
+        self._job_q = None
+        self._out_q = None
+        self._next_id = 0
+        self.boot: Dict[str, float] = {}
+        self.jobs = 0
+        self.restarts = 0
+
+    # ---------- vòng đời tiến trình con ----------
+    def _start(self) -> None:
+        self._job_q = self._ctx.Queue()
+        self._out_q = self._ctx.Queue()
+        t0 = time.monotonic()
+        self._proc = self._ctx.Process(target=_worker_main, args=(self._job_q, self._out_q, self.preload_model),
+                                       name="warm-stage-worker", daemon=True)
+        self._proc.start()
+        while True:
+            try:
+                kind, pid, info = self._out_q.get(timeout=1.0)
+            except queue.Empty:
+                if not self._proc.is_alive():
+                    raise RuntimeError("Warm worker chết trong lúc khởi động")
+                continue
+            if kind == "ready":
+                self.boot = dict(info, total_s=round(time.monotonic() - t0, 2))
+                self._log(f"[WARM] Worker pid={pid} sẵn sàng: import {info['import_s']}s, "
+                          f"model {info['model_s']}s, tổng {self.boot['total_s']}s")
+                return
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._proc.pid if self._proc is not None and self._proc.is_alive() else None
+
+    def _kill(self) -> None:
+        if self._proc is not None and self._proc.is_alive():
+            self._proc.kill()
+            self._proc.join(timeout=5)
+        self._proc = None
+
+    def _restart(self, reason: str) -> None:
+        self._log(f"[WARM] Khởi động lại worker: {reason}")
+        self._kill()
+        self.restarts += 1
+        self._start()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._proc is not None and self._proc.is_alive():
+                self._job_q.put(None)
+                self._proc.join(timeout=10)
+            self._kill()
+
+    # ---------- chạy job ----------
+    def run(self, stage: str, name: str, env_extra: Optional[Dict[str, str]] = None,
+            on_event: Optional[Callable[[Dict], None]] = None, timeout: Optional[float] = None) -> Dict:
+        with self._lock:
+            if self._proc is None or not self._proc.is_alive():
+                if self._proc is not None:
+                    self.restarts += 1
+                self._start()
+            self._next_id += 1
+            job_id = self._next_id
+            self._job_q.put({"id": job_id, "stage": stage, "name": name, "env": dict(env_extra or {})})
+            deadline = time.monotonic() + timeout if timeout else None
+            while True:
+                try:
+                    kind, jid, info = self._out_q.get(timeout=1.0)
+                except queue.Empty:
+                    if not self._proc.is_alive():
+                        code = self._proc.exitcode
+                        self._restart(f"{name} làm worker chết (exitcode={code})")
+                        raise RuntimeError(f"{name} crashed the warm worker (exitcode={code})")
+                    if deadline and time.monotonic() > deadline:
+                        self._restart(f"{name} vượt {timeout:g}s")
+                        raise RuntimeError(f"{name} timed out after {timeout:g}s")
+                    continue
+                if jid != job_id:
+                    continue
+                if kind == "event" and on_event is not None:
+                    try:
+                        on_event(info)
+                    except Exception as e:
+                        self._log(f"[WARM] Lỗi xử lý sự kiện {info}: {e}")
+                elif kind == "done":
+                    self.jobs += 1
+                    if not info["ok"]:
+                        raise RuntimeError(f"{name} failed: {info['error']}. See log: {info['log']}")
+                    return info
+
+    def saved_startup_s(self) -> float:
+        """Ước tính thời gian khởi động tiết kiệm: mỗi job tránh được 1 lần import + nạp model (trừ lần boot thực tế)."""
+        boot = self.boot.get("total_s", 0.0)
+        return round(max(0.0, boot * (self.jobs - 1 - self.restarts)), 1)
@@ -0,0 +1,366 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: ĐIỀU KHIỂN MỨC SONG SONG THÍCH NGHI (AIMD)
+#
+# - Tăng cộng (Additive Increase): mỗi "vòng" (≈ limit request hoàn tất) mà
+#   p95 latency và tỉ lệ lỗi còn khoẻ -> limit += increase.
+# - Giảm nhân (Multiplicative Decrease): gặp timeout / HTTP 429 / trang CAPTCHA
+#   -> limit *= decrease ngay lập tức (mỗi "đợt" tín hiệu chỉ giảm 1 lần).
+# - Dùng chung cho pha listing và pha chi tiết (mỗi pha 1 controller riêng).
+# - run_lanes(): limit của controller quyết định SỐ LÀN THẬT đang chạy (mỗi làn = 1 Chrome / 1 luồng):
+#   limit tăng -> mở thêm làn, limit giảm -> làn thừa đóng sau khi xong việc đang làm.
+#   Trần cứng = max_limit của controller (CRAWL_MAX_CONCURRENCY bên scraper).
+# - SimulatedServer + simulate() kiểm chứng hành vi mà không cần mạng (tests/test_adaptive.py).
+# ===========================================================
+import math
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Các kết quả của 1 request mà controller hiểu
+OK = "ok"
+TIMEOUT = "timeout"
+THROTTLED = "throttled"   # HTTP 429 / "Too Many Requests"
+CAPTCHA = "captcha"
+ERROR = "error"           # lỗi khác: tính vào error rate nhưng không giảm ngay
+
+# Tín hiệu "nghẽn" -> giảm nhân ngay
+CONGESTION_OUTCOMES = (TIMEOUT, THROTTLED, CAPTCHA)
+
+_CAPTCHA_HINTS = ("captcha", "cf-challenge", "are you a robot", "xác minh bạn không phải")
+_THROTTLE_HINTS = ("too many requests", "429", "access denied", "rate limit")
+
+
+def classify_page(title: str = "", html: str = "") -> Optional[str]:
+    """Nhận diện trang chặn: trả về CAPTCHA / THROTTLED hoặc None nếu trông như trang bình thường."""
+    t = (title or "").lower()
+    h = (html or "")[:20000].lower()   # chỉ soi phần đầu trang, đủ để thấy trang chặn
+    if any(k in t or k in h for k in _CAPTCHA_HINTS):
+        return CAPTCHA
+    if any(k in t for k in _THROTTLE_HINTS) or "too many requests" in h:
+        return THROTTLED
+    return None
+
+
+def _p95(values: List[float]) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, math.ceil(0.95 * len(s)) - 1)]
+
+
+class _Slot:
+    """1 lượt giữ chỗ. Người gọi gán .outcome (mặc định OK) và có thể gán .latency_s để ghi đè đo thời gian."""
+
+    def __init__(self, controller: Optional["AIMDController"] = None, epoch: int = 0):
+        self.controller = controller
+        self.epoch = epoch
+        self.outcome = OK
+        self.latency_s: Optional[float] = None
+        self._t0 = 0.0
+
+    def __enter__(self):
+        if self.controller is not None:
+            self.epoch = self.controller.acquire()
+            self._t0 = self.controller.clock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.controller is None:
+            return False
+        if exc_type is not None:
+            # Selenium ném TimeoutException khi quá page_load_timeout
+            self.outcome = TIMEOUT if "timeout" in exc_type.__name__.lower() else ERROR
+        latency = self.latency_s if self.latency_s is not None else self.controller.clock() - self._t0
+        self.controller.release(latency, self.outcome, self.epoch)
+        return False  # không nuốt exception
+
+
+def gate(controller: Optional["AIMDController"]) -> _Slot:
+    """`with gate(ctrl) as slot:` — nếu ctrl=None thì là no-op (giữ nguyên hành vi cũ)."""
+    return controller.slot() if controller is not None else _Slot()
+
+
+class AIMDController:
+    """
+    Giới hạn số request đang bay (in-flight) và tự điều chỉnh giới hạn theo AIMD.
+    Thread-safe: nhiều worker cùng gọi acquire()/release().
+    share: số worker dùng chung controller -> mỗi worker chạy tối đa ceil(limit / share) làn (run_lanes).
+    """
+
+    def __init__(self,
+                 name: str,
+                 initial: int = 1,
+                 min_limit: int = 1,
+                 max_limit: int = 4,
+                 increase: float = 1.0,
+                 decrease: float = 0.5,
+                 window: int = 20,
+                 p95_target_s: float = 20.0,
+                 max_error_rate: float = 0.1,
+                 share: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.share = max(1, int(share))
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.increase = increase
+        self.decrease = decrease
+        self.p95_target_s = p95_target_s
+        self.max_error_rate = max_error_rate
+        self.clock = clock
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._samples: deque = deque(maxlen=max(1, window))   # (latency_s, outcome)
+        self._since_adjust = 0
+        self._epoch = 0               # tăng mỗi lần giảm; request bắt đầu trước lần giảm không được giảm thêm
+        self._t_start = clock()
+        self.peak_limit = self.limit
+        self.counts: Counter = Counter()
+        self.history: List[Tuple[float, float, str]] = []   # (giây từ lúc khởi tạo, limit mới, lý do)
+
+    # ---------- giữ chỗ ----------
+    def slot(self) -> _Slot:
+        return _Slot(self)
+
+    def acquire(self) -> int:
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+            return self._epoch
+
+    def try_acquire(self) -> Optional[int]:
+        """Như acquire() nhưng không chờ: trả về None nếu đã hết slot (dùng cho vòng lặp đa tab 1 luồng)."""
+        with self._cond:
+            if self._in_flight >= int(self.limit):
+                return None
+            self._in_flight += 1
+            return self._epoch
+
+    def release(self, latency_s: float, outcome: str = OK, epoch: Optional[int] = None) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self.counts[outcome] += 1
+            # Request bắt đầu trước lần giảm gần nhất phản ánh mức tải cũ -> không đưa vào cửa sổ đo,
+            # và cũng không giảm thêm lần nữa (mỗi đợt nghẽn chỉ giảm 1 lần)
+            if epoch is not None and epoch < self._epoch:
+                self._cond.notify_all()
+                return
+            self._samples.append((float(latency_s), outcome))
+            self._since_adjust += 1
+
+            if outcome in CONGESTION_OUTCOMES:
+                self._decrease(outcome)
+            elif self._since_adjust >= max(1, int(self.limit)):
+                self._evaluate_round()
+            self._cond.notify_all()
+
+    # ---------- điều chỉnh ----------
+    def _set_limit(self, new_limit: float, reason: str) -> None:
+        new_limit = min(max(new_limit, self.min_limit), self.max_limit)
+        self._since_adjust = 0
+        if new_limit == self.limit:
+            return
+        self.limit = new_limit
+        self.peak_limit = max(self.peak_limit, new_limit)
+        self.history.append((round(self.clock() - self._t_start, 3), new_limit, reason))
+        print(f"[AIMD][{self.name}] limit={int(new_limit)} ({reason})")
+
+    def _decrease(self, reason: str) -> None:
+        self._epoch += 1
+        self._samples.clear()   # cửa sổ cũ phản ánh mức tải cũ
+        self._set_limit(math.floor(self.limit * self.decrease), reason)
+
+    def _evaluate_round(self) -> None:
+        latencies = [lat for lat, _ in self._samples]
+        n_err = sum(1 for _, out in self._samples if out != OK)
+        err_rate = n_err / len(self._samples) if self._samples else 0.0
+        p95 = _p95(latencies)
+        if p95 is not None and p95 > self.p95_target_s:
+            self._decrease(f"p95={p95:.2f}s>{self.p95_target_s}s")
+        elif err_rate > self.max_error_rate:
+            self._decrease(f"error_rate={err_rate:.0%}")
+        else:
+            self._set_limit(self.limit + self.increase, "healthy")
+
+    # ---------- telemetry ----------
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def lanes(self) -> int:
+        """Số làn 1 worker được chạy lúc này = phần của worker trong limit (ít nhất 1)."""
+        return max(1, math.ceil(self.limit / self.share))
+
+    def max_lanes(self) -> int:
+        return max(1, math.ceil(self.max_limit / self.share))
+
+    def wait_change(self, timeout: float) -> None:
+        """Chờ tới khi có request hoàn tất (limit có thể đã đổi) hoặc hết timeout."""
+        with self._cond:
+            self._cond.wait(timeout)
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            latencies = [lat for lat, _ in self._samples]
+            n = len(self._samples)
+            return {
+                "name": self.name,
+                "limit": int(self.limit),
+                "peak_limit": int(self.peak_limit),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "in_flight": self._in_flight,
+                "window_p95_s": round(_p95(latencies), 3) if latencies else None,
+                "window_error_rate": round(sum(1 for _, o in self._samples if o != OK) / n, 3) if n else None,
+                "outcomes": dict(self.counts),
+                "adjustments": [{"t_s": t, "limit": int(l), "reason": r} for t, l, r in self.history[-100:]],
+            }
+
+
+# ===================== LÀN CHẠY THEO LIMIT =====================
+def run_lanes(controller: Optional[AIMDController],
+              next_item: Callable[[], object],
+              work: Callable[[object, object], None],
+              open_lane: Optional[Callable[[int], object]] = None,
+              close_lane: Optional[Callable[[object], None]] = None,
+              name: str = "lane",
+              poll_s: float = 0.2) -> int:
+    """
+    Chạy việc bằng các "làn" (thread), số làn hoạt động = controller.lanes():
+      - next_item(): lấy việc kế tiếp (thread-safe), None = hết việc -> làn kết thúc
+      - work(state, item): làm 1 việc (tự giữ slot bằng gate(controller) quanh phần tải trang)
+      - open_lane(i) / close_lane(state): tạo / đóng tài nguyên riêng của làn (vd. Chrome)
+    Làn thứ i (đếm từ 0) chỉ lấy việc mới khi i < controller.lanes(): limit giảm thì làn thừa tự đóng,
+    limit tăng thì vòng giám sát (luồng gọi) mở thêm làn. controller=None -> đúng 1 làn (như cũ).
+    Lỗi (không bắt) trong 1 làn: dừng cấp việc mới, chờ các làn khác rồi ném lại lỗi đầu tiên.
+    Trả về số làn đồng thời tối đa đã chạy.
+    """
+    lock = threading.Lock()
+    exhausted = threading.Event()
+    errors: List[BaseException] = []
+    lanes: Dict[int, threading.Thread] = {}
+    peak = 0
+
+    def _want() -> int:
+        return controller.lanes() if controller is not None else 1
+
+    def _take():
+        if exhausted.is_set():
+            return None
+        item = next_item()
+        if item is None:
+            exhausted.set()
+        return item
+
+    def _lane(i: int) -> None:
+        state = None
+        try:
+            state = open_lane(i) if open_lane is not None else None
+            while i < _want():
+                item = _take()
+                if item is None:
+                    return
+                work(state, item)
+        except BaseException as e:   # noqa: B902 — ném lại ở luồng gọi
+            with lock:
+                errors.append(e)
+            exhausted.set()
+        finally:
+            if close_lane is not None and state is not None:
+                close_lane(state)
+
+    while True:
+        with lock:
+            for i in [i for i, t in lanes.items() if not t.is_alive()]:
+                del lanes[i]
+            if not exhausted.is_set():
+                cap = controller.max_lanes() if controller is not None else 1
+                for i in range(min(_want(), cap)):
+                    if i not in lanes:
+                        t = threading.Thread(target=_lane, args=(i,), name=f"{name}-{i}", daemon=True)
+                        lanes[i] = t
+                        t.start()
+            peak = max(peak, len(lanes))
+            alive = list(lanes.values())
+        if not alive:
+            break
+        if controller is not None:
+            controller.wait_change(poll_s)
+        else:
+            alive[0].join(poll_s)
+    if errors:
+        raise errors[0]
+    return peak
+
+
+# ===================== MÔ PHỎNG (không cần mạng) =====================
+class SimulatedServer:
+    """
+    Server giả lập: chịu được `capacity` request đồng thời với latency ~base_latency_s;
+    vượt capacity thì latency tăng tuyến tính; vượt `throttle_at` thì trả 429 (THROTTLED).
+    `time_scale` co thời gian ngủ thật để mô phỏng chạy nhanh (latency báo về vẫn là latency "ảo").
+    """
+
+    def __init__(self, capacity: int = 4, base_latency_s: float = 2.0, throttle_at: int = 6,
+                 timeout_s: float = 30.0, jitter: float = 0.2, time_scale: float = 0.001, seed: int = 0):
+        self.capacity = capacity
+        self.base_latency_s = base_latency_s
+        self.throttle_at = throttle_at
+        self.timeout_s = timeout_s
+        self.jitter = jitter
+        self.time_scale = time_scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._active = 0
+        self.max_active = 0
+
+    def request(self) -> Tuple[float, str]:
+        with self._lock:
+            self._active += 1
+            active = self._active
+            self.max_active = max(self.max_active, active)
+            noise = 1.0 + self._rng.uniform(-self.jitter, self.jitter)
+        try:
+            overload = max(0, active - self.capacity) / max(1, self.capacity)
+            latency = self.base_latency_s * (1.0 + 3.0 * overload) * noise
+            if active > self.throttle_at:
+                outcome = THROTTLED
+                latency = self.base_latency_s * 0.1
+            elif latency > self.timeout_s:
+                outcome, latency = TIMEOUT, self.timeout_s
+            else:
+                outcome = OK
+            time.sleep(latency * self.time_scale)
+            return latency, outcome
+        finally:
+            with self._lock:
+                self._active -= 1
+
+
+def simulate(controller: AIMDController, server: SimulatedServer, n_requests: int = 400) -> Dict:
+    """Chạy n_requests qua run_lanes (số làn do controller quyết định); trả về snapshot + số làn/request
+    đồng thời tối đa."""
+    remaining = [n_requests]
+    lock = threading.Lock()
+
+    def next_item():
+        with lock:
+            if remaining[0] <= 0:
+                return None
+            remaining[0] -= 1
+            return remaining[0]
+
+    def work(_state, _item):
+        with gate(controller) as slot:
+            slot.latency_s, slot.outcome = server.request()
+
+    peak_lanes = run_lanes(controller, next_item, work, name="sim", poll_s=0.01)
+    snap = controller.snapshot()
+    snap["server_max_active"] = server.max_active
+    snap["peak_lanes"] = peak_lanes
+    return snap
@@ -0,0 +1,44 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: DANH SÁCH NGÀNH CẦN CRAWL (không phụ thuộc selenium)
+#
+# Dùng chung bởi crawler/selenium_scraper.py và main.py (tác vụ theo ngành,
+# `python main.py retry --groups ...`).
+# ===========================================================
+from typing import Dict
+
+# Map tên ngành (hiển thị) -> group_id trên VietnamWorks
+# Dùng cho việc build URL /viec-lam?g=<group_id>
+# Ghi chú:
+# - Đây là ánh xạ thủ công dựa trên trạng thái website tại thời điểm triển khai.
+# - Nếu VietnamWorks thay đổi taxonomy/ID, cần cập nhật lại bảng này.
+VNWORKS_GROUPS: Dict[str, int] = {
+    "Bán Lẻ/Tiêu Dùng": 24,
+    "Bảo Hiểm": 14,
+    "Bất Động Sản": 23,
+    "CEO & General Management": 29,
+    "Chính Phủ/Phi Lợi Nhuận": 25,
+    "Công Nghệ Thông Tin/Viễn Thông": 5,
+    "Dược": 28,
+    "Dệt May/Da Giày": 26,
+    "Dịch Vụ Khách Hàng": 6,
+    "Dịch Vụ Ăn Uống": 11,
+    "Giáo Dục": 1,
+    "Hành Chính Văn Phòng": 20,
+    "Hậu Cần/Xuất Nhập Khẩu/Kho Bãi": 13,
+    "Khoa Học & Kỹ Thuật": 9,
+    "Kinh Doanh": 21,
+    "Kiến Trúc/Xây Dựng": 4,
+    "Kế Toán/Kiểm Toán": 2,
+    "Kỹ Thuật": 22,
+    "Nghệ thuật, Truyền thông/In ấn/Xuất bản": 18,
+    "Ngân Hàng & Dịch Vụ Tài Chính": 10,
+    "Nhà Hàng - Khách Sạn/Du Lịch": 15,
+    "Nhân Sự/Tuyển Dụng": 12,
+    "Nông/Lâm/Ngư Nghiệp": 3,
+    "Pháp Lý": 16,
+    "Sản Xuất": 27,
+    "Thiết Kế": 7,
+    "Tiếp Thị, Quảng Cáo/Truyền Thông": 17,
+    "Vận Tải": 8,
+    "Y Tế/Chăm Sóc Sức Khoẻ": 19
+}
@@ -1,10 +1,16 @@
 from bs4 import BeautifulSoup
 import os
 import re
+import sys
+import json
+import math
+import queue
+import threading
 import time
-import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 import pandas as pd
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -20,6 +26,15 @@ _THIS_FILE = Path(__file__).resolve()
 # nếu file nằm trong thư mục "crawler", project-root là cha của nó; ngược lại là chính thư mục hiện tại
 _PROJECT_ROOT = _THIS_FILE.parent.parent if _THIS_FILE.parent.name.lower() == "crawler" else _THIS_FILE.parent
 _OUTPUT_ROOT = _PROJECT_ROOT / "output"
+# cho phép import các module cùng dự án (crawler.*, ...) khi chạy `python crawler/selenium_scraper.py`
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from common import artifacts, frames, textnorm
+from common.events import ProgressReporter, emit_event
+from crawler.groups import VNWORKS_GROUPS
+from crawler.adaptive import AIMDController, TIMEOUT, classify_page, gate, run_lanes
+from crawler.watchdog import DriverWatchdog, UrlDeadlineExceeded, driver_tree_rss_mb
 
 # ===========================================================
 # MỤC ĐÍCH TỆP: CÁC HÀM & HẰNG SỐ PHỤ TRỢ CHO BỘ THU THẬP
@@ -34,42 +49,7 @@ _OUTPUT_ROOT = _PROJECT_ROOT / "output"
 # ===========================================================
 
 # ===================== CẤU HÌNH NGÀNH =====================
-# Map tên ngành (hiển thị) -> group_id trên VietnamWorks
-# Dùng cho việc build URL /viec-lam?g=<group_id>
-# Ghi chú:
-# - Đây là ánh xạ thủ công dựa trên trạng thái website tại thời điểm triển khai.
-# - Nếu VietnamWorks thay đổi taxonomy/ID, cần cập nhật lại bảng này.
-VNWORKS_GROUPS: Dict[str, int] = {
-    "Bán Lẻ/Tiêu Dùng": 24,
-    "Bảo Hiểm": 14,
-    "Bất Động Sản": 23,
-    "CEO & General Management": 29,
-    "Chính Phủ/Phi Lợi Nhuận": 25,
-    "Công Nghệ Thông Tin/Viễn Thông": 5,
-    "Dược": 28,
-    "Dệt May/Da Giày": 26,
-    "Dịch Vụ Khách Hàng": 6,
-    "Dịch Vụ Ăn Uống": 11,
-    "Giáo Dục": 1,
-    "Hành Chính Văn Phòng": 20,
-    "Hậu Cần/Xuất Nhập Khẩu/Kho Bãi": 13,
-    "Khoa Học & Kỹ Thuật": 9,
-    "Kinh Doanh": 21,
-    "Kiến Trúc/Xây Dựng": 4,
-    "Kế Toán/Kiểm Toán": 2,
-    "Kỹ Thuật": 22,
-    "Nghệ thuật, Truyền thông/In ấn/Xuất bản": 18,
-    "Ngân Hàng & Dịch Vụ Tài Chính": 10,
-    "Nhà Hàng - Khách Sạn/Du Lịch": 15,
-    "Nhân Sự/Tuyển Dụng": 12,
-    "Nông/Lâm/Ngư Nghiệp": 3,
-    "Pháp Lý": 16,
-    "Sản Xuất": 27,
-    "Thiết Kế": 7,
-    "Tiếp Thị, Quảng Cáo/Truyền Thông": 17,
-    "Vận Tải": 8,
-    "Y Tế/Chăm Sóc Sức Khoẻ": 19
-}
+# Bảng ngành -> group_id nằm ở crawler/groups.py (orchestrator cũng dùng để tạo tác vụ theo ngành)
 
 def slugify_vn(s: str) -> str:
         # Chuẩn hoá chuỗi tiếng Việt về 'slug' không dấu, dùng cho tên file/thư mục.
@@ -78,14 +58,11 @@ def slugify_vn(s: str) -> str:
         #   (2) Dễ tìm kiếm, so khớp, và đảm bảo tính nhất quán trong pipeline.
         # Các bước xử lý:
         #   - Thay '/' bằng space để không vô tình tạo cấp thư mục.
-        #   - Chuyển riêng 'Đ/đ' sang 'D/d' (normalize NFD không đụng đến ký tự này).
-        #   - Dùng NFD để tách dấu tiếng Việt; loại mọi ký tự Mn (dấu) để "bỏ dấu".
+        #   - Bỏ dấu tiếng Việt (kể cả 'Đ/đ' -> 'D/d') bằng bảng translate dùng chung (common/textnorm.py).
         #   - Chỉ giữ [a-zA-Z0-9] và khoảng trắng; ký tự khác thay bằng space.
         #   - Ép nhiều khoảng trắng liên tiếp về 1 space, trim 2 đầu, rồi lower-case.
     s = s.replace("/", " ")
-    s = s.replace("Đ", "D").replace("đ", "d")  # xử lý Đ/đ riêng
-    s = unicodedata.normalize("NFD", s)        # tách dấu
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")  # bỏ dấu
+    s = textnorm.fold(s)                       # bỏ dấu (kể cả Đ/đ)
     s = re.sub(r"[^a-zA-Z0-9\s]", " ", s)      # chỉ giữ chữ/số/space
     s = re.sub(r"\s+", " ", s).strip()         # gộp space thừa
     return s.lower()
@@ -200,8 +177,196 @@ def _append_batch_to_excel(excel_path: str, records: List[Dict], sheet_name: str
     wb.save(excel_path)
     wb.close()
 
-def create_driver():
+# === File chi tiết dạng Parquet (định dạng trung gian mặc định, xem common/frames.py) ===
+# Parquet không append được khi header nở dần theo lô -> các lô được nối vào file spool JSON Lines
+# (bền khi crash giống append Excel), đóng writer thì chuyển 1 lần sang Parquet rồi xoá spool.
+# Excel cũng không append thẳng vào file chính: các lô ghi vào <tên>.part.xlsx, xong mới đổi tên.
+# -> file chính chỉ xuất hiện khi đã đầy đủ; lần thử lại / resume (cùng CRAWL_RUN_TS -> cùng tên file)
+#    bỏ file tạm dở dang thay vì append tiếp vào đó (nhân đôi dòng).
+def _spool_path(out_path) -> Path:
+    return Path(f"{out_path}.part.jsonl")
+
+def _xlsx_part_path(out_path) -> Path:
+    p = Path(out_path)
+    return p.with_name(f"{p.stem}.part{p.suffix}")   # giữ đuôi .xlsx cho openpyxl
+
+def _discard_partial_detail(out_path) -> None:
+    """Xoá file tạm của lần ghi trước bị ngắt (spool Parquet / .part.xlsx) -> ngành được bóc lại từ đầu."""
+    _spool_path(out_path).unlink(missing_ok=True)
+    _xlsx_part_path(out_path).unlink(missing_ok=True)
+
+def _append_batch_to_spool(out_path, records: List[Dict]) -> None:
+    if not records:
+        return
+    spool = _spool_path(out_path)
+    spool.parent.mkdir(parents=True, exist_ok=True)
+    with open(spool, "a", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+
+def _append_batch(out_path, records: List[Dict], sheet_name: str = "jobs") -> None:
+    if str(out_path).lower().endswith(".parquet"):
+        _append_batch_to_spool(out_path, records)
+    else:
+        _append_batch_to_excel(str(_xlsx_part_path(out_path)), records, sheet_name=sheet_name)
+
+def _finalize_detail_file(out_path) -> None:
+    """Parquet: gom spool -> ghi file chính. Excel: đổi tên file tạm .part.xlsx thành file chính.
+    Không có dòng nào thì ghi bảng rỗng."""
+    if not str(out_path).lower().endswith(".parquet"):
+        part = _xlsx_part_path(out_path)
+        if part.exists():
+            os.replace(part, out_path)
+        else:
+            frames.write_frame(pd.DataFrame(), out_path)
+        return
+    spool = _spool_path(out_path)
+    rows: List[Dict] = []
+    if spool.exists():
+        with open(spool, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    # DataFrame từ list dict: cột theo thứ tự xuất hiện đầu tiên, giống header nở dần của bản Excel
+    frames.write_frame(pd.DataFrame(rows), out_path)
+    if spool.exists():
+        spool.unlink()
+
+# === Ghi nền: producer (driver bóc trang) / consumer (thread ghi Excel) qua hàng đợi có giới hạn ===
+# Hàng đợi đầy -> submit() chặn (backpressure): driver chờ thay vì dồn vô hạn batch vào RAM.
+WRITER_QUEUE_BATCHES = int(os.getenv("CRAWL_WRITER_QUEUE", "4"))
+# Chỉ ép gc.collect() khi RSS tiến trình Python vượt ngưỡng (MB), không ép theo từng batch nữa.
+GC_RSS_THRESHOLD_MB = float(os.getenv("CRAWL_GC_RSS_MB", "600"))
+
+try:
+    import psutil as _psutil
+    _SELF_PROC = _psutil.Process()
+except ImportError:
+    _SELF_PROC = None
+
+def _maybe_gc() -> bool:
+    """gc.collect() nếu RSS vượt GC_RSS_THRESHOLD_MB. Trả về True nếu đã thu gom."""
+    if _SELF_PROC is None:
+        return False
+    try:
+        rss_mb = _SELF_PROC.memory_info().rss / (1024 * 1024)
+    except Exception:
+        return False
+    if rss_mb < GC_RSS_THRESHOLD_MB:
+        return False
+    gc.collect()
+    print(f"[GC] RSS {rss_mb:.0f} MB ≥ {GC_RSS_THRESHOLD_MB:.0f} MB -> gc.collect()")
+    return True
+
+class _BatchWriter:
+    """
+    Thread ghi nền cho 1 file chi tiết: nhận từng batch (list dict) và append vào file theo thứ tự nhận
+    (.xlsx: append thẳng; .parquet: append spool, close() mới ghi file Parquet).
+    Dùng:  w = _BatchWriter(path); w.submit(batch); ...; total = w.close()
+    Batch nào ghi lỗi thì close() ném RuntimeError (không finalize file) -> ngành bị báo group_failed
+    và được thử lại, thay vì group_done với các dòng bị mất âm thầm.
+    """
+
+    _STOP = object()
+
+    def __init__(self, excel_path: str, sheet_name: str = "jobs", max_batches: int = WRITER_QUEUE_BATCHES):
+        self.excel_path = excel_path
+        self.sheet_name = sheet_name
+        self.written = 0
+        self.errors = 0
+        self.lost_rows = 0     # số dòng thuộc các batch ghi lỗi
+        self._first_error: Optional[BaseException] = None
+        self.blocked_s = 0.0   # tổng thời gian driver phải chờ vì hàng đợi đầy
+        self._q: "queue.Queue" = queue.Queue(maxsize=max(1, max_batches))
+        # File tạm sót lại của lần crawl ngành này bị ngắt (thử lại / resume cùng tên file) -> bỏ,
+        # ngành được bóc lại từ đầu thay vì append tiếp vào bản dở dang
+        _discard_partial_detail(excel_path)
+        self._thread = threading.Thread(target=self._run, name=f"writer:{Path(excel_path).name}", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._q.get()
+            try:
+                if batch is self._STOP:
+                    return
+                _append_batch(self.excel_path, batch, sheet_name=self.sheet_name)
+                self.written += len(batch)
+                _maybe_gc()
+            except Exception as e:
+                self.errors += 1
+                self.lost_rows += len(batch)
+                if self._first_error is None:
+                    self._first_error = e
+                print(f"[WRITER][ERROR] Ghi {len(batch)} dòng vào {self.excel_path} lỗi: {e}")
+            finally:
+                self._q.task_done()
+
+    def submit(self, batch: List[Dict]) -> None:
+        """Đưa batch cho thread ghi. Người gọi KHÔNG được dùng lại list này (tạo list mới cho batch sau)."""
+        if not batch:
+            return
+        t0 = time.monotonic()
+        self._q.put(batch)   # chặn khi đầy -> backpressure
+        self.blocked_s += time.monotonic() - t0
+
+    def close(self) -> int:
+        """Chờ ghi hết hàng đợi rồi dừng thread. Trả về tổng số dòng đã ghi.
+        Có batch ghi lỗi -> bỏ file dở dang và ném RuntimeError (file chi tiết thiếu dòng không được công bố)."""
+        self._q.put(self._STOP)
+        self._thread.join()
+        if self.errors:
+            _discard_partial_detail(self.excel_path)
+            raise RuntimeError(
+                f"Ghi file chi tiết {self.excel_path} lỗi ở {self.errors} batch "
+                f"({self.lost_rows} dòng chưa ghi)") from self._first_error
+        try:
+            _finalize_detail_file(self.excel_path)
+        except Exception as e:
+            self.errors += 1
+            print(f"[WRITER][ERROR] Ghi file {self.excel_path} lỗi: {e}")
+            raise
+        return self.written
+
+    def stats(self) -> Dict:
+        return {"writer_rows": self.written, "writer_errors": self.errors, "writer_lost_rows": self.lost_rows,
+                "writer_blocked_s": round(self.blocked_s, 2)}
+
+# Mở Chrome mới chỉ khi RAM trống còn đủ cho 1 cây chrome + phần chừa; không thì chờ (tối đa CHROME_MEM_WAIT_S).
+CHROME_FOOTPRINT_MB = float(os.getenv("CHROME_FOOTPRINT_MB", "400"))
+MEM_MIN_FREE_MB = float(os.getenv("MEM_MIN_FREE_MB", "150"))
+CHROME_MEM_WAIT_S = float(os.getenv("CHROME_MEM_WAIT_S", "300"))
+
+def _wait_for_chrome_memory() -> float:
+    """Chờ tới khi RAM trống ≥ CHROME_FOOTPRINT_MB + MEM_MIN_FREE_MB. Trả về số giây đã chờ."""
+    if _SELF_PROC is None or CHROME_FOOTPRINT_MB <= 0:
+        return 0.0
+    t0 = time.monotonic()
+    need = CHROME_FOOTPRINT_MB + MEM_MIN_FREE_MB
+    reported = False
+    while True:
+        avail = _psutil.virtual_memory().available / (1024 * 1024)
+        if avail >= need:
+            break
+        waited = time.monotonic() - t0
+        if waited >= CHROME_MEM_WAIT_S:
+            print(f"[MEM] ⚠️ Hết {CHROME_MEM_WAIT_S:g}s chờ RAM (trống {avail:.0f} MB < {need:.0f} MB) -> vẫn mở Chrome")
+            break
+        if not reported:
+            print(f"[MEM] ⏸️ Hoãn mở Chrome ({threading.current_thread().name}): "
+                  f"RAM trống {avail:.0f} MB < cần {CHROME_FOOTPRINT_MB:.0f} + chừa {MEM_MIN_FREE_MB:.0f} MB")
+            reported = True
+        gc.collect()
+        time.sleep(2.0)
+    waited = time.monotonic() - t0
+    if reported:
+        print(f"[MEM] ▶️ Mở Chrome sau {waited:.0f}s chờ")
+    return waited
+
+def create_driver(page_load_strategy: Optional[str] = None):
+    _wait_for_chrome_memory()
     options = Options()
+    if page_load_strategy:
+        # "none": driver.get/switch_to không chờ trang tải xong (cần cho chế độ đa tab)
+        options.page_load_strategy = page_load_strategy
     options.add_argument("--headless=new")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
@@ -217,6 +382,122 @@ def create_driver():
     driver.set_script_timeout(60)      # timeout khi chạy JS
     return driver
 
+# Ngân sách TỔNG cho 1 URL (tải + chờ + cuộn + bóc). Page-load timeout/WebDriverWait không chặn được
+# mọi kiểu treo của chromedriver -> watchdog giết cây tiến trình driver khi quá hạn. 0 = tắt.
+URL_BUDGET_S = float(os.getenv("CRAWL_URL_BUDGET_S", "90"))
+
+# ===================== KẾ HOẠCH CRAWL (PLANNER) =====================
+# Số job mỗi trang listing mặc định của VietnamWorks (card item-0..49).
+# Chỉ dùng khi không đếm được số card thực tế ở trang 1.
+DEFAULT_PAGE_SIZE = 50
+
+# Tổng số job nằm trong JSON __NEXT_DATA__ ("searchResultData":{"nbHits":252})
+# hoặc trong title/meta dạng "Tuyển dụng 252 việc làm ...".
+_NBHITS_RE = re.compile(r'"nbHits"\s*:\s*(\d+)')
+_TOTAL_TEXT_RE = re.compile(r"(\d[\d.,]*)\s*(?:<!-- -->\s*)?việc\s+làm", re.IGNORECASE)
+
+def _parse_total_jobs(html: str) -> Optional[int]:
+    """
+    Rút tổng số job ("N việc làm") của một trang listing.
+    Thứ tự ưu tiên:
+    1) JSON của API/Next.js (nbHits) → chính xác nhất, không phụ thuộc giao diện.
+    2) Text "N việc làm" trong title/meta/heading (bỏ dấu chấm/phẩy ngăn cách nghìn).
+    Trả về None nếu không tìm thấy (caller sẽ fallback về no_gain_patience).
+    """
+    if not html:
+        return None
+    m = _NBHITS_RE.search(html)
+    if m:
+        return int(m.group(1))
+    for m in _TOTAL_TEXT_RE.finditer(html):
+        digits = re.sub(r"[.,]", "", m.group(1))
+        if digits.isdigit() and int(digits) > 0:
+            return int(digits)
+    return None
+
+def plan_group_crawl(driver, group_id: int, group_name: str, wait_s: int = 25) -> Dict:
+    """
+    Mở trang 1 của ngành, đọc tổng số job và số card/trang để lập kế hoạch số trang CHÍNH XÁC.
+    Trả về dict: {group_id, group_name, total_jobs, page_size, planned_pages, first_page}
+    (total_jobs/planned_pages = None nếu trang không hiển thị tổng).
+    first_page = {"hrefs", "at"}: link của trang 1 vừa tải -> pha listing dùng lại, khỏi tải trang 1 lần nữa
+    (None nếu không thấy block-job-list).
+    """
+    plan = {
+        "group_id": group_id,
+        "group_name": group_name,
+        "total_jobs": None,
+        "page_size": DEFAULT_PAGE_SIZE,
+        "planned_pages": None,
+        "first_page": None,
+    }
+    try:
+        driver.get(f"{BASE}/viec-lam?g={group_id}")
+        try:
+            WebDriverWait(driver, wait_s).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "div.block-job-list"))
+            )
+        except Exception:
+            print(f"[PLAN][{group_name}] [WARN] Chưa thấy block-job-list sau timeout.")
+
+        total = _parse_total_jobs(driver.page_source)
+        # Đếm card thật ở trang 1 để suy ra page_size (phòng khi VNW đổi số job/trang)
+        _scroll_lazy(driver, times=8, dy=1500, pause=0.25)
+        n_cards = len(driver.find_elements(By.CSS_SELECTOR, "div.search_list.view_job_item.new-job-card"))
+        # Giữ link trang 1 (bóc giống hệt pha listing) để listing không phải tải lại trang này
+        blocks = driver.find_elements(By.CSS_SELECTOR, "div.block-job-list")
+        if blocks:
+            cards = blocks[0].find_elements(By.CSS_SELECTOR, "div.search_list.view_job_item.new-job-card")
+            plan["first_page"] = {
+                "hrefs": [href for card in cards for href in _extract_links_stepwise_from_card(card) if href],
+                "at": time.time(),
+            }
+        if total is not None and n_cards and n_cards < total:
+            plan["page_size"] = n_cards
+        if total is not None:
+            plan["total_jobs"] = total
+            plan["planned_pages"] = max(1, math.ceil(total / plan["page_size"])) if total > 0 else 0
+    except Exception as e:
+        print(f"[PLAN][{group_name}] [WARN] Không lập được kế hoạch: {e}")
+
+    print(f"[PLAN][{group_name}] total={plan['total_jobs']} page_size={plan['page_size']} "
+          f"planned_pages={plan['planned_pages']}")
+    return plan
+
+def plan_crawl(groups: Dict[str, int]) -> Dict[int, Dict]:
+    """Lập kế hoạch cho tất cả ngành bằng MỘT driver (mỗi ngành chỉ tốn 1 lần tải trang 1)."""
+    plans: Dict[int, Dict] = {}
+    driver = create_driver()
+    try:
+        for group_name, gid in groups.items():
+            plans[gid] = plan_group_crawl(driver, gid, group_name)
+    finally:
+        driver.quit()
+    return plans
+
+def _estimated_cost(plan: Optional[Dict]) -> float:
+    # Chi phí ước lượng ~ số trang listing + số trang chi tiết; ngành chưa rõ tổng coi như trung bình.
+    if not plan or plan.get("total_jobs") is None:
+        return float(DEFAULT_PAGE_SIZE)
+    return float(plan["total_jobs"] + (plan.get("planned_pages") or 0))
+
+def allocate_groups_to_workers(group_ids: List[int], plans: Dict[int, Dict], n_workers: int) -> List[List[int]]:
+    """
+    Chia ngành cho n_workers theo thuật toán LPT (Longest Processing Time first):
+    sắp ngành theo chi phí giảm dần rồi gán cho worker đang nhẹ tải nhất.
+    Mục tiêu: các worker kết thúc gần cùng lúc, tránh 1 worker ôm ngành lớn chạy một mình ở cuối.
+    """
+    n_workers = max(1, min(n_workers, len(group_ids) or 1))
+    buckets: List[List[int]] = [[] for _ in range(n_workers)]
+    loads = [0.0] * n_workers
+    for gid in sorted(group_ids, key=lambda g: _estimated_cost(plans.get(g)), reverse=True):
+        w = loads.index(min(loads))
+        buckets[w].append(gid)
+        loads[w] += _estimated_cost(plans.get(gid))
+    for w, (bucket, load) in enumerate(zip(buckets, loads)):
+        print(f"[PLAN] worker#{w + 1}: {len(bucket)} ngành, chi phí ước lượng ~{load:.0f} trang")
+    return buckets
+
 def get_vietnamworks_jobs_by_group(
     group_id: int,
     group_name: str,
@@ -224,6 +505,11 @@ def get_vietnamworks_jobs_by_group(
     delay: float = 1.0,           # nghỉ giữa 2 page (lịch sự với server, giúp tránh bị rate-limit / CAPTCHA)
     safety_max_pages: int = 200,  # chốt an toàn chống loop vô hạn/redirect lặp (kể cả khi max_pages=0)
     no_gain_patience: int = 2,    # số trang liên tiếp không thu thêm link mới -> dừng để tránh cuộn vô ích
+    expected_total: int = 0,      # tổng job theo kế hoạch (0 = không biết) -> đủ số link thì dừng, khỏi tải trang thừa
+    stats: Optional[Dict] = None, # nếu truyền dict vào: ghi lại pages_fetched/stop_reason phục vụ báo cáo coverage
+    limiter: Optional[AIMDController] = None,  # AIMD dùng chung giữa các worker; None = không giới hạn
+    progress: Optional[ProgressReporter] = None,  # báo tiến độ (số trang đã tải) cho orchestrator
+    first_page_hrefs: Optional[List[str]] = None,  # link trang 1 planner vừa tải (None = tự tải trang 1)
 ) -> List[Dict]:
     """
     Trình thu thập link job theo 'group_id' (ngành) trên VietnamWorks.
@@ -240,6 +526,9 @@ def get_vietnamworks_jobs_by_group(
         * max_pages: giới hạn do người dùng truyền vào (0 = không giới hạn theo tham số này).
         * safety_max_pages: "cầu chì" chống lỗi vòng lặp/redirect.
         * no_gain_patience: dừng khi nhiều trang liền không thêm được liên kết mới (tiết kiệm tài nguyên).
+        * expected_total: đã thu đủ số job theo kế hoạch (planner) → dừng ngay, không phải chờ no_gain_patience.
+          Tự tải trang 1 thì tổng job đọc lại ở đó (mới hơn kế hoạch) thay cho expected_total.
+    - first_page_hrefs: dùng lại trang 1 planner đã tải (không tải trang 1 lần nữa).
 
     Thứ tự xử lý (high-level):
     1) Lặp qua các trang /viec-lam?g=<id>&page=<n>.
@@ -258,111 +547,180 @@ def get_vietnamworks_jobs_by_group(
 
     base_url = f"{BASE}/viec-lam?g={group_id}"
 
-    # ---- Khởi tạo Chrome WebDriver ----
-    driver = create_driver()
-    wait = WebDriverWait(driver, 25)
+    # ---- Song song theo AIMD: limit của controller = số làn (mỗi làn 1 Chrome, bọc watchdog) ----
+    # Các làn nhận số trang theo thứ tự tăng dần và tải trước; kết quả được XỬ LÝ đúng thứ tự trang
+    # (dừng theo trang rỗng / trang lặp / no_gain / đủ kế hoạch y như bản tuần tự). Đã quyết định dừng
+    # thì không cấp trang mới; các trang đang tải dở (tối đa limit - 1 trang) bị bỏ. limiter=None -> 1 làn.
+    hard_limit = min(max_pages, safety_max_pages) if max_pages > 0 else safety_max_pages
+    _SKIPPED = object()           # trang bị watchdog bỏ qua
 
-    # ---- Biến trạng thái thu thập ----
+    # ---- Biến trạng thái thu thập (dùng chung giữa các làn, luôn giữ lock khi đọc/ghi) ----
+    lock = threading.Lock()
     results: List[Dict] = []      # chứa record tối thiểu cho từng job
     seen_hrefs: set = set()       # set để khử trùng lặp trong phiên (O(1) tra cứu)
     seen_signatures: set = set()  # chữ ký trang: hash(sorted(set(page_hrefs))) để phát hiện vòng lặp/redirect
-    page = 1
-    no_gain_streak = 0            # đếm số lần liên tiếp không thêm được link mới
-
-    try:
-        while True:
-            # --- Giới hạn trang bởi tham số/khoá an toàn ---
-            if max_pages > 0 and page > max_pages:
-                print(f"[{group_name}] Đạt giới hạn max_pages. Dừng.")
-                break
-            if page > safety_max_pages:
-                print(f"[{group_name}] Vượt safety_max_pages. Dừng.")
-                break
-
-            # Build URL: trang 1 dùng base_url, từ trang 2 thêm &page=
-            url = base_url if page == 1 else f"{base_url}&page={page}"
-            print(f"[{group_name}] [FETCH] {url}")
-            driver.get(url)
-
-            # Chờ khối 'block-job-list' xuất hiện (cột sống của page listing)
-            # Nếu không thấy: không vội kết luận lỗi → có thể là hết dữ liệu/redirect/băng thông chậm.
-            try:
-                wait.until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "div.block-job-list"))
-                )
-            except Exception:
-                # Có thể do mạng/chuyển trang/hết trang -> vẫn tiếp tục xử lý bên dưới để xác nhận
-                print(f"[{group_name}] [WARN] Chưa thấy block-job-list sau timeout.")
-
-            # Cuộn để kích hoạt lazy-load các card (danh sách thường tải dần khi người dùng cuộn)
-            _scroll_lazy(driver, times=8, dy=1500, pause=0.25)
-
-            # Tìm container danh sách job (điểm neo để lấy các card)
-            try:
-                block = driver.find_element(By.CSS_SELECTOR, "div.block-job-list")
-            except Exception:
-                # Nếu không có container => có thể là trang cuối/DOM thay đổi mạnh -> dừng vòng lặp chính
-                print(f"[{group_name}] Không tìm thấy block-job-list. Dừng.")
-                break
-
-            # Lấy tất cả 'card' job (mẫu class chung). Không phụ thuộc index (item-0..49)
-            # Ưu tiên selector đủ cụ thể để tránh lẫn với các khối khác, nhưng vẫn tránh "quá chặt" vào class động.
-            cards = block.find_elements(
-                By.CSS_SELECTOR, "div.search_list.view_job_item.new-job-card"
-            )
-
-            # --- Gom link trên trang hiện tại ---
-            # page_hrefs: mọi href rút được (kể cả trùng) -> dùng tạo "chữ ký trang".
-            # page_links: chỉ các href chưa từng thấy trong phiên -> dùng để push vào results.
-            page_links, page_hrefs = [], []
-            for card in cards:
-                for href in _extract_links_stepwise_from_card(card):
-                    if href:
-                        page_hrefs.append(href)  # chữ ký trang dùng toàn bộ (kể cả trùng)
-                        if href not in seen_hrefs:
-                            seen_hrefs.add(href)
-                            page_links.append(href)  # chỉ những link mới được thêm
-
-            # Nếu không thấy bất kỳ href nào -> coi như trang rỗng / kết thúc dữ liệu
-            if not page_hrefs:
-                print(f"[{group_name}] Trang không có job. Dừng.")
-                break
-
-            # --- Chống vòng lặp/redirect bằng chữ ký trang ---
-            # Sort + set để tạo signature ổn định, rồi hash; nếu trùng lặp -> khả năng redirect/vòng lặp.
-            page_signature = "|".join(sorted(set(page_hrefs)))
-            sig_hash = hash(page_signature)
-            if sig_hash in seen_signatures:
-                print(f"[{group_name}] Trang có chữ ký lặp lại (redirect/lặp). Dừng.")
-                break
-            seen_signatures.add(sig_hash)
-
-            # --- Kiểm soát 'không tăng dữ liệu' ---
-            if not page_links:
-                no_gain_streak += 1
-                print(f"[{group_name}] Không có job mới ở trang {page}. no_gain_streak={no_gain_streak}.")
-                if no_gain_streak >= no_gain_patience:
-                    print(f"[{group_name}] Nhiều trang liên tiếp không tăng dữ liệu. Dừng.")
-                    break
-            else:
-                # Có link mới -> reset streak & push kết quả
-                no_gain_streak = 0
-                for href in page_links:
-                    results.append({
-                        "title": "",          # placeholder: chưa parse tiêu đề (sẽ điền khi crawl chi tiết)
-                        "href": href,
-                        "group_id": group_id,
-                        "group_name": group_name,
-                    })
-                print(f"[{group_name}] Trang {page}: +{len(page_links)} job (tổng {len(results)}).")
-
-            # Sang trang kế, nghỉ 'delay' để đỡ bị nghi ngờ spam (giả lập hành vi người dùng thật)
-            page += 1
+    fetched: Dict[int, object] = {}   # trang đã tải, chờ xử lý theo thứ tự: list href | None (không có block) | _SKIPPED
+    st = {"next_page": 1, "next_to_process": 1, "last_processed": 0, "no_gain_streak": 0, "stop_reason": "",
+          "expected_total": expected_total}
+    lanes_wd: List[DriverWatchdog] = []
+
+    def _next_page():
+        with lock:
+            if st["stop_reason"] or st["next_page"] > hard_limit:
+                return None
+            page = st["next_page"]
+            st["next_page"] += 1
+            return page
+
+    def _stop(reason: str, msg: str) -> None:
+        print(f"[{group_name}] {msg}")
+        st["stop_reason"] = reason
+
+    def _process_page(page: int, page_hrefs) -> None:
+        """Xử lý 1 trang (đã giữ lock, gọi đúng thứ tự trang)."""
+        st["last_processed"] = page
+        if page_hrefs is _SKIPPED:
+            return
+        if page_hrefs is None:
+            # Nếu không có container => có thể là trang cuối/DOM thay đổi mạnh -> dừng vòng lặp chính
+            return _stop("no_block", "Không tìm thấy block-job-list. Dừng.")
+
+        # --- Gom link mới trên trang hiện tại ---
+        # page_links: chỉ các href chưa từng thấy trong phiên -> dùng để push vào results.
+        page_links = []
+        for href in page_hrefs:
+            if href not in seen_hrefs:
+                seen_hrefs.add(href)
+                page_links.append(href)  # chỉ những link mới được thêm
+
+        # Nếu không thấy bất kỳ href nào -> coi như trang rỗng / kết thúc dữ liệu
+        if not page_hrefs:
+            return _stop("empty_page", "Trang không có job. Dừng.")
+
+        # --- Chống vòng lặp/redirect bằng chữ ký trang ---
+        # Sort + set để tạo signature ổn định, rồi hash; nếu trùng lặp -> khả năng redirect/vòng lặp.
+        sig_hash = hash("|".join(sorted(set(page_hrefs))))
+        if sig_hash in seen_signatures:
+            return _stop("repeated_page", "Trang có chữ ký lặp lại (redirect/lặp). Dừng.")
+        seen_signatures.add(sig_hash)
+
+        # --- Kiểm soát 'không tăng dữ liệu' ---
+        if not page_links:
+            st["no_gain_streak"] += 1
+            print(f"[{group_name}] Không có job mới ở trang {page}. no_gain_streak={st['no_gain_streak']}.")
+            if st["no_gain_streak"] >= no_gain_patience:
+                return _stop("no_gain_patience", "Nhiều trang liên tiếp không tăng dữ liệu. Dừng.")
+        else:
+            # Có link mới -> reset streak & push kết quả
+            st["no_gain_streak"] = 0
+            for href in page_links:
+                results.append({
+                    "title": "",          # placeholder: chưa parse tiêu đề (sẽ điền khi crawl chi tiết)
+                    "href": href,
+                    "group_id": group_id,
+                    "group_name": group_name,
+                })
+            print(f"[{group_name}] Trang {page}: +{len(page_links)} job (tổng {len(results)}).")
+        if progress is not None:
+            progress.update(done=page)
+        if st["expected_total"] > 0 and len(results) >= st["expected_total"]:
+            _stop("plan_complete", f"Đã đủ {st['expected_total']} job theo kế hoạch. Dừng.")
+
+    def _open(i: int) -> DriverWatchdog:
+        # ---- Khởi tạo Chrome WebDriver (bọc watchdog: treo quá URL_BUDGET_S -> giết & thay driver) ----
+        wd = DriverWatchdog(create_driver, URL_BUDGET_S, name=f"{group_name}#{i}")
+        with lock:
+            lanes_wd.append(wd)
+        return wd
+
+    def _fetch(wd: DriverWatchdog, page: int) -> None:
+        if page == 1 and first_page_hrefs is not None:
+            print(f"[{group_name}] [FETCH] Dùng lại trang 1 từ planner ({len(first_page_hrefs)} link).")
+            return _collect(page, list(first_page_hrefs))
+
+        # Build URL: trang 1 dùng base_url, từ trang 2 thêm &page=
+        url = base_url if page == 1 else f"{base_url}&page={page}"
+        print(f"[{group_name}] [FETCH] {url}")
+        page_hrefs = None
+        # Hạn chót cho cả trang (tải + chờ + cuộn + trích link): treo quá hạn -> watchdog giết & thay driver
+        try:
+            with wd.deadline(url) as driver:
+                wait = WebDriverWait(driver, 25)
+                # Giữ 1 "slot" của AIMD trong lúc tải trang: đo latency + báo timeout/CAPTCHA/429 cho controller
+                with gate(limiter) as slot:
+                    driver.get(url)
+
+                    # Chờ khối 'block-job-list' xuất hiện (cột sống của page listing)
+                    # Nếu không thấy: không vội kết luận lỗi → có thể là hết dữ liệu/redirect/băng thông chậm.
+                    try:
+                        wait.until(
+                            EC.presence_of_element_located((By.CSS_SELECTOR, "div.block-job-list"))
+                        )
+                    except Exception:
+                        # Có thể do mạng/chuyển trang/hết trang -> vẫn tiếp tục xử lý bên dưới để xác nhận
+                        print(f"[{group_name}] [WARN] Chưa thấy block-job-list sau timeout.")
+                        slot.outcome = classify_page(driver.title, driver.page_source) or TIMEOUT
+                    if page == 1:
+                        # Tổng job lúc này (job đăng sau khi lập kế hoạch cũng được tính) -> mốc dừng sớm
+                        total_now = _parse_total_jobs(driver.page_source)
+                        if total_now:
+                            with lock:
+                                st["expected_total"] = total_now
+
+                # Cuộn để kích hoạt lazy-load các card (danh sách thường tải dần khi người dùng cuộn)
+                _scroll_lazy(driver, times=8, dy=1500, pause=0.25)
+
+                # Tìm container danh sách job (điểm neo để lấy các card)
+                try:
+                    block = driver.find_element(By.CSS_SELECTOR, "div.block-job-list")
+                except Exception:
+                    block = None
+
+                if block is not None:
+                    # Lấy tất cả 'card' job (mẫu class chung). Không phụ thuộc index (item-0..49)
+                    # Ưu tiên selector đủ cụ thể để tránh lẫn với các khối khác, nhưng vẫn tránh "quá chặt" vào class động.
+                    cards = block.find_elements(
+                        By.CSS_SELECTOR, "div.search_list.view_job_item.new-job-card"
+                    )
+                    # page_hrefs: mọi href rút được (kể cả trùng) -> dùng tạo "chữ ký trang".
+                    page_hrefs = [href for card in cards for href in _extract_links_stepwise_from_card(card) if href]
+        except UrlDeadlineExceeded as e:
+            print(f"[{group_name}] [WATCHDOG] {e}. Bỏ qua trang {page}.")
+            page_hrefs = _SKIPPED
+        _collect(page, page_hrefs)
+
+        # Nghỉ 'delay' trước trang kế để đỡ bị nghi ngờ spam (giả lập hành vi người dùng thật)
+        if page_hrefs is not _SKIPPED:
             time.sleep(delay)
 
+    def _collect(page: int, page_hrefs) -> None:
+        # --- Xử lý theo đúng thứ tự trang (ngoài vùng watchdog để seen_hrefs không bị ghi dở) ---
+        with lock:
+            fetched[page] = page_hrefs
+            while not st["stop_reason"] and st["next_to_process"] in fetched:
+                p = st["next_to_process"]
+                st["next_to_process"] += 1
+                _process_page(p, fetched.pop(p))
+
+    try:
+        run_lanes(limiter, _next_page, _fetch, open_lane=_open, close_lane=lambda wd: wd.quit(),
+                  name=f"listing-g{group_id}")
+        if not st["stop_reason"]:
+            stop = "max_pages" if max_pages > 0 and hard_limit == max_pages else "safety_max_pages"
+            _stop(stop, "Đạt giới hạn max_pages. Dừng." if stop == "max_pages" else "Vượt safety_max_pages. Dừng.")
     finally:
         # Đảm bảo đóng trình duyệt dù lỗi hay hoàn tất (giải phóng tài nguyên hệ thống)
-        driver.quit()
+        for wd in lanes_wd:
+            wd.quit()
+        if progress is not None:
+            progress.finish()
+        if stats is not None:
+            for wd in lanes_wd:
+                for k, v in wd.stats().items():
+                    stats[k] = stats.get(k, 0) + v
+            stats["pages_fetched"] = st["last_processed"]
+            stats["first_page_reused"] = first_page_hrefs is not None
+            stats["stop_reason"] = st["stop_reason"] or "error"
 
     # --- Khử trùng lặp lần cuối (phòng trường hợp hi hữu do race/DOM trùng) ---
     # Dựa trên key 'href' (định danh đường dẫn job) để giữ bản ghi cuối cùng cho mỗi href.
@@ -481,195 +839,625 @@ def _click_expand_buttons(driver, max_clicks: int = 20):
         print(f"  [INFO] Đã click mở rộng {clicked_count} lần.")
 
 # ===================== PHẦN 3: Crawl chi tiết job =====================
+def _expand_and_capture(driver, settle_s: float = 1.2):
+    """Trang chi tiết ĐÃ tải xong: chờ ổn định → cuộn → mở rộng → lấy phúc lợi + HTML (BeautifulSoup)."""
+    if settle_s > 0:
+        time.sleep(settle_s)
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    time.sleep(0.8)
+    _click_expand_buttons(driver, max_clicks=20)
+    time.sleep(1.0)
+
+    benefits_text = _extract_benefits(driver)
+    soup = BeautifulSoup(driver.page_source, "html.parser")
+    return benefits_text, soup
+
+def _parse_job_fields(soup, benefits_text: str, job_id: int, job_url: str) -> Dict:
+    """Bóc các trường của 1 trang chi tiết (dùng chung cho chế độ nhiều driver và chế độ nhiều tab)."""
+    job_fields = {
+        "ID": job_id,
+        "Tên công việc": _get_text_by_class(soup, "h1", "hAejeW"),
+        "Lương": _get_text_by_class(soup, "span", "cVbwLK"),
+        "Hết hạn": _get_text_by_class(soup, "span", "ePOHWr", 0),
+        "Lượt xem": _get_text_by_class(soup, "span", "ePOHWr", 1),
+        "Địa điểm tuyển dụng": _get_text_by_class(soup, "span", "ePOHWr", 2),
+    }
+
+    # Section mô tả
+    description_sections = soup.find_all("div", class_=lambda x: x and "gDSEwb" in x)
+    for section in description_sections:
+        title_tag = section.find("h2", class_=lambda x: x and "cjuZti" in x)
+        content_tag = section.find("div", class_=lambda x: x and "dVvinc" in x)
+        if title_tag and content_tag:
+            title = title_tag.get_text(strip=True)
+            content = content_tag.get_text(separator="\n", strip=True)
+            job_fields[title] = content
+
+    # Phúc lợi
+    job_fields["Phúc lợi"] = benefits_text
+
+    # Cặp Label/Value
+    job_info_section = soup.find("div", class_=lambda x: x and "dHvFzj" in x)
+    if job_info_section:
+        info_items = job_info_section.find_all("div", class_=lambda x: x and "JtIju" in x)
+        for item in info_items:
+            label_tag = item.find("label", class_=lambda x: x and "dfyRSX" in x)
+            value_tag = item.find("p", class_=lambda x: x and "cLLblL" in x)
+            if label_tag and value_tag:
+                job_fields[label_tag.get_text(strip=True)] = value_tag.get_text(strip=True)
+
+    # Địa điểm làm việc
+    loc = soup.find("div", class_=lambda x: x and "bAqPjv" in x)
+    if loc:
+        val = loc.find("p", class_=lambda x: x and "cLLblL" in x)
+        if val:
+            job_fields["Địa điểm làm việc"] = val.get_text(strip=True)
+
+    # Công ty
+    comp = soup.find("div", class_=lambda x: x and "drWnZq" in x)
+    if comp:
+        name = comp.find("a", class_=lambda x: x and "egZKeY" in x)
+        size = comp.find("span", class_=lambda x: x and "ePOHWr" in x)
+        if name:
+            job_fields["Tên công ty"] = name.get_text(strip=True)
+        if size:
+            job_fields["Quy mô công ty"] = size.get_text(strip=True)
+
+    job_fields["HREF"] = job_url
+    return job_fields
+
 # === NEW: Bóc chi tiết dạng streaming, ghi ra Excel ngay để nhẹ RAM ===
 def scrape_job_details_streaming_to_excel(job_links: List[str],
                                           out_xlsx_path: str,
                                           start_id: int = 1000001,
-                                          batch_size: int = 20) -> int:
+                                          batch_size: int = 20,
+                                          limiter: Optional[AIMDController] = None,
+                                          stats: Optional[Dict] = None,
+                                          progress: Optional[ProgressReporter] = None) -> int:
     """
     Bóc chi tiết từng link và GHI THẲNG ra Excel theo lô (batch_size) để giải phóng RAM ngay.
+    Việc ghi chạy ở thread nền (_BatchWriter) nên driver không phải chờ Excel; hàng đợi đầy thì chờ.
+    limiter: AIMD controller của pha chi tiết. Limit của nó quyết định số "làn" chạy thật (mỗi làn
+    1 Chrome, xem adaptive.run_lanes): server khoẻ -> mở thêm Chrome, bị chặn/chậm -> đóng bớt.
+    limiter=None -> 1 làn tuần tự như cũ.
+    stats: nếu truyền dict vào -> ghi số lần watchdog giết/thay driver.
+    Mỗi link có hạn chót URL_BUDGET_S: treo quá hạn thì driver bị giết & thay, batch vẫn chạy tiếp.
+    Nhiều làn: thứ tự dòng ghi ra có thể khác thứ tự link, ID vẫn = start_id + index.
     Trả về: tổng số job đã ghi.
     """
-    driver = create_driver()
-    wait = WebDriverWait(driver, 30)
-
+    writer = _BatchWriter(out_xlsx_path, sheet_name="jobs")
+    todo = deque(enumerate(job_links))
+    lock = threading.Lock()
     batch: List[Dict] = []
-    total_written = 0
-
-    try:
-        for index, job_url in enumerate(job_links):
-            print(f"\n[{index + 1}/{len(job_links)}] Đang xử lý: {job_url}")
-            try:
-                driver.get(job_url)
-                wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-                time.sleep(1.2)
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(0.8)
-                _click_expand_buttons(driver, max_clicks=20)
-                time.sleep(1.0)
-
-                benefits_text = _extract_benefits(driver)
-                soup = BeautifulSoup(driver.page_source, "html.parser")
-
-                job_fields = {
-                    "ID": start_id + index,
-                    "Tên công việc": _get_text_by_class(soup, "h1", "hAejeW"),
-                    "Lương": _get_text_by_class(soup, "span", "cVbwLK"),
-                    "Hết hạn": _get_text_by_class(soup, "span", "ePOHWr", 0),
-                    "Lượt xem": _get_text_by_class(soup, "span", "ePOHWr", 1),
-                    "Địa điểm tuyển dụng": _get_text_by_class(soup, "span", "ePOHWr", 2),
-                }
-
-                # Section mô tả
-                description_sections = soup.find_all("div", class_=lambda x: x and "gDSEwb" in x)
-                for section in description_sections:
-                    title_tag = section.find("h2", class_=lambda x: x and "cjuZti" in x)
-                    content_tag = section.find("div", class_=lambda x: x and "dVvinc" in x)
-                    if title_tag and content_tag:
-                        title = title_tag.get_text(strip=True)
-                        content = content_tag.get_text(separator="\n", strip=True)
-                        job_fields[title] = content
-
-                # Phúc lợi
-                job_fields["Phúc lợi"] = benefits_text
-
-                # Cặp Label/Value
-                job_info_section = soup.find("div", class_=lambda x: x and "dHvFzj" in x)
-                if job_info_section:
-                    info_items = job_info_section.find_all("div", class_=lambda x: x and "JtIju" in x)
-                    for item in info_items:
-                        label_tag = item.find("label", class_=lambda x: x and "dfyRSX" in x)
-                        value_tag = item.find("p", class_=lambda x: x and "cLLblL" in x)
-                        if label_tag and value_tag:
-                            job_fields[label_tag.get_text(strip=True)] = value_tag.get_text(strip=True)
-
-                # Địa điểm làm việc
-                loc = soup.find("div", class_=lambda x: x and "bAqPjv" in x)
-                if loc:
-                    val = loc.find("p", class_=lambda x: x and "cLLblL" in x)
-                    if val:
-                        job_fields["Địa điểm làm việc"] = val.get_text(strip=True)
-
-                # Công ty
-                comp = soup.find("div", class_=lambda x: x and "drWnZq" in x)
-                if comp:
-                    name = comp.find("a", class_=lambda x: x and "egZKeY" in x)
-                    size = comp.find("span", class_=lambda x: x and "ePOHWr" in x)
-                    if name:
-                        job_fields["Tên công ty"] = name.get_text(strip=True)
-                    if size:
-                        job_fields["Quy mô công ty"] = size.get_text(strip=True)
-
-                job_fields["HREF"] = job_url
-
-                # Dồn vào batch
+    lanes: Dict[int, DriverWatchdog] = {}
+    wd_stats: Dict[str, int] = {}
+    state = {"done": 0, "rss_peak_mb": 0.0}
+
+    def _next():
+        with lock:
+            return todo.popleft() if todo else None
+
+    def _open(i: int) -> DriverWatchdog:
+        wd = DriverWatchdog(create_driver, URL_BUDGET_S, name=f"detail-{i}")
+        with lock:
+            lanes[i] = wd
+        return wd
+
+    def _close(wd: DriverWatchdog) -> None:
+        # RAM đo lúc đang mở nhiều Chrome nhất (tổng các làn còn sống)
+        _measure_rss()
+        wd.quit()
+        with lock:
+            for k, v in wd.stats().items():
+                wd_stats[k] = wd_stats.get(k, 0) + v
+            lanes.pop(next((i for i, w in lanes.items() if w is wd), None), None)
+
+    def _measure_rss() -> None:
+        with lock:
+            drivers = [w.driver for w in lanes.values()]
+        total = sum(driver_tree_rss_mb(d) for d in drivers)
+        with lock:
+            state["rss_peak_mb"] = max(state["rss_peak_mb"], total)
+
+    def _work(wd: DriverWatchdog, item) -> None:
+        nonlocal batch
+        index, job_url = item
+        print(f"\n[{index + 1}/{len(job_links)}] Đang xử lý: {job_url}")
+        try:
+            with wd.deadline(job_url) as driver:
+                with gate(limiter) as slot:
+                    driver.get(job_url)
+                    WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+                    slot.outcome = classify_page(driver.title) or slot.outcome
+                benefits_text, soup = _expand_and_capture(driver)
+
+            job_fields = _parse_job_fields(soup, benefits_text, start_id + index, job_url)
+            full = None
+            with lock:
                 batch.append(job_fields)
-
                 # Đủ lô -> ghi ra file & dọn RAM
                 if len(batch) >= batch_size:
-                    _append_batch_to_excel(out_xlsx_path, batch, sheet_name="jobs")
-                    total_written += len(batch)
-                    batch.clear()
-                    del soup, job_fields, benefits_text
-                    gc.collect()
-
-            except Exception as e:
-                print(f"  ❌ Lỗi khi xử lý link: {e}")
-                # tiếp tục link sau
-
+                    full, batch = batch, []   # thread nền ghi; list mới cho lô sau
+            if full is not None:
+                _measure_rss()
+                writer.submit(full)
+                _maybe_gc()
+
+        except UrlDeadlineExceeded as e:
+            print(f"  ⏱️ [WATCHDOG] {e}")
+            # driver mới đã sẵn sàng -> tiếp tục link sau
+        except Exception as e:
+            print(f"  ❌ Lỗi khi xử lý link: {e}")
+            # tiếp tục link sau
+        if progress is not None:
+            with lock:
+                state["done"] += 1
+                done = state["done"]
+            progress.update(done=done)
+
+    peak_lanes = 0
+    try:
+        peak_lanes = run_lanes(limiter, _next, _work, open_lane=_open, close_lane=_close, name="detail")
     finally:
-        driver.quit()
-
-    # Flush phần còn lại
-    if batch:
-        _append_batch_to_excel(out_xlsx_path, batch, sheet_name="jobs")
-        total_written += len(batch)
-        batch.clear()
-        gc.collect()
-
-    print(f"[DETAIL][STREAM] Đã ghi {total_written} job vào: {out_xlsx_path}")
+        for wd in list(lanes.values()):
+            _close(wd)
+        if progress is not None:
+            progress.finish()
+        # Flush phần còn lại rồi chờ thread ghi xong (close() ném lỗi nếu có batch ghi hỏng)
+        writer.submit(batch)
+        try:
+            total_written = writer.close()
+        finally:
+            if stats is not None:
+                stats.update(wd_stats)
+                stats.update(writer.stats())
+        if stats is not None:
+            # 1 Chrome = 1 trang đồng thời -> RSS/trang = RSS đỉnh / số Chrome mở cùng lúc
+            stats.update({"mode": "drivers", "concurrent_pages": peak_lanes,
+                          "rss_peak_mb": round(state["rss_peak_mb"], 1),
+                          "rss_per_page_mb": round(state["rss_peak_mb"] / max(1, peak_lanes), 1)})
+
+    print(f"[DETAIL][STREAM] Đã ghi {total_written} job vào: {out_xlsx_path} (tối đa {peak_lanes} Chrome đồng thời)")
     return total_written
 
+# === Chế độ ĐA TAB: nhiều trang tải song song trong MỘT tiến trình Chrome ===
+def scrape_job_details_tabs_to_excel(job_links: List[str],
+                                     out_xlsx_path: str,
+                                     start_id: int = 1000001,
+                                     batch_size: int = 20,
+                                     n_tabs: int = 4,
+                                     limiter: Optional[AIMDController] = None,
+                                     stats: Optional[Dict] = None,
+                                     progress: Optional[ProgressReporter] = None) -> int:
+    """
+    Giống scrape_job_details_streaming_to_excel (cùng cột, cùng ID = start_id + index) nhưng dùng
+    n_tabs tab của 1 Chrome thay vì nhiều Chrome:
+    - Giao URL cho tab rảnh bằng `window.location` (không chặn) -> các tab tải mạng song song.
+    - Quét vòng các tab (switch_to.window): tab nào readyState=complete đủ lâu thì cuộn/mở rộng/bóc.
+    - Tab quá URL_BUDGET_S bị dừng (window.stop) và bỏ qua; cả Chrome treo -> watchdog thay driver,
+      các URL đang bay được đưa lại hàng đợi (tối đa 2 lần).
+    Thứ tự dòng ghi ra có thể khác thứ tự link (tab nào xong trước ghi trước), ID vẫn theo index.
+    """
+    wd = DriverWatchdog(lambda: create_driver(page_load_strategy="none"), URL_BUDGET_S, name="detail-tabs")
+    writer = _BatchWriter(out_xlsx_path, sheet_name="jobs")
+    pending = deque((index, url, 0) for index, url in enumerate(job_links))
+    in_flight: Dict[str, Dict] = {}    # window handle -> {index, url, tries, t0, ready_at, epoch}
+    batch: List[Dict] = []
+    total_written = 0
+    max_concurrent = 0
+    rss_peak_mb = 0.0
+
+    def _open_tabs(driver) -> List[str]:
+        handles = [driver.current_window_handle]
+        while len(handles) < max(1, n_tabs):
+            driver.switch_to.new_window("tab")
+            handles.append(driver.current_window_handle)
+        return handles
+
+    def _release(tab: Dict, outcome: str) -> None:
+        if limiter is not None and tab.get("epoch") is not None:
+            limiter.release(time.monotonic() - tab["t0"], outcome, tab["epoch"])
+            tab["epoch"] = None
+
+    idle = _open_tabs(wd.driver)
+    try:
+        while pending or in_flight:
+            progressed = False
+            try:
+                with wd.deadline(f"{len(in_flight)} tab đang tải") as driver:
+                    # 1) Giao URL cho các tab rảnh (AIMD quyết định được mở thêm bao nhiêu trang)
+                    while idle and pending:
+                        epoch = limiter.try_acquire() if limiter is not None else 0
+                        if epoch is None:
+                            break
+                        index, url, tries = pending.popleft()
+                        handle = idle.pop()
+                        driver.switch_to.window(handle)
+                        driver.execute_script("window.location.href = arguments[0];", url)
+                        in_flight[handle] = {"index": index, "url": url, "tries": tries,
+                                             "t0": time.monotonic(), "ready_at": None, "epoch": epoch}
+                        print(f"\n[{index + 1}/{len(job_links)}] [TAB] Đang tải: {url}")
+                    max_concurrent = max(max_concurrent, len(in_flight))
+
+                    # 2) Quét các tab đang bay
+                    for handle, tab in list(in_flight.items()):
+                        driver.switch_to.window(handle)
+                        now = time.monotonic()
+                        state = driver.execute_script("return document.readyState")
+                        if state != "complete":
+                            if now - tab["t0"] > URL_BUDGET_S:
+                                print(f"  ⏱️ [TAB] Quá {URL_BUDGET_S:g}s: {tab['url']} -> bỏ qua")
+                                driver.execute_script("window.stop();")
+                                _release(tab, TIMEOUT)
+                                del in_flight[handle]
+                                idle.append(handle)
+                                progressed = True
+                                if progress is not None:
+                                    progress.update(inc=1)
+                            continue
+                        if tab["ready_at"] is None:
+                            tab["ready_at"] = now
+                            _release(tab, classify_page(driver.title) or "ok")
+                        # Chờ ổn định 1.2s (như chế độ 1 tab) nhưng không chặn các tab khác
+                        if now - tab["ready_at"] < 1.2:
+                            continue
+                        try:
+                            benefits_text, soup = _expand_and_capture(driver, settle_s=0)
+                            batch.append(_parse_job_fields(soup, benefits_text, start_id + tab["index"], tab["url"]))
+                            del soup, benefits_text
+                        except Exception as e:
+                            print(f"  ❌ Lỗi khi xử lý link: {tab['url']}: {e}")
+                        del in_flight[handle]
+                        idle.append(handle)
+                        progressed = True
+                        if progress is not None:
+                            progress.update(inc=1)
+
+                    # Đo RAM của cả cây Chrome khi đang có nhiều trang mở
+                    if in_flight:
+                        rss_peak_mb = max(rss_peak_mb, driver_tree_rss_mb(driver))
+
+            except UrlDeadlineExceeded as e:
+                # Cả Chrome bị thay: đưa các URL đang bay về lại hàng đợi, mở lại tab trên driver mới
+                print(f"  ⏱️ [WATCHDOG] {e}")
+                for tab in in_flight.values():
+                    _release(tab, TIMEOUT)
+                    if tab["tries"] < 1:
+                        pending.appendleft((tab["index"], tab["url"], tab["tries"] + 1))
+                    elif progress is not None:
+                        progress.update(inc=1)   # bỏ hẳn URL này
+                in_flight.clear()
+                idle = _open_tabs(wd.driver)
+                continue
+
+            # Đủ lô -> ghi ra file & dọn RAM
+            if len(batch) >= batch_size:
+                writer.submit(batch)
+                batch = []
+                _maybe_gc()
+
+            if not progressed:
+                time.sleep(0.2)
 
-
-if __name__ == "__main__":
-    # ==== THAM SỐ CHUNG ====
-    LOCATION_CODE = r"1001"
-    LIST_OUT_DIR = str((_OUTPUT_ROOT / "jobslist").resolve())
-    DETAIL_OUT_DIR = str((_OUTPUT_ROOT / "jobsdetail").resolve())
-    MAX_PAGES = 0
-    DELAY = 1.0
-    NO_GAIN_PATIENCE = 2
-    START_ID_BASE = 1000001
-    ID_STEP_PER_GROUP = 1000000
-
-    run_ts = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-
-    os.makedirs(LIST_OUT_DIR, exist_ok=True)
-    os.makedirs(DETAIL_OUT_DIR, exist_ok=True)
-
-    summary = []
-
-    for idx, (group_name, gid) in enumerate(VNWORKS_GROUPS.items(), start=0):
+    finally:
+        for tab in in_flight.values():
+            _release(tab, "error")
+        wd.quit()
+        if progress is not None:
+            progress.finish()
+        writer.submit(batch)
         try:
-            print("\n" + "="*80)
-            print(f"[{idx+1}/{len(VNWORKS_GROUPS)}] NGÀNH: {group_name} (g={gid})")
-
-            # 1) Crawl danh sách link
-            rows = get_vietnamworks_jobs_by_group(
-                group_id=gid,
-                group_name=group_name,
-                max_pages=MAX_PAGES,
-                delay=DELAY,
-                no_gain_patience=NO_GAIN_PATIENCE,
-            )
+            total_written = writer.close()
+        finally:
+            if stats is not None:
+                stats.update(wd.stats())
+                stats.update(writer.stats())
+        if stats is not None:
+            stats.update({
+                "mode": "tabs",
+                "concurrent_pages": max_concurrent,
+                "rss_peak_mb": round(rss_peak_mb, 1),
+                "rss_per_page_mb": round(rss_peak_mb / max_concurrent, 1) if max_concurrent else None,
+            })
+
+    print(f"[DETAIL][TABS] Đã ghi {total_written} job vào: {out_xlsx_path} "
+          f"(tối đa {max_concurrent} tab đồng thời, RSS đỉnh ~{rss_peak_mb:.0f} MB)")
+    return total_written
 
-            # 2) Lưu danh sách (list) -> output/jobslist
-            list_path = save_group_to_excel(
-                rows=rows,
-                group_name=group_name,
-                location_code=LOCATION_CODE,
-                out_dir=LIST_OUT_DIR
-            )
 
-            # Dọn RAM của list ngay sau khi lưu
-            links = [r["href"] for r in rows if r.get("href")]
-            del rows
-            gc.collect()
 
-            # 3) Bóc chi tiết -> ghi STREAMING ra output/jobsdetail
-            name_slug = slugify_vn(group_name)
-            start_id = START_ID_BASE + idx * ID_STEP_PER_GROUP
-            detail_filename = f"job_detail_output_{name_slug}_g{gid}_{LOCATION_CODE}_{run_ts}.xlsx"
-            detail_path = os.path.join(DETAIL_OUT_DIR, detail_filename)
 
-            if links:
-                print(f"[DETAIL] Bắt đầu bóc chi tiết {len(links)} link cho ngành '{group_name}'...")
-                # === CHANGED TO STREAMING ===
-                n_written = scrape_job_details_streaming_to_excel(
+# ===================== PHẦN 4: Điều phối crawl theo kế hoạch =====================
+# ==== THAM SỐ CHUNG ====
+LOCATION_CODE = r"1001"
+LIST_OUT_DIR = str((_OUTPUT_ROOT / "jobslist").resolve())
+DETAIL_OUT_DIR = str((_OUTPUT_ROOT / "jobsdetail").resolve())
+TELEMETRY_DIR = _OUTPUT_ROOT / "telemetry"   # báo cáo kế hoạch/coverage của từng lần chạy (JSON)
+MAX_PAGES = 0
+DELAY = 1.0
+NO_GAIN_PATIENCE = 2
+START_ID_BASE = 1000001
+ID_STEP_PER_GROUP = 1000000
+# Số worker chia ngành (mỗi worker crawl tuần tự các ngành của mình). t3.small (2 GB) nên để 1–2.
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "1"))
+# Trần số trang đồng thời của mỗi pha (tổng mọi worker). Limit AIMD quyết định số làn/Chrome thật sự chạy,
+# chia đều cho các worker; mỗi làn drivers ~ 1 Chrome -> máy yếu nên hạ xuống 2.
+CRAWL_MAX_CONCURRENCY = int(os.getenv("CRAWL_MAX_CONCURRENCY", "4"))
+# CRAWL_MODE=tabs: pha chi tiết dùng CRAWL_TABS tab trong 1 Chrome/worker thay vì 1 Chrome = 1 trang
+CRAWL_MODE = os.getenv("CRAWL_MODE", "drivers").strip().lower()
+CRAWL_TABS = int(os.getenv("CRAWL_TABS", "4"))
+# CRAWL_PLAN=0 để tắt bước lập kế hoạch (quay về dừng theo no_gain_patience như cũ)
+CRAWL_PLAN = os.getenv("CRAWL_PLAN", "1") != "0"
+# Trang 1 planner đã tải được listing dùng lại nếu chưa cũ quá ngần này (giây); cũ hơn -> tải lại trang 1
+CRAWL_FIRST_PAGE_TTL_S = float(os.getenv("CRAWL_FIRST_PAGE_TTL_S", "1800"))
+# AIMD: bắt đầu từ CRAWL_AIMD_INITIAL trang đồng thời, tăng dần tới CRAWL_MAX_CONCURRENCY khi p95/lỗi còn khoẻ
+CRAWL_AIMD_INITIAL = int(os.getenv("CRAWL_AIMD_INITIAL", "1"))
+CRAWL_P95_TARGET_LIST_S = float(os.getenv("CRAWL_P95_TARGET_LIST_S", "20"))
+CRAWL_P95_TARGET_DETAIL_S = float(os.getenv("CRAWL_P95_TARGET_DETAIL_S", "15"))
+CRAWL_MAX_ERROR_RATE = float(os.getenv("CRAWL_MAX_ERROR_RATE", "0.1"))
+
+def crawl_one_group(idx: int, group_name: str, gid: int, run_ts: str, plan: Optional[Dict] = None,
+                    limiters: Optional[Dict[str, AIMDController]] = None) -> Dict:
+    """
+    Crawl trọn 1 ngành: listing → lưu list → bóc chi tiết (streaming).
+    Trả về bản ghi coverage: kỳ vọng (theo kế hoạch) vs thực tế (link/dòng chi tiết thu được).
+    """
+    plan = plan or {}
+    limiters = limiters or {}
+    t_group = time.time()
+    rec = {
+        "group_name": group_name,
+        "group_id": gid,
+        "expected_jobs": plan.get("total_jobs"),
+        "planned_pages": plan.get("planned_pages"),
+        "pages_fetched": None,
+        "stop_reason": None,
+        "n_links": 0,
+        "n_detail": 0,
+        "list_path": None,
+        "detail_path": None,
+        "error": None,
+        "concurrency_at_end": None,
+        "watchdog_kills": 0,
+        "memory": None,
+        "writer_blocked_s": None,
+    }
+    try:
+        print("\n" + "="*80)
+        print(f"[{idx+1}/{len(VNWORKS_GROUPS)}] NGÀNH: {group_name} (g={gid})")
+
+        # 1) Crawl danh sách link. Kế hoạch chỉ dùng để dừng sớm (đủ tổng job) + ước lượng tiến độ;
+        #    giới hạn trang vẫn là MAX_PAGES / no_gain_patience -> job đăng sau lúc lập kế hoạch không bị cắt.
+        #    Trang 1 planner vừa tải (còn mới) được dùng lại thay vì tải lần nữa.
+        first_page = plan.get("first_page") or {}
+        reuse_first = bool(first_page) and time.time() - first_page.get("at", 0) <= CRAWL_FIRST_PAGE_TTL_S
+        list_stats: Dict = {}
+        rows = get_vietnamworks_jobs_by_group(
+            group_id=gid,
+            group_name=group_name,
+            max_pages=MAX_PAGES,
+            delay=DELAY,
+            no_gain_patience=NO_GAIN_PATIENCE,
+            expected_total=plan.get("total_jobs") or 0,
+            stats=list_stats,
+            limiter=limiters.get("listing"),
+            progress=ProgressReporter("scraper", "listing", total=plan.get("planned_pages") or MAX_PAGES or None,
+                                      group=group_name, group_id=gid, unit="page"),
+            first_page_hrefs=first_page.get("hrefs") if reuse_first else None,
+        )
+        rec["pages_fetched"] = list_stats.get("pages_fetched")
+        rec["stop_reason"] = list_stats.get("stop_reason")
+        rec["watchdog_kills"] += list_stats.get("watchdog_kills", 0)
+
+        # 2) Lưu danh sách (list) -> output/jobslist
+        rec["list_path"] = save_group_to_excel(
+            rows=rows,
+            group_name=group_name,
+            location_code=LOCATION_CODE,
+            out_dir=LIST_OUT_DIR
+        )
+
+        # Dọn RAM của list ngay sau khi lưu
+        links = [r["href"] for r in rows if r.get("href")]
+        rec["n_links"] = len(links)
+        del rows
+        _maybe_gc()
+
+        # 3) Bóc chi tiết -> ghi STREAMING ra output/jobsdetail
+        name_slug = slugify_vn(group_name)
+        start_id = START_ID_BASE + idx * ID_STEP_PER_GROUP
+        detail_filename = f"job_detail_output_{name_slug}_g{gid}_{LOCATION_CODE}_{run_ts}{frames.interchange_suffix()}"
+        detail_path = os.path.join(DETAIL_OUT_DIR, detail_filename)
+        rec["detail_path"] = detail_path
+
+        if links:
+            detail_stats: Dict = {}
+            detail_progress = ProgressReporter("scraper", "detail", total=len(links), group=group_name,
+                                               group_id=gid, unit="job")
+            print(f"[DETAIL] Bắt đầu bóc chi tiết {len(links)} link cho ngành '{group_name}'...")
+            # === CHANGED TO STREAMING ===
+            if CRAWL_MODE == "tabs":
+                n_written = scrape_job_details_tabs_to_excel(
                     job_links=links,
                     out_xlsx_path=detail_path,
                     start_id=start_id,
-                    batch_size=20  # có thể tăng/giảm; 10–50 là hợp lý cho t3.small
+                    batch_size=20,
+                    n_tabs=CRAWL_TABS,
+                    limiter=limiters.get("detail"),
+                    stats=detail_stats,
+                    progress=detail_progress,
                 )
             else:
-                print(f"[DETAIL][WARN] Ngành '{group_name}' không có link nào. Tạo file chi tiết rỗng.")
-                # tạo file Excel rỗng với header tối thiểu
-                _append_batch_to_excel(detail_path, [], sheet_name="jobs")
-                n_written = 0
+                n_written = scrape_job_details_streaming_to_excel(
+                    job_links=links,
+                    out_xlsx_path=detail_path,
+                    start_id=start_id,
+                    batch_size=20,  # có thể tăng/giảm; 10–50 là hợp lý cho t3.small
+                    limiter=limiters.get("detail"),
+                    stats=detail_stats,
+                    progress=detail_progress,
+                )
+            rec["memory"] = {k: detail_stats.get(k) for k in ("mode", "concurrent_pages", "rss_peak_mb", "rss_per_page_mb")}
+            rec["writer_blocked_s"] = detail_stats.get("writer_blocked_s")   # >0 nhiều: ghi chậm hơn bóc -> tăng CRAWL_WRITER_QUEUE
+            rec["watchdog_kills"] += detail_stats.get("watchdog_kills", 0)
+        else:
+            print(f"[DETAIL][WARN] Ngành '{group_name}' không có link nào. Tạo file chi tiết rỗng.")
+            # tạo file chi tiết rỗng (bảng rỗng)
+            _discard_partial_detail(detail_path)
+            _finalize_detail_file(detail_path)
+            n_written = 0
+        rec["n_detail"] = n_written
+        rec["concurrency_at_end"] = {k: c.current for k, c in limiters.items()}
+        artifacts.register(detail_path, "detail", rows=n_written)
+        # Báo cho orchestrator: file chi tiết của ngành này đã đầy đủ -> có thể preprocess/analyze ngay
+        emit_event("group_done", group_id=gid, group_name=group_name,
+                   detail_path=detail_path, n_detail=n_written, n_links=rec["n_links"],
+                   started_at=round(t_group, 3), elapsed_s=round(time.time() - t_group, 2))
+
+        # Sau khi ghi, dọn các biến tạm
+        del links
+        _maybe_gc()
+
+    except Exception as e:
+        print(f"[ERROR] Lỗi ở ngành '{group_name}' (g={gid}): {e}")
+        rec["error"] = str(e)
+        emit_event("group_failed", group_id=gid, group_name=group_name, error=str(e),
+                   started_at=round(t_group, 3), elapsed_s=round(time.time() - t_group, 2))
+        _maybe_gc()
+    return rec
+
+def _coverage_pct(actual: int, expected: Optional[int]) -> Optional[float]:
+    if not expected:
+        return None
+    return round(actual / expected * 100, 1)
+
+def _memory_summary(records: List[Dict]) -> Dict:
+    """RSS/trang đồng thời của pha chi tiết: so sánh CRAWL_MODE=tabs với nhiều Chrome (drivers) qua các lần chạy."""
+    mems = [r["memory"] for r in records if r.get("memory") and r["memory"].get("rss_per_page_mb")]
+    if not mems:
+        return {"mode": CRAWL_MODE, "rss_per_page_mb": None}
+    return {
+        "mode": CRAWL_MODE,
+        "tabs_per_worker": CRAWL_TABS if CRAWL_MODE == "tabs" else 1,
+        "rss_peak_mb": max(m["rss_peak_mb"] for m in mems),
+        "rss_per_page_mb": round(sum(m["rss_per_page_mb"] for m in mems) / len(mems), 1),
+    }
+
+def write_run_report(run_ts: str, plans: Dict[int, Dict], records: List[Dict], n_workers: int,
+                     limiters: Optional[Dict[str, AIMDController]] = None) -> Path:
+    """Ghi báo cáo kỳ vọng vs thực tế của lần chạy ra output/telemetry/crawl_run_<run_ts>.json."""
+    TELEMETRY_DIR.mkdir(parents=True, exist_ok=True)
+    expected_total = sum(r["expected_jobs"] or 0 for r in records)
+    report = {
+        "run_ts": run_ts,
+        "workers": n_workers,
+        "planned_groups": sum(1 for p in plans.values() if p.get("total_jobs") is not None),
+        "expected_jobs": expected_total,
+        "listed_links": sum(r["n_links"] for r in records),
+        "detail_rows": sum(r["n_detail"] for r in records),
+        "planned_pages": sum(r["planned_pages"] or 0 for r in records),
+        "pages_fetched": sum(r["pages_fetched"] or 0 for r in records),
+        "watchdog_kills": sum(r["watchdog_kills"] for r in records),
+        "concurrency": {k: c.snapshot() for k, c in (limiters or {}).items()},
+        "memory": _memory_summary(records),
+        "groups": [
+            dict(r,
+                 link_coverage_pct=_coverage_pct(r["n_links"], r["expected_jobs"]),
+                 detail_coverage_pct=_coverage_pct(r["n_detail"], r["expected_jobs"]))
+            for r in records
+        ],
+    }
+    report["link_coverage_pct"] = _coverage_pct(report["listed_links"], expected_total)
+    report["detail_coverage_pct"] = _coverage_pct(report["detail_rows"], expected_total)
+    out = TELEMETRY_DIR / f"crawl_run_{run_ts}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return out
+
+def main():
+    # Orchestrator tiếp tục lần chạy dở: dùng lại timestamp cũ (tên file khớp) và bỏ các ngành đã xong
+    run_ts = os.getenv("CRAWL_RUN_TS") or datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    skip_gids = {int(g) for g in os.getenv("CRAWL_SKIP_GROUPS", "").split(",") if g.strip()}
+    # Orchestrator chạy tác vụ theo ngành: chỉ crawl các group_id này (rỗng = mọi ngành)
+    only_gids = {int(g) for g in os.getenv("CRAWL_GROUP_IDS", "").split(",") if g.strip()}
 
-            # Sau khi ghi, dọn các biến tạm
-            del links
-            gc.collect()
+    os.makedirs(LIST_OUT_DIR, exist_ok=True)
+    os.makedirs(DETAIL_OUT_DIR, exist_ok=True)
 
-            summary.append((group_name, list_path, detail_path, None, n_written))
+    groups_todo = {name: gid for name, gid in VNWORKS_GROUPS.items()
+                   if gid not in skip_gids and (not only_gids or gid in only_gids)}
+    if skip_gids:
+        print(f"[RESUME] run_ts={run_ts}: bỏ qua {len(VNWORKS_GROUPS) - len(groups_todo)} ngành đã crawl xong, "
+              f"còn {len(groups_todo)}")
+    if not groups_todo:
+        print("[RESUME] Không còn ngành nào cần crawl.")
+        return
 
-        except Exception as e:
-            print(f"[ERROR] Lỗi ở ngành '{group_name}' (g={gid}): {e}")
-            gc.collect()
+    # ==== 0) LẬP KẾ HOẠCH: đọc tổng job từng ngành → số trang chính xác ====
+    plans: Dict[int, Dict] = plan_crawl(groups_todo) if CRAWL_PLAN else {}
+    # Orchestrator dùng để tính tiến độ/ETA toàn lần crawl
+    emit_event("crawl_plan", run_ts=run_ts, n_groups=len(groups_todo),
+               expected_jobs=sum((plans.get(g) or {}).get("total_jobs") or 0 for g in groups_todo.values()) or None)
+
+    # ==== 1) CHIA NGÀNH CHO CÁC WORKER theo khối lượng kế hoạch ====
+    gid_to_idx = {gid: idx for idx, gid in enumerate(VNWORKS_GROUPS.values())}
+    gid_to_name = {gid: name for name, gid in VNWORKS_GROUPS.items()}
+    buckets = allocate_groups_to_workers(list(groups_todo.values()), plans, CRAWL_WORKERS)
+
+    # ==== 2) AIMD: mỗi pha 1 controller, dùng chung giữa các worker ====
+    #      limit chia đều cho len(buckets) worker (share) -> mỗi worker mở ceil(limit / workers) làn
+    #      (chế độ đa tab: pha chi tiết không vượt quá workers × CRAWL_TABS tab đang có)
+    max_conc = max(1, CRAWL_MAX_CONCURRENCY)
+    detail_cap = min(max_conc, len(buckets) * max(1, CRAWL_TABS)) if CRAWL_MODE == "tabs" else max_conc
+    limiters = {
+        phase: AIMDController(
+            phase,
+            initial=min(CRAWL_AIMD_INITIAL, cap),
+            max_limit=cap,
+            p95_target_s=target,
+            max_error_rate=CRAWL_MAX_ERROR_RATE,
+            share=len(buckets),
+        )
+        for phase, cap, target in (("listing", max_conc, CRAWL_P95_TARGET_LIST_S),
+                                   ("detail", detail_cap, CRAWL_P95_TARGET_DETAIL_S))
+    }
+
+    def _run_bucket(bucket: List[int]) -> List[Dict]:
+        return [crawl_one_group(gid_to_idx[g], gid_to_name[g], g, run_ts, plans.get(g), limiters) for g in bucket]
+
+    records: List[Dict] = []
+    if len(buckets) == 1:
+        records = _run_bucket(buckets[0])
+    else:
+        with ThreadPoolExecutor(max_workers=len(buckets), thread_name_prefix="crawl") as ex:
+            for recs in ex.map(_run_bucket, buckets):
+                records.extend(recs)
+    records.sort(key=lambda r: gid_to_idx[r["group_id"]])
 
     # ==== TỔNG KẾT ====
     print("\n" + "="*80)
     print("[SUMMARY]")
-    for (group_name, list_path, detail_path, n_list, n_detail) in summary:
-        print(f"- {group_name}: list=(saved) {list_path} | detail={n_detail} rows ({detail_path})")
+    for r in records:
+        if r["error"]:
+            print(f"- {r['group_name']}: LỖI ({r['error']})")
+            continue
+        print(f"- {r['group_name']}: list=(saved) {r['list_path']} | detail={r['n_detail']} rows ({r['detail_path']})")
+
+    print("\n[COVERAGE] kỳ vọng vs thực tế")
+    for r in records:
+        print(f"- {r['group_name']}: expected={r['expected_jobs']} links={r['n_links']} "
+              f"detail={r['n_detail']} ({_coverage_pct(r['n_detail'], r['expected_jobs'])}%) | "
+              f"pages {r['pages_fetched']}/{r['planned_pages']} stop={r['stop_reason']} "
+              f"watchdog_kills={r['watchdog_kills']}")
+    for phase, ctrl in limiters.items():
+        snap = ctrl.snapshot()
+        print(f"[AIMD][{phase}] limit cuối={snap['limit']} peak={snap['peak_limit']} outcomes={snap['outcomes']}")
+    mem = _memory_summary(records)
+    print(f"[MEMORY] mode={mem['mode']} RSS/trang đồng thời ~{mem['rss_per_page_mb']} MB "
+          f"(so với mode khác: xem output/telemetry/crawl_run_*.json)")
+    report_path = write_run_report(run_ts, plans, records, len(buckets), limiters)
+    print(f"[COVERAGE] Báo cáo: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# ===========================================================
+# MỤC ĐÍCH TỆP: WATCHDOG HẠN CHÓT CHO TỪNG URL
+#
+# - set_page_load_timeout / WebDriverWait không chặn được mọi kiểu treo
+#   (chromedriver kẹt, renderer treo, JS vòng lặp...). Khi đó lệnh Selenium
+#   có thể đứng hàng phút, kéo theo cả worker.
+# - DriverWatchdog đặt 1 "đồng hồ" cho tổng thời gian xử lý 1 URL. Hết giờ mà
+#   URL chưa xong -> GIẾT cả cây tiến trình chromedriver/chrome: lệnh Selenium
+#   đang kẹt sẽ ném lỗi ngay, sau đó watchdog tạo driver mới để chạy tiếp phần
+#   còn lại của batch.
+# ===========================================================
+import os
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Callable, List
+
+try:
+    import psutil
+except ImportError:  # không có psutil: chỉ giết được tiến trình chromedriver (chrome con có thể sót)
+    psutil = None
+
+
+class UrlDeadlineExceeded(Exception):
+    """URL vượt quá ngân sách thời gian; driver đã bị giết và thay mới."""
+
+
+def _driver_pids(driver) -> List[int]:
+    """PID của chromedriver + toàn bộ chrome con (renderer, gpu, ...)."""
+    try:
+        root_pid = driver.service.process.pid
+    except Exception:
+        return []
+    pids = [root_pid]
+    if psutil is not None:
+        try:
+            pids += [c.pid for c in psutil.Process(root_pid).children(recursive=True)]
+        except Exception:
+            pass
+    return pids
+
+
+def driver_tree_rss_mb(driver) -> float:
+    """Tổng RSS (MB) của chromedriver + chrome con; 0 nếu không đo được (không có psutil)."""
+    if psutil is None:
+        return 0.0
+    total = 0
+    for pid in _driver_pids(driver):
+        try:
+            total += psutil.Process(pid).memory_info().rss
+        except Exception:
+            pass
+    return total / (1024 * 1024)
+
+
+def kill_driver_tree(driver) -> int:
+    """SIGKILL cả cây tiến trình của driver. Trả về số tiến trình đã giết."""
+    killed = 0
+    for pid in reversed(_driver_pids(driver)):   # con trước, cha sau
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return killed
+
+
+class DriverWatchdog:
+    """
+    Giữ 1 driver và áp hạn chót cho từng URL:
+
+        wd = DriverWatchdog(create_driver, budget_s=90, name="detail")
+        with wd.deadline(url):
+            wd.driver.get(url)
+            ...
+        wd.quit()
+
+    Luôn dùng `wd.driver` (không giữ tham chiếu cũ) vì driver có thể đã được thay.
+    """
+
+    def __init__(self, factory: Callable[[], object], budget_s: float, name: str = "driver"):
+        self.factory = factory
+        self.budget_s = budget_s
+        self.name = name
+        self.driver = factory()
+        self.kills = 0          # số lần hết hạn phải giết driver
+        self.replacements = 0   # số lần tạo driver mới thành công
+        self._fired = threading.Event()
+
+    def _on_expire(self, url: str, driver) -> None:
+        self._fired.set()
+        n = kill_driver_tree(driver)
+        print(f"[WATCHDOG][{self.name}] Quá {self.budget_s:g}s cho {url} -> đã giết {n} tiến trình driver.")
+
+    def replace(self) -> None:
+        """Bỏ driver cũ (đã chết) và tạo driver mới."""
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        self.driver = self.factory()
+        self.replacements += 1
+
+    @contextmanager
+    def deadline(self, url: str):
+        if not self.budget_s or self.budget_s <= 0:
+            yield self.driver
+            return
+        self._fired.clear()
+        timer = threading.Timer(self.budget_s, self._on_expire, args=(url, self.driver))
+        timer.daemon = True
+        timer.start()
+        try:
+            yield self.driver
+        except Exception:
+            if not self._fired.is_set():
+                raise
+        finally:
+            timer.cancel()
+        # Tới đây: hoặc URL xong đúng hạn, hoặc watchdog đã giết driver (lỗi Selenium bị thay bằng lỗi rõ nghĩa)
+        if self._fired.is_set():
+            self.kills += 1
+            self.replace()
+            raise UrlDeadlineExceeded(f"{url} vượt {self.budget_s:g}s (driver đã được thay)")
+
+    def stats(self) -> dict:
+        return {"watchdog_kills": self.kills, "driver_replacements": self.replacements}
+
+    def quit(self) -> None:
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import gc
 import os
 import sys
 import time
@@ -8,13 +9,24 @@ import signal
 import logging
 import subprocess
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 import threading
-from typing import Set
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Set
 
+import psutil
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 
+from common import artifacts, frames
+from common.data_manifest import publish_manifest
+from common.events import parse_event
+from common.progress_board import ProgressBoard
+from common.run_ledger import RunInProgressError, RunLedger, format_report
+from common.warm_worker import WarmWorker
+from crawler.groups import VNWORKS_GROUPS
+
 # ====== ĐƯỜNG DẪN ======
 ROOT = Path(__file__).resolve().parent
 PY = sys.executable  # python hiện tại (trong venv)
@@ -22,10 +34,61 @@ SCRAPER = ROOT / "crawler" / "selenium_scraper.py"
 PREPROCESS = ROOT / "processor" / "preprocess.py"
 ANALYZER = ROOT / "processor" / "analyzer.py"
 OUTPUT_DIR = ROOT / "output"
+PREPROCESS_DIR = OUTPUT_DIR / "preprocess"
 LOG_DIR = ROOT / "logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# ====== HẠN CHÓT TỪNG BƯỚC (giây, 0 = không giới hạn) ======
+# Chromedriver treo có thể giữ scraper mãi -> quá hạn thì kill cả process group.
+SCRAPER_TIMEOUT_S = float(os.getenv("SCRAPER_TIMEOUT_S", str(8 * 3600)))
+PREPROCESS_TIMEOUT_S = float(os.getenv("PREPROCESS_TIMEOUT_S", str(2 * 3600)))
+ANALYZER_TIMEOUT_S = float(os.getenv("ANALYZER_TIMEOUT_S", str(2 * 3600)))
+# Bước không khai báo hạn chót (timeout=None) vẫn bị chặn ở mức này -> không bao giờ treo vô hạn
+STAGE_DEFAULT_TIMEOUT_S = float(os.getenv("STAGE_DEFAULT_TIMEOUT_S", str(12 * 3600)))
+# Hạn chót cho tác vụ của 1 ngành (chế độ grouped / pipelined, lệnh `main.py retry`)
+GROUP_CRAWL_TIMEOUT_S = float(os.getenv("GROUP_CRAWL_TIMEOUT_S", str(90 * 60)))
+GROUP_PREPROCESS_TIMEOUT_S = float(os.getenv("GROUP_PREPROCESS_TIMEOUT_S", str(30 * 60)))
+GROUP_ANALYZER_TIMEOUT_S = float(os.getenv("GROUP_ANALYZER_TIMEOUT_S", str(30 * 60)))
+
+# ====== THỬ LẠI TỪNG TÁC VỤ (1 ngành) ======
+TASK_RETRIES = int(os.getenv("TASK_RETRIES", "2"))                     # số lần thử lại sau lần đầu
+TASK_RETRY_BACKOFF_S = float(os.getenv("TASK_RETRY_BACKOFF_S", "30"))  # chờ 30s, 60s, 120s...
+
+# ====== CHẾ ĐỘ PIPELINE ======
+# sequential: scraper (mọi ngành) -> preprocess (mọi file) -> analyzer (mọi file)  [mặc định, như cũ]
+# pipelined : ngành nào crawl xong thì preprocess + analyze ngành đó NGAY, chồng lấn với crawl ngành sau
+# grouped   : mỗi ngành là 1 chuỗi tác vụ riêng crawl -> preprocess -> analyze (timeout + thử lại riêng);
+#             ngành lỗi không kéo cả lần chạy, chạy lại riêng bằng `python main.py retry`
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sequential").strip().lower()
+_active_mode = PIPELINE_MODE   # chế độ của lần chạy hiện tại (retry luôn chạy grouped)
+# Số ngành được preprocess/analyze đồng thời trong chế độ pipelined (t3.small: 1)
+PIPELINE_STAGE_WORKERS = int(os.getenv("PIPELINE_STAGE_WORKERS", "1"))
+# Số ngành chạy đồng thời trong chế độ grouped (mỗi ngành 1 scraper + Chrome riêng)
+GROUP_TASK_WORKERS = int(os.getenv("GROUP_TASK_WORKERS", "1"))
+
+# ====== CÁCH CHẠY PREPROCESS/ANALYZER ======
+# subprocess: mỗi bước 1 interpreter mới (như cũ)
+# warm      : 1 tiến trình worker sống lâu giữ sẵn pandas/torch/model embedding (scraper vẫn chạy subprocess)
+STAGE_RUNNER = os.getenv("STAGE_RUNNER", "subprocess").strip().lower()
+_warm_worker: Optional[WarmWorker] = None
+
+# ====== DỌN FILE CŨ ======
+# Sau mỗi lần chạy thành công: giữ ARTIFACT_KEEP bản mới nhất mỗi (loại, ngành) trong catalog, 0 = không dọn
+ARTIFACT_KEEP = int(os.getenv("ARTIFACT_KEEP", "3"))
+
+# ====== BỘ LẬP LỊCH THEO BỘ NHỚ (t3.small: 2 GB) ======
+# Mỗi loại tác vụ khai báo RAM dự kiến (MB); số đo thực tế (RSS cả cây tiến trình) sẽ nâng mức dự kiến
+# cho lần sau nếu lớn hơn. Tác vụ mới chỉ được chạy khi tổng cam kết + RAM trống còn cho phép.
+_CRAWL_WORKERS_ENV = int(os.getenv("CRAWL_WORKERS", "1"))
+STAGE_FOOTPRINT_MB: Dict[str, float] = {
+    "scraper": float(os.getenv("SCRAPER_FOOTPRINT_MB", str(200 + 400 * _CRAWL_WORKERS_ENV))),  # python + N Chrome
+    "preprocess": float(os.getenv("PREPROCESS_FOOTPRINT_MB", "450")),                          # pandas + openpyxl
+    "analyzer": float(os.getenv("ANALYZER_FOOTPRINT_MB", "900")),                              # + torch + model
+}
+MEM_BUDGET_MB = float(os.getenv("MEM_BUDGET_MB", "0")) or psutil.virtual_memory().total / 2**20 * 0.85
+MEM_MIN_FREE_MB = float(os.getenv("MEM_MIN_FREE_MB", "150"))
+
 # ====== LOGGING ======
 LOG_FILE = LOG_DIR / "main.log"
 logging.basicConfig(
@@ -98,18 +161,33 @@ def _reap_children_by_name(names=("chrome", "chromedriver", "Xvfb")):
         except Exception:
             pass
 
-def run_script(path: Path, name: str, timeout: float | None = None) -> None:
+def run_script(path: Path, name: str, timeout: float | None = None,
+               env_extra: Optional[Dict[str, str]] = None,
+               on_event: Optional[Callable[[Dict], None]] = None,
+               reap_orphans: bool = True,
+               on_start: Optional[Callable[[int], None]] = None) -> None:
     """
     Chạy file Python con:
     - Ghi log vào file + stream realtime ra terminal
     - Tạo process group để kill cả cây
-    - Thu dọn RAM/child processes sau khi xong
+    - Hết `timeout` giây mà chưa xong -> kill cả process group (kể cả khi con treo không in gì);
+      timeout=None -> STAGE_DEFAULT_TIMEOUT_S, chỉ timeout=0 mới là không giới hạn
+    - env_extra: biến môi trường bổ sung cho riêng lần chạy này (vd. PREPROCESS_INPUT)
+    - on_event: gọi ngay khi con in 1 dòng @@EVENT (xem common/events.py)
+    - on_start: nhận PID ngay sau khi khởi chạy (bộ lập lịch bộ nhớ dùng để đo RSS)
+    - Thu dọn RAM/child processes sau khi xong (reap_orphans=False khi còn script khác đang dùng Chrome)
     """
     log_path = LOG_DIR / f"{name}_{datetime.now():%Y%m%d_%H%M%S}.log"
+    if timeout is None:
+        timeout = STAGE_DEFAULT_TIMEOUT_S
 
     # môi trường unbuffered cho log tức thời
     env = os.environ.copy()
     env["PYTHONUNBUFFERED"] = "1"
+    # script con import được common.*, crawler.*, processor.* từ project root
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(ROOT), env.get("PYTHONPATH", "")) if p)
+    if env_extra:
+        env.update(env_extra)
 
     with open(log_path, "w", buffering=1) as lf:
         # -u để stdout/stderr không buffer
@@ -125,6 +203,22 @@ def run_script(path: Path, name: str, timeout: float | None = None) -> None:
 
         # PGID để kill cả cây sau này
         pgid = os.getpgid(proc.pid)
+        if on_start is not None:
+            on_start(proc.pid)
+
+        # readline() bên dưới chặn tới khi con in dòng mới -> proc.wait(timeout) sau vòng lặp không bao giờ
+        # kích hoạt nếu con treo. Dùng timer riêng: hết giờ thì kill group, stdout đóng, vòng lặp thoát.
+        timed_out = threading.Event()
+
+        def _on_timeout():
+            timed_out.set()
+            log.error(f"⏱️ {name} vượt {timeout:g}s -> kill process group {pgid}")
+            _kill_process_tree_pgid(pgid)
+
+        timer = threading.Timer(timeout, _on_timeout) if timeout else None
+        if timer:
+            timer.daemon = True
+            timer.start()
 
         try:
             # stream từng dòng: terminal + file
@@ -135,11 +229,17 @@ def run_script(path: Path, name: str, timeout: float | None = None) -> None:
                 # ghi file log
                 lf.write(line)
                 lf.flush()
-            ret = proc.wait(timeout=timeout)
-        except subprocess.TimeoutExpired:
-            _kill_process_tree_pgid(pgid)
-            raise RuntimeError(f"{name} timed out. See log: {log_path}")
+                if on_event is not None:
+                    evt = parse_event(line)
+                    if evt is not None:
+                        try:
+                            on_event(evt)
+                        except Exception:
+                            log.exception(f"Lỗi xử lý sự kiện từ {name}: {evt}")
+            ret = proc.wait()
         finally:
+            if timer:
+                timer.cancel()
             # đóng stream sớm để giải phóng FD
             try:
                 if proc.stdout:
@@ -159,48 +259,652 @@ def run_script(path: Path, name: str, timeout: float | None = None) -> None:
         pass
 
     # Dọn “mồ côi” phổ biến (chrome/driver)
-    _reap_children_by_name()
+    if reap_orphans:
+        _reap_children_by_name()
 
     # Thu gom rác Python
     gc.collect()
 
+    if timed_out.is_set():
+        raise RuntimeError(f"{name} timed out after {timeout:g}s. See log: {log_path}")
     if ret != 0:
         raise RuntimeError(f"{name} exited with code {ret}. See log: {log_path}")
-def pipeline():
-    """Chạy pipeline tuần tự, có khóa tránh chạy trùng."""
+
+
+# ====== BỘ LẬP LỊCH THEO BỘ NHỚ (cấu hình ở đầu tệp) ======
+def _tree_rss_mb(pid: int) -> float:
+    try:
+        root = psutil.Process(pid)
+        procs = [root] + root.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return 0.0
+    total = 0
+    for p in procs:
+        try:
+            total += p.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return total / 2**20
+
+
+class _MemSlot:
+    def __init__(self, name: str, kind: str, declared_mb: float):
+        self.name = name
+        self.kind = kind
+        self.declared_mb = declared_mb
+        self.pid: Optional[int] = None
+        self.peak_mb = 0.0
+
+    def track(self, pid: int) -> None:
+        """Gắn PID để bộ lấy mẫu đo RSS thực tế của cả cây tiến trình."""
+        self.pid = pid
+
+
+class MemoryScheduler:
+    def __init__(self, budget_mb: float, min_free_mb: float, footprints: Dict[str, float], poll_s: float = 2.0):
+        self.budget_mb = budget_mb
+        self.min_free_mb = min_free_mb
+        self.footprints = dict(footprints)
+        self.poll_s = poll_s
+        self.observed_peak_mb: Dict[str, float] = {}
+        self._running: Dict[str, _MemSlot] = {}
+        self._cond = threading.Condition()
+        threading.Thread(target=self._sampler, name="mem_sampler", daemon=True).start()
+
+    def expected_mb(self, kind: str) -> float:
+        return max(self.footprints.get(kind, 300.0), self.observed_peak_mb.get(kind, 0.0))
+
+    def _block_reason(self, need_mb: float) -> Optional[str]:
+        committed = sum(s.declared_mb for s in self._running.values())
+        running = ", ".join(self._running) or "-"
+        if committed + need_mb > self.budget_mb:
+            return (f"cam kết {committed:.0f} + {need_mb:.0f} MB > ngân sách {self.budget_mb:.0f} MB "
+                    f"(đang chạy: {running})")
+        avail = psutil.virtual_memory().available / 2**20
+        if avail - need_mb < self.min_free_mb:
+            return (f"RAM trống {avail:.0f} MB < cần {need_mb:.0f} + chừa {self.min_free_mb:.0f} MB "
+                    f"(đang chạy: {running})")
+        return None
+
+    @contextmanager
+    def admit(self, name: str, kind: str):
+        need = self.expected_mb(kind)
+        t0 = time.monotonic()
+        last_reason = None
+        with self._cond:
+            while True:
+                reason = self._block_reason(need)
+                if reason is None:
+                    break
+                if not self._running:
+                    # Không còn gì để chờ giải phóng -> cho chạy, chỉ cảnh báo (tránh kẹt vĩnh viễn)
+                    log.warning(f"[MEM] ⚠️ {name} vượt ngân sách nhưng không có tác vụ nào khác: {reason}")
+                    break
+                if reason != last_reason:
+                    log.info(f"[MEM] ⏸️ Hoãn {name}: {reason}")
+                    last_reason = reason
+                self._cond.wait(timeout=self.poll_s)
+            slot = _MemSlot(name, kind, need)
+            self._running[name] = slot
+        waited = time.monotonic() - t0
+        if last_reason:
+            log.info(f"[MEM] ▶️ {name} được chạy sau {waited:.0f}s chờ (dự kiến {need:.0f} MB)")
+        try:
+            yield slot
+        finally:
+            with self._cond:
+                self._running.pop(name, None)
+                if slot.peak_mb:
+                    self.observed_peak_mb[kind] = max(self.observed_peak_mb.get(kind, 0.0), slot.peak_mb)
+                    log.info(f"[MEM] {name}: RSS đỉnh {slot.peak_mb:.0f} MB (dự kiến {need:.0f} MB)")
+                self._cond.notify_all()
+
+    def _sampler(self) -> None:
+        while True:
+            time.sleep(self.poll_s)
+            with self._cond:
+                slots = [s for s in self._running.values() if s.pid]
+            for s in slots:
+                s.peak_mb = max(s.peak_mb, _tree_rss_mb(s.pid))
+
+
+# Scheduler / ledger chỉ tạo khi pipeline()/lệnh CLI cần lần đầu, không tạo lúc import:
+# import main.py (vd. `main.py report`) không bật thread lấy mẫu RSS, không mở/tạo SQLite ledger
+_mem_scheduler_obj: Optional[MemoryScheduler] = None
+_ledger_obj: Optional[RunLedger] = None
+_singleton_lock = threading.Lock()
+
+
+def _mem_scheduler() -> MemoryScheduler:
+    global _mem_scheduler_obj
+    with _singleton_lock:
+        if _mem_scheduler_obj is None:
+            _mem_scheduler_obj = MemoryScheduler(MEM_BUDGET_MB, MEM_MIN_FREE_MB, STAGE_FOOTPRINT_MB)
+        return _mem_scheduler_obj
+
+
+# ====== SỔ CÁI LẦN CHẠY (SQLite, xem common/run_ledger.py) ======
+def _ledger() -> RunLedger:
+    global _ledger_obj
+    with _singleton_lock:
+        if _ledger_obj is None:
+            _ledger_obj = RunLedger()
+        return _ledger_obj
+
+
+_run_id: Optional[str] = None   # lần chạy pipeline hiện tại (None khi không chạy)
+# Tiến độ trực tiếp -> output/progress.json (web: /api/progress/stream)
+PROGRESS = ProgressBoard()
+
+
+@contextmanager
+def _ledger_stage(stage: str, name: str, group_id: Optional[int] = None):
+    """
+    Ghi 1 bước vào ledger: start khi vào, finish (ok/failed) khi ra.
+    Người gọi điền rec["rows_in"/"rows_out"/"peak_rss_mb"/"status"] nếu biết.
+    Ledger lỗi thì chỉ cảnh báo, không làm hỏng pipeline.
+    """
+    rec: Dict = {"rows_in": None, "rows_out": None, "peak_rss_mb": None, "status": "ok", "output": None}
+    sid = None
+    PROGRESS.stage(name, "running")
+    if _run_id:
+        try:
+            sid = _ledger().start_stage(_run_id, stage, name, group_id)
+        except Exception as e:
+            log.warning(f"[LEDGER] Không ghi được bắt đầu {name}: {e}")
+    err: Optional[str] = None
+    try:
+        yield rec
+    except Exception as e:
+        rec["status"], err = "failed", str(e)[:1000]
+        raise
+    finally:
+        PROGRESS.stage(name, rec["status"])
+        if sid is not None:
+            try:
+                _ledger().finish_stage(sid, rec["status"], rows_in=rec["rows_in"], rows_out=rec["rows_out"],
+                                    peak_rss_mb=rec["peak_rss_mb"], error=err, output=rec["output"])
+            except Exception as e:
+                log.warning(f"[LEDGER] Không ghi được kết thúc {name}: {e}")
+
+
+def _ledger_group_event(evt: Dict) -> None:
+    """Sự kiện group_done/group_failed của scraper -> 1 dòng crawl_group trong ledger."""
+    if not _run_id or evt.get("event") not in ("group_done", "group_failed") or not evt.get("started_at"):
+        return
+    ok = evt["event"] == "group_done"
+    try:
+        _ledger().record_stage(_run_id, "crawl_group", f"crawl_g{evt.get('group_id')}",
+                            started_at=float(evt["started_at"]), ended_at=float(evt.get("ts") or time.time()),
+                            status="ok" if ok else "failed", group_id=evt.get("group_id"),
+                            rows_in=evt.get("n_links"), rows_out=evt.get("n_detail"), error=evt.get("error"),
+                            output=evt.get("detail_path"))
+    except Exception as e:
+        log.warning(f"[LEDGER] Không ghi được ngành {evt.get('group_name')}: {e}")
+
+
+class PartialRunError(RuntimeError):
+    """Lần chạy xong nhưng có ngành lỗi (sau khi đã thử lại) -> run status 'partial'."""
+
+    def __init__(self, failed_gids: List[int]):
+        self.failed_gids = sorted(failed_gids)
+        super().__init__(f"{len(self.failed_gids)} ngành lỗi: {', '.join(f'g{g}' for g in self.failed_gids)}")
+
+
+def _chrome_shared() -> bool:
+    """Có Chrome của tác vụ khác đang chạy song song -> không được dọn chrome 'mồ côi' theo tên."""
+    return _active_mode == "pipelined" or (_active_mode == "grouped" and GROUP_TASK_WORKERS > 1)
+
+
+def _run_task(name: str, fn: Callable[[], object], retries: Optional[int] = None,
+              backoff_s: Optional[float] = None):
+    """
+    Chạy 1 tác vụ (1 bước của 1 ngành), lỗi/quá hạn thì thử lại với backoff tăng gấp đôi.
+    Mỗi lần thử là 1 dòng riêng trong ledger (run_stage/run_crawl_group tự ghi).
+    """
+    retries = TASK_RETRIES if retries is None else retries
+    backoff_s = TASK_RETRY_BACKOFF_S if backoff_s is None else backoff_s
+    for attempt in range(1, retries + 2):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt > retries:
+                raise
+            wait = backoff_s * 2 ** (attempt - 1)
+            log.warning(f"🔁 {name} lỗi (lần {attempt}/{retries + 1}): {e} -> thử lại sau {wait:.0f}s")
+            time.sleep(wait)
+
+
+def run_scraper(on_event: Optional[Callable[[Dict], None]] = None,
+                done: Optional[Dict[str, Dict]] = None) -> None:
+    """
+    Chạy crawler (subprocess) qua bộ lập lịch bộ nhớ, ghi ledger cho cả bước và từng ngành.
+    done: các bước đã xong của lần chạy đang tiếp tục -> crawler dùng lại run_ts và bỏ các ngành đã xong.
+    """
+    env_extra = {"CRAWL_RUN_TS": _run_id} if _run_id else {}
+    skip = sorted(int(r["group_id"]) for n, r in (done or {}).items()
+                  if n.startswith("crawl_g") and r.get("group_id") is not None)
+    if skip:
+        env_extra["CRAWL_SKIP_GROUPS"] = ",".join(map(str, skip))
+    n_detail = {"ok": 0, "rows": 0}
+
+    def _on_event(evt: Dict) -> None:
+        PROGRESS.on_event(evt)
+        _ledger_group_event(evt)
+        if evt.get("event") == "group_done":
+            n_detail["ok"] += 1
+            n_detail["rows"] += int(evt.get("n_detail") or 0)
+        if on_event is not None:
+            on_event(evt)
+
+    with _ledger_stage("scraper", "selenium_scraper") as rec:
+        with _mem_scheduler().admit("selenium_scraper", "scraper") as slot:
+            try:
+                run_script(SCRAPER, "selenium_scraper", timeout=SCRAPER_TIMEOUT_S, env_extra=env_extra,
+                           on_event=_on_event, on_start=slot.track)
+            finally:
+                rec["rows_in"] = n_detail["ok"]      # số ngành crawl xong
+                rec["rows_out"] = n_detail["rows"]   # tổng dòng chi tiết
+                rec["peak_rss_mb"] = slot.peak_mb or None
+
+
+def run_crawl_group(gid: int, group_name: str) -> Dict:
+    """
+    Crawl đúng 1 ngành: scraper chạy riêng với CRAWL_GROUP_IDS=gid và hạn chót GROUP_CRAWL_TIMEOUT_S.
+    Trả về sự kiện group_done; ngành lỗi / scraper chết / quá hạn -> RuntimeError (để _run_task thử lại).
+    """
+    name = f"crawl_g{gid}"
+    env_extra = {"CRAWL_GROUP_IDS": str(gid), "CRAWL_WORKERS": "1"}
+    if _run_id:
+        env_extra["CRAWL_RUN_TS"] = _run_id
+    result: Dict = {}
+
+    def _on_event(evt: Dict) -> None:
+        if evt.get("event") == "crawl_plan":   # kế hoạch của 1 ngành; kế hoạch cả lần chạy do _pipeline_grouped gửi
+            return
+        PROGRESS.on_event(evt)
+        _ledger_group_event(evt)
+        if evt.get("event") in ("group_done", "group_failed") and evt.get("group_id") == gid:
+            result.update(evt)
+
+    t0 = time.time()
+    try:
+        with _mem_scheduler().admit(name, "scraper") as slot:
+            run_script(SCRAPER, name, timeout=GROUP_CRAWL_TIMEOUT_S, env_extra=env_extra, on_event=_on_event,
+                       reap_orphans=not _chrome_shared(), on_start=slot.track)
+    except Exception as e:
+        if result.get("event") == "group_done":
+            # File chi tiết đã ghi xong, chỉ lỗi lúc tổng kết -> không crawl lại
+            log.warning(f"[{group_name}] scraper lỗi sau khi crawl xong ngành: {e}")
+            return result
+        if not result and _run_id:
+            # Chết/quá hạn trước khi kịp báo -> vẫn ghi ledger để `main.py retry` biết ngành này lỗi
+            try:
+                _ledger().record_stage(_run_id, "crawl_group", name, started_at=t0, ended_at=time.time(),
+                                    status="failed", group_id=gid, error=str(e)[:1000])
+            except Exception as le:
+                log.warning(f"[LEDGER] Không ghi được lỗi {name}: {le}")
+        raise
+    if result.get("event") != "group_done":
+        raise RuntimeError(f"{name} lỗi: {result.get('error') or 'scraper không báo kết quả ngành'}")
+    return result
+
+
+def run_stage(stage: str, path: Path, name: str, timeout: float | None = None,
+              env_extra: Optional[Dict[str, str]] = None,
+              on_event: Optional[Callable[[Dict], None]] = None,
+              group_id: Optional[int] = None) -> None:
+    """Chạy bước preprocess/analyzer: qua warm worker (STAGE_RUNNER=warm) hoặc subprocess như cũ."""
+    global _warm_worker
+    if timeout is None:
+        timeout = STAGE_DEFAULT_TIMEOUT_S
+    with _ledger_stage(stage, name, group_id) as rec:
+        counts = {"in": 0, "out": 0, "files": 0, "cached": 0}
+
+        def _on_event(evt: Dict) -> None:
+            PROGRESS.on_event(evt)
+            if evt.get("event") in ("preprocess_done", "analyze_done"):
+                rec["output"] = evt.get("output")
+                counts["files"] += 1
+                counts["cached"] += bool(evt.get("cached"))
+                counts["in"] += int(evt.get("rows_in") or 0)
+                counts["out"] += int(evt.get("rows") or 0)
+            if on_event is not None:
+                on_event(evt)
+
+        with _mem_scheduler().admit(name, stage) as slot:
+            try:
+                if STAGE_RUNNER != "warm":
+                    run_script(path, name, timeout=timeout, env_extra=env_extra, on_event=_on_event,
+                               reap_orphans=not _chrome_shared(), on_start=slot.track)
+                else:
+                    if _warm_worker is None:
+                        _warm_worker = WarmWorker(log=log.info)
+                    if _warm_worker.pid:
+                        slot.track(_warm_worker.pid)
+                    info = _warm_worker.run(stage, name, env_extra=env_extra, on_event=_on_event, timeout=timeout)
+                    log.info(f"[WARM] {name} xong trong {info['elapsed_s']}s (log: {info['log']})")
+            finally:
+                rec["rows_in"] = counts["in"] or None
+                rec["rows_out"] = counts["out"] or None
+                rec["peak_rss_mb"] = slot.peak_mb or None
+        if counts["files"] and counts["cached"] == counts["files"]:
+            rec["status"] = "cached"
+
+def publish_data() -> None:
+    """Công bố phiên bản dữ liệu mới cho web app (manifest ghi nguyên tử, web tự nạp lại — không restart)."""
+    try:
+        man, changed = publish_manifest(OUTPUT_DIR / "analyzer", run_id=_run_id)
+    except Exception:
+        log.exception("[DATA] Không ghi được manifest dữ liệu")
+        return
+    if changed:
+        log.info(f"[DATA] Đã công bố dữ liệu version={man['version']} ({len(man['industries'])} ngành)")
+
+def backfill_artifacts() -> None:
+    """Đưa các file có sẵn trong output/ vào catalog trước lần chạy đầu: nếu không, file đầu tiên
+    pipeline ghi nhận sẽ khiến catalog "có dữ liệu" và các ngành cũ biến mất khỏi web/analyzer."""
+    try:
+        n = artifacts.catalog().backfill()
+    except Exception:
+        log.exception("[CATALOG] Không backfill được catalog")
+        return
+    log.info(f"[CATALOG] Backfill: ghi nhận {n} file có sẵn")
+
+def prune_artifacts() -> None:
+    if ARTIFACT_KEEP <= 0:
+        return
+    try:
+        removed = artifacts.catalog().prune(keep=ARTIFACT_KEEP)
+    except Exception:
+        log.exception("[CATALOG] Không dọn được file cũ")
+        return
+    if removed:
+        log.info(f"[CATALOG] Đã xoá {len(removed)} file cũ (giữ {ARTIFACT_KEEP} bản mới nhất mỗi ngành)")
+
+def _log_warm_savings() -> None:
+    if _warm_worker is not None and _warm_worker.jobs:
+        w = _warm_worker
+        log.info(f"[WARM] {w.jobs} job qua worker ấm | boot {w.boot.get('total_s')}s "
+                 f"(import {w.boot.get('import_s')}s, model {w.boot.get('model_s')}s) | "
+                 f"restart {w.restarts} | tiết kiệm khởi động ước tính ~{w.saved_startup_s()}s")
+
+def _process_group_downstream(evt: Dict, done: Optional[Dict[str, Dict]] = None) -> Optional[Path]:
+    """Preprocess + analyze đúng 1 file chi tiết (1 ngành) vừa crawl xong; bước đã xong (khi tiếp tục) thì bỏ qua."""
+    done = done or {}
+    detail_path = Path(evt["detail_path"])
+    tag = f"g{evt.get('group_id')}"
+    produced: Dict[str, str] = {}
+
+    def _capture(e: Dict) -> None:
+        if e.get("event") == "preprocess_done":
+            produced["preprocessed"] = e["output"]
+
+    t0 = time.monotonic()
+    if f"preprocess_{tag}" in done and done[f"preprocess_{tag}"].get("output"):
+        produced["preprocessed"] = done[f"preprocess_{tag}"]["output"]
+    else:
+        # Mỗi bước của ngành có hạn chót + thử lại riêng (lỗi 1 lần không phải chạy lại cả pipeline)
+        _run_task(f"preprocess_{tag}", lambda: run_stage(
+            "preprocess", PREPROCESS, f"preprocess_{tag}", timeout=GROUP_PREPROCESS_TIMEOUT_S,
+            env_extra={"PREPROCESS_INPUT": str(detail_path)}, on_event=_capture, group_id=evt.get("group_id")))
+    pre_path = Path(produced.get("preprocessed")
+                    or PREPROCESS_DIR / f"{detail_path.stem}_preprocessed{frames.interchange_suffix()}")
+    if f"analyzer_{tag}" not in done:
+        _run_task(f"analyzer_{tag}", lambda: run_stage(
+            "analyzer", ANALYZER, f"analyzer_{tag}", timeout=GROUP_ANALYZER_TIMEOUT_S,
+            env_extra={"EXCEL_PATH_ANALYZER": str(pre_path)}, group_id=evt.get("group_id")))
+    publish_data()   # web thấy ngành này ngay, không chờ cả lần chạy
+    log.info(f"✅ [{evt.get('group_name')}] preprocess + analyze xong sau {time.monotonic() - t0:.0f}s")
+    return pre_path
+
+def _pipeline_pipelined(done: Optional[Dict[str, Dict]] = None) -> None:
+    """
+    Crawl chạy liên tục; mỗi sự kiện group_done đẩy 1 job preprocess+analyze cho ngành đó vào pool.
+    done (tiếp tục lần chạy dở): ngành đã crawl nhưng chưa xử lý xong được đẩy vào pool ngay từ đầu.
+    """
+    done = done or {}
+    t_start = time.monotonic()
+    first_result: Dict[str, float] = {}
+    futures = []
+    pool = ThreadPoolExecutor(max_workers=max(1, PIPELINE_STAGE_WORKERS), thread_name_prefix="stage")
+
+    def _done_cb(fut):
+        if fut.exception() is None:
+            first_result.setdefault("t", time.monotonic() - t_start)
+
+    def _on_scraper_event(evt: Dict) -> None:
+        if evt.get("event") != "group_done":
+            return
+        if not evt.get("n_detail"):
+            log.warning(f"[{evt.get('group_name')}] 0 dòng chi tiết -> bỏ qua preprocess/analyze.")
+            return
+        fut = pool.submit(_process_group_downstream, evt, done)
+        fut.add_done_callback(_done_cb)
+        futures.append((evt, fut))
+
+    for name, r in done.items():
+        gid = r.get("group_id")
+        if not name.startswith("crawl_g") or not r.get("output") or f"analyzer_g{gid}" in done:
+            continue
+        log.info(f"[RESUME] Ngành g{gid} đã crawl xong ở lần trước -> preprocess/analyze tiếp")
+        _on_scraper_event({"event": "group_done", "group_id": gid, "group_name": f"g{gid}",
+                           "detail_path": r["output"], "n_detail": r.get("rows_out")})
+
+    try:
+        if "selenium_scraper" not in done:
+            run_scraper(on_event=_on_scraper_event, done=done)
+    except Exception:
+        # Crawl lỗi giữa chừng: vẫn hoàn tất các ngành đã crawl xong
+        log.exception("❌ Scraper thất bại; tiếp tục xử lý các ngành đã crawl xong.")
+    t_crawl = time.monotonic() - t_start
+
+    pool.shutdown(wait=True)
+    failed: List[int] = []
+    for evt, fut in futures:
+        if fut.exception() is not None:
+            failed.append(int(evt.get("group_id")))
+            log.error(f"❌ [{evt.get('group_name')}] preprocess/analyze lỗi: {fut.exception()}")
+    _reap_children_by_name()
+
+    t_total = time.monotonic() - t_start
+    log.info(f"[PIPELINED] {len(futures) - len(failed)}/{len(futures)} ngành xong | crawl {t_crawl:.0f}s | "
+             f"tổng {t_total:.0f}s | kết quả đầu tiên sau {first_result.get('t', float('nan')):.0f}s")
+    if failed:
+        raise PartialRunError(failed)
+
+def _group_task(gid: int, group_name: str, done: Dict[str, Dict]) -> str:
+    """Chuỗi tác vụ của 1 ngành: crawl -> preprocess -> analyze. Trả về 'ok' / 'empty'; lỗi thì raise."""
+    prev = done.get(f"crawl_g{gid}")
+    if prev and prev.get("output"):
+        evt = {"event": "group_done", "group_id": gid, "group_name": group_name,
+               "detail_path": prev["output"], "n_detail": prev.get("rows_out")}
+    else:
+        evt = _run_task(f"crawl_g{gid}", lambda: run_crawl_group(gid, group_name))
+    if not evt.get("n_detail"):
+        log.warning(f"[{group_name}] 0 dòng chi tiết -> bỏ qua preprocess/analyze.")
+        return "empty"
+    _process_group_downstream(evt, done)
+    return "ok"
+
+def _pipeline_grouped(done: Optional[Dict[str, Dict]] = None, only_gids: Optional[List[int]] = None) -> None:
+    """
+    Mỗi ngành là 1 chuỗi tác vụ độc lập (xem _group_task), GROUP_TASK_WORKERS ngành chạy cùng lúc.
+    Ngành lỗi (sau khi đã thử lại) không dừng ngành khác; cuối lần chạy raise PartialRunError.
+    """
+    done = done or {}
+    groups = [(gid, name) for name, gid in VNWORKS_GROUPS.items() if not only_gids or gid in only_gids]
+    todo = [(gid, name) for gid, name in groups if f"analyzer_g{gid}" not in done]
+    if len(todo) < len(groups):
+        log.info(f"[GROUPED] Bỏ qua {len(groups) - len(todo)} ngành đã xong, còn {len(todo)}")
+    PROGRESS.on_event({"event": "crawl_plan", "n_groups": len(todo)})
+
+    t_start = time.monotonic()
+    status: Dict[int, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, GROUP_TASK_WORKERS), thread_name_prefix="group") as pool:
+        futs = {pool.submit(_group_task, gid, name, done): (gid, name) for gid, name in todo}
+        for fut in as_completed(futs):
+            gid, name = futs[fut]
+            try:
+                status[gid] = fut.result()
+            except Exception as e:
+                status[gid] = "failed"
+                log.error(f"❌ [{name}] g{gid} lỗi sau khi đã thử lại: {e}")
+    _reap_children_by_name()
+
+    failed = sorted(g for g, st in status.items() if st == "failed")
+    log.info(f"[GROUPED] {len(todo) - len(failed)}/{len(todo)} ngành xong trong {time.monotonic() - t_start:.0f}s"
+             + (f" | lỗi: {', '.join(f'g{g}' for g in failed)} -> chạy lại: python main.py retry" if failed else ""))
+    if failed:
+        raise PartialRunError(failed)
+
+def pipeline(resume_run_id: Optional[str] = None, only_groups: Optional[List[int]] = None,
+             force_resume: bool = False) -> Optional[str]:
+    """
+    Chạy pipeline (sequential / pipelined / grouped theo PIPELINE_MODE), có khóa tránh chạy trùng.
+    resume_run_id: tiếp tục lần chạy dở trong ledger từ bước/ngành đầu tiên chưa xong
+                   (bị từ chối nếu tiến trình khác vẫn đang chạy lần đó, trừ khi force_resume).
+    only_groups: chỉ chạy các ngành này, luôn theo tác vụ từng ngành (lệnh `main.py retry`).
+    Trả về trạng thái lần chạy: ok / partial / failed (None nếu bị bỏ qua vì đang chạy).
+    """
+    global _run_id, _active_mode
     if _running_flag.is_set():
         log.warning("Pipeline đang chạy, bỏ qua lần kích hoạt này.")
-        return
+        return None
 
     with _run_lock:
         if _running_flag.is_set():
             log.warning("Pipeline đang chạy, bỏ qua.")
-            return
+            return None
         _running_flag.set()
+    _active_mode = "grouped" if only_groups else PIPELINE_MODE
+    _mem_scheduler()   # bật bộ lấy mẫu RSS trước tác vụ đầu tiên
 
+    status, err = "ok", None
+    done: Dict[str, Dict] = {}
     try:
-        log.info("🚀 BẮT ĐẦU PIPELINE")
-        run_script(SCRAPER, "selenium_scraper")
-        run_script(PREPROCESS, "preprocess")
-        run_script(ANALYZER, "analyzer")
+        if resume_run_id:
+            _ledger().resume_run(resume_run_id, force=force_resume)
+            _run_id = resume_run_id
+            done = _ledger().completed_stages(resume_run_id)
+        else:
+            # run_id cùng định dạng run_ts của crawler -> tên file chi tiết khớp khi tiếp tục
+            _run_id = _ledger().start_run(mode=_active_mode, run_id=datetime.now().strftime("%Y-%m-%d_%H%M%S"))
+    except RunInProgressError as e:
+        # Không chạy chồng lên lần chạy đang sống (và không ghi gì vào ledger của nó)
+        log.error(f"⛔ {e}. Chờ lần đó xong rồi chạy lại (hoặc --force nếu chắc chắn tiến trình đã chết).")
+        _active_mode = PIPELINE_MODE
+        _running_flag.clear()
+        return None
+    except Exception as e:
+        log.warning(f"[LEDGER] Không tạo/mở được bản ghi lần chạy: {e}")
+    PROGRESS.start_run(_run_id, _active_mode)
+    try:
+        if done:
+            log.info(f"🔁 TIẾP TỤC PIPELINE run={_run_id}: đã xong {len(done)} bước/ngành "
+                     f"({', '.join(sorted(done))})")
+        log.info(f"🚀 BẮT ĐẦU PIPELINE (mode={_active_mode}, run={_run_id})")
+        if _active_mode == "grouped":
+            _pipeline_grouped(done, only_groups)
+        elif _active_mode == "pipelined":
+            _pipeline_pipelined(done)
+        else:
+            if "selenium_scraper" not in done:
+                run_scraper(done=done)
+            if "preprocess" not in done:
+                run_stage("preprocess", PREPROCESS, "preprocess", timeout=PREPROCESS_TIMEOUT_S)
+            if "analyzer" not in done:
+                run_stage("analyzer", ANALYZER, "analyzer", timeout=ANALYZER_TIMEOUT_S)
+            publish_data()
+        _log_warm_savings()
+        prune_artifacts()
         log.info("🎉 PIPELINE HOÀN TẤT")
-    except Exception:
+    except PartialRunError as e:
+        # Các ngành khác đã xong và đã công bố; chỉ cần chạy lại ngành lỗi
+        status, err = "partial", str(e)
+        log.error(f"⚠️ PIPELINE XONG MỘT PHẦN: {e} -> python main.py retry --run {_run_id}")
+    except Exception as e:
+        status, err = "failed", str(e)[:1000]
         log.exception("❌ PIPELINE THẤT BẠI")
     finally:
+        PROGRESS.finish_run(status)
+        if _run_id:
+            try:
+                _ledger().finish_run(_run_id, status, err)
+            except Exception as e:
+                log.warning(f"[LEDGER] Không cập nhật được lần chạy {_run_id}: {e}")
+        _run_id = None
+        _active_mode = PIPELINE_MODE
         _running_flag.clear()
+    return status
 
 def manage_services():
-    run_cmd("sudo systemctl restart fastapi")
+    # Không restart fastapi nữa: web app tự nạp dữ liệu mới qua output/analyzer/manifest.json (publish_data)
     run_cmd("sudo systemctl status nginx --no-pager")
     run_cmd("sudo systemctl status fastapi --no-pager")
 
 
 # ====== LẬP LỊCH ======
+SCHEDULE_TZ = "Asia/Ho_Chi_Minh"
+SCHEDULE_WEEKDAY = 1            # Thứ Ba (Thứ Hai = 0)
+SCHEDULE_HOUR, SCHEDULE_MINUTE = 0, 0
+# Khi khởi động: auto = chỉ chạy nếu đến hạn / tiếp tục lần chạy dở; always = luôn chạy mới; never = chờ lịch
+RUN_ON_STARTUP = os.getenv("RUN_ON_STARTUP", "auto").strip().lower()
+
+
+def _last_scheduled_slot(now: Optional[datetime] = None) -> datetime:
+    """Mốc lịch (Thứ Ba 00:00 giờ VN) gần nhất đã qua."""
+    from zoneinfo import ZoneInfo
+
+    now = now or datetime.now(ZoneInfo(SCHEDULE_TZ))
+    slot = now.replace(hour=SCHEDULE_HOUR, minute=SCHEDULE_MINUTE, second=0, microsecond=0)
+    slot -= timedelta(days=(now.weekday() - SCHEDULE_WEEKDAY) % 7)
+    if slot > now:
+        slot -= timedelta(days=7)
+    return slot
+
+
+def startup_action() -> tuple[str, Optional[str]]:
+    """
+    Quyết định khi orchestrator khởi động, dựa trên ledger:
+    - ("resume", run_id): lần chạy mới nhất bị ngắt (còn 'running') hoặc lỗi / xong một phần sau mốc lịch gần nhất
+    - ("skip", run_id)  : đã có lần chạy thành công sau mốc lịch gần nhất -> chờ lịch
+    - ("run", None)     : đến hạn, chạy mới
+    """
+    if RUN_ON_STARTUP == "always":
+        return "run", None
+    if RUN_ON_STARTUP == "never":
+        return "skip", None
+    slot_ts = _last_scheduled_slot().timestamp()
+    latest = _ledger().runs(limit=1)
+    if latest:
+        r = latest[0]
+        if r["status"] == "running" or (r["status"] in ("failed", "partial") and r["started_at"] >= slot_ts):
+            return "resume", r["run_id"]
+        if r["status"] == "ok" and r["started_at"] >= slot_ts:
+            return "skip", r["run_id"]
+    return "run", None
+
+
+def startup_pipeline() -> None:
+    try:
+        action, run_id = startup_action()
+    except Exception as e:
+        log.warning(f"[LEDGER] Không đọc được trạng thái lần chạy ({e}) -> chạy mới")
+        action, run_id = "run", None
+    if action == "skip":
+        log.info(f"⏭️ Không chạy khi khởi động: lần chạy {run_id or '-'} đã hoàn tất sau mốc lịch gần nhất "
+                 f"(RUN_ON_STARTUP={RUN_ON_STARTUP})")
+        return
+    if action == "resume":
+        log.info(f"🔁 Lần chạy {run_id} chưa hoàn tất -> tiếp tục từ bước dở")
+    pipeline(resume_run_id=run_id)
+
 
 def start_scheduler():
-    sched = BackgroundScheduler(timezone="Asia/Ho_Chi_Minh")
+    sched = BackgroundScheduler(timezone=SCHEDULE_TZ)
     # Hẹn giờ: Thứ Ba 00:00
-    trigger = CronTrigger(day_of_week="tue", hour=00, minute=00)
+    trigger = CronTrigger(day_of_week=SCHEDULE_WEEKDAY, hour=SCHEDULE_HOUR, minute=SCHEDULE_MINUTE)
     sched.add_job(
         pipeline,
         trigger,
@@ -218,12 +922,13 @@ def start_scheduler():
 
 def main():
     log.info("===== Orchestrator khởi động (t3.small) =====")
+    backfill_artifacts()
 
     # Bật scheduler
     scheduler = start_scheduler()
 
-    # Chạy pipeline ngay khi khởi động
-    t = threading.Thread(target=pipeline, name="initial_pipeline", daemon=True)
+    # Khởi động: chạy mới / tiếp tục lần dở / bỏ qua — theo ledger (xem startup_action)
+    t = threading.Thread(target=startup_pipeline, name="initial_pipeline", daemon=True)
     t.start()
 
     # Quản lý dịch vụ web song song
@@ -248,8 +953,61 @@ def main():
             scheduler.shutdown(wait=False)
         except Exception:
             pass
+        if _warm_worker is not None:
+            _warm_worker.close()
         log.info("Orchestrator đã dừng.")
 
 
+def report_cli(argv) -> int:
+    """`python main.py report`: so lần chạy mới nhất với baseline trong ledger. Trả 1 nếu có bước chậm."""
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="main.py report", description="Báo cáo hồi quy hiệu năng từ run ledger")
+    ap.add_argument("--baseline", type=int, default=int(os.getenv("REPORT_BASELINE_RUNS", "5")),
+                    help="số lần chạy trước dùng làm baseline (trung vị)")
+    ap.add_argument("--threshold", type=float, default=float(os.getenv("REPORT_SLOWER_PCT", "20")),
+                    help="đánh dấu bước chậm hơn baseline quá X%%")
+    args = ap.parse_args(argv)
+    rep = _ledger().regression_report(baseline_runs=args.baseline, threshold_pct=args.threshold)
+    print(format_report(rep))
+    return 1 if rep["regressions"] else 0
+
+
+def retry_cli(argv) -> int:
+    """`python main.py retry`: chạy lại riêng các ngành lỗi của 1 lần chạy (mặc định: lần gần nhất chưa ok)."""
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="main.py retry", description="Chạy lại các ngành lỗi theo ledger")
+    ap.add_argument("--run", help="run_id cần chạy lại (mặc định: lần chạy gần nhất chưa thành công)")
+    ap.add_argument("--groups", help="group_id cách nhau bởi dấu phẩy, vd. 5,12 (mặc định: các ngành lỗi trong ledger)")
+    ap.add_argument("--force", action="store_true",
+                    help="tiếp tục cả khi ledger ghi lần chạy còn 'running' (tiến trình chủ ở máy khác / đã chết)")
+    args = ap.parse_args(argv)
+
+    run_id = args.run
+    if not run_id:
+        pending = [r for r in _ledger().runs(limit=20) if r["status"] != "ok"]
+        if not pending:
+            print("Không có lần chạy nào cần chạy lại.")
+            return 0
+        run_id = pending[0]["run_id"]
+    if args.groups:
+        gids = sorted({int(g) for g in args.groups.split(",") if g.strip()})
+    else:
+        gids = _ledger().failed_groups(run_id)
+    if not gids:
+        print(f"Lần chạy {run_id}: không có ngành nào lỗi.")
+        return 0
+    print(f"🔁 Chạy lại run={run_id}: {', '.join(f'g{g}' for g in gids)}")
+    status = pipeline(resume_run_id=run_id, only_groups=gids, force_resume=args.force)
+    if _warm_worker is not None:
+        _warm_worker.close()
+    return 0 if status == "ok" else 1
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "report":
+        sys.exit(report_cli(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "retry":
+        sys.exit(retry_cli(sys.argv[2:]))
     main()
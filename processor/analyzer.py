@@ -1,7 +1,7 @@
 import math
 import os
 import re
-import unicodedata
+import sys
 from datetime import datetime
 from pathlib import Path
 from difflib import get_close_matches, SequenceMatcher
@@ -9,18 +9,13 @@ from typing import List, Dict, Tuple, Optional
 import numpy as np
 import pandas as pd
 
-# Cố gắng dùng _parse_dt đã định nghĩa ở module preprocess (nếu có) để thống nhất cách parse timestamp.
-# Nếu import thất bại (khác môi trường/thư mục), fallback sang hàm nội bộ bên dưới.
-try:
-    from processor.preprocess import _parse_dt as _parse_dt_ext
-except Exception:
-    _parse_dt_ext = None
-
-def _parse_dt(date_str: str, time_str: str) -> datetime:
-    # Wrapper: ưu tiên dùng _parse_dt_ext nếu có; nếu không thì parse theo định dạng mặc định "YYYY-mm-dd HHMMSS".
-    return _parse_dt_ext(date_str, time_str) if _parse_dt_ext else datetime.strptime(
-        f"{date_str} {time_str}", "%Y-%m-%d %H%M%S"
-    )
+# cho phép import module dùng chung (common.*, processor.*) khi chạy `python processor/analyzer.py`
+_ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(_ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(_ROOT_DIR))
+
+from common.events import ProgressReporter, emit_event
+from common import artifacts, frames, stage_cache, textnorm
 
 # ==== xác định project root theo vị trí file này ====
 # analyzer.py nằm ở: <root>/processor/analyzer.py → parents[1] là thư mục root dự án.
@@ -31,18 +26,20 @@ ROOT = Path(__file__).resolve().parents[1]
 PREPROCESS_DIR = ROOT / "output" / "preprocess"
 ANALYZER_DIR   = ROOT / "output" / "analyzer"
 
-# ==== regex tên file (match cả processed & preprocessed) ====
-# Mẫu nhận diện file hợp lệ để đưa vào phân tích:
-#   job_detail_output_<slug>_g<gid>_<loc>_<YYYY-mm-dd>_<HHMMSS>[_processed|_preprocessed].xlsx
-FNAME_RE = re.compile(
-    r"^job_detail_output_(?P<slug>.+?)_g(?P<gid>\d+)_(?P<loc>\d{4})_"
-    r"(?P<date>\d{4}-\d{2}-\d{2})_(?P<time>\d{6})"
-    r"(?:_(?P<suffix>(?:pre)?processed))?\.xlsx$",
-    re.IGNORECASE,
-)
-
 DEBUG = True  # Bật LOG debug chi tiết trong quá trình quét file mới nhất.
 
+# ==== model embedding (gom cụm kỹ năng) — nạp 1 lần / tiến trình ====
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+_EMBEDDER = None
+
+def get_embedder():
+    """SentenceTransformer dùng chung: tiến trình worker "ấm" (main.py, STAGE_RUNNER=warm) chỉ nạp 1 lần."""
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        from sentence_transformers import SentenceTransformer
+        _EMBEDDER = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _EMBEDDER
+
 def _make_analyzer_path(src: Path) -> Path:
     # Tạo đường dẫn file đầu ra cho một file nguồn:
     # - Loại bỏ hậu tố _processed/_preprocessed khỏi stem.
@@ -54,35 +51,13 @@ def _make_analyzer_path(src: Path) -> Path:
     return ANALYZER_DIR / out_name
 
 def get_latest_detail_files(base_dir: Path) -> List[Path]:
-    # Duyệt base_dir, group theo (slug, gid, loc) và chọn phiên bản MỚI NHẤT dựa trên timestamp trong tên file.
-    latest: Dict[Tuple[str, str, str], Tuple[datetime, Path]] = {}
-
-    if DEBUG:
-        print(f"[DEBUG] CWD       : {Path.cwd()}")
-        print(f"[DEBUG] base_dir  : {base_dir} (exists={base_dir.exists()})")
-
+    # File preprocess mới nhất cho mỗi (slug, gid, loc): tra từ catalog (common/artifacts.py) thay vì quét thư mục.
     if not base_dir.exists():
         raise FileNotFoundError(f"Không tìm thấy thư mục: {base_dir}")
-
-    for p in base_dir.iterdir():
-        if not p.is_file():
-            continue
-        m = FNAME_RE.match(p.name)
-        if DEBUG:
-            print(f"[DEBUG] {p.name} -> {'MATCH' if m else 'NO MATCH'}")
-        if not m:
-            continue
-
-        slug = m.group("slug")
-        gid  = m.group("gid")
-        loc  = m.group("loc")
-        dt   = _parse_dt(m.group("date"), m.group("time"))
-        key  = (slug, gid, loc)
-        cur  = latest.get(key)
-        if cur is None or dt > cur[0]:
-            latest[key] = (dt, p)
-
-    return [info[1] for info in latest.values()]
+    files = artifacts.catalog().latest_paths("preprocessed", base_dir)
+    if DEBUG:
+        print(f"[DEBUG] base_dir  : {base_dir} -> {len(files)} file mới nhất (catalog)")
+    return files
 
 def save_combined_with_timestamp(
     df: pd.DataFrame,
@@ -100,12 +75,8 @@ def save_combined_with_timestamp(
     return out_path
 
 def _norm_text_no_accent(s) -> str:
-    """Chuẩn hoá văn bản: strip/ lower/ bỏ dấu (NFD – loại Mn). Dùng để nhận diện 'không yêu cầu' / biến thể."""
-    if pd.isna(s):
-        return ""
-    t = str(s).strip().lower()
-    t = "".join(c for c in unicodedata.normalize("NFD", t) if unicodedata.category(c) != "Mn")
-    return t
+    """Chuẩn hoá văn bản: strip/ lower/ bỏ dấu (common/textnorm.py). Dùng để nhận diện 'không yêu cầu' / biến thể."""
+    return textnorm.no_accent_lower(s)
 
 def _to_safe_str(x):
     # Ép về chuỗi an toàn (xử lý None/NaN). Tránh lỗi khi đưa vào so khớp/ so sánh.
@@ -138,14 +109,37 @@ def safe_get_close_matches(word, possibilities, n=3, cutoff=0.6):
         return []
 
 def analyze_one_file(file_path: Path) -> Path:
-    """Phân tích một file đã preprocess và ghi ra output/analyzer/<tên_gốc>_analyzed.xlsx"""
+    """Phân tích một file đã preprocess và ghi ra output/analyzer/<tên_gốc>_analyzed.xlsx.
+    Đầu vào trùng byte với lần chạy trước (cùng phiên bản analyzer) → link kết quả cũ, không phân tích lại."""
     if not file_path.exists():
         raise SystemExit(f"❌ Không tìm thấy file: {file_path}")
 
+    # Phiên bản = mã nguồn file này + module dùng chung ảnh hưởng kết quả (bỏ dấu, đọc/ghi parquet)
+    version = stage_cache.code_version(Path(__file__), Path(textnorm.__file__), Path(frames.__file__))
+    cache = stage_cache.StageCache("analyzer", version)
+    key = f"bytes:{stage_cache.file_sha256(file_path)}"
+    hit = cache.lookup(key)
+    if hit is not None:
+        out = stage_cache.link_forward(hit[0], _make_analyzer_path(file_path))
+        cache.store([key], [out])
+        artifacts.register(out, "analyzed", parent=file_path)
+        print(f"♻️  Bỏ qua phân tích (đầu vào không đổi): {out}")
+        return out
+
+    out = _analyze_one_file_uncached(file_path)
+    cache.store([key], [out])
+    artifacts.register(out, "analyzed", parent=file_path)
+    return out
+
+def _analyze_one_file_uncached(file_path: Path) -> Path:
     out_phantich = _make_analyzer_path(file_path)
+    # File đích có thể là hard link tới kết quả cache cũ -> gỡ link trước khi ghi để không sửa nhầm bản cũ
+    if out_phantich.exists():
+        out_phantich.unlink()
 
     # ==== ĐỌC DỮ LIỆU ====
-    df = pd.read_excel(file_path, engine="openpyxl")
+    # Đọc đủ mọi cột: bước xoá trùng bên dưới so sánh trên toàn bộ hàng
+    df = frames.read_frame(file_path)
     print(f"✅ Đọc: {file_path.name} — {df.shape[0]} dòng × {df.shape[1]} cột")
 
     # === 1) In số dòng/cột ===
@@ -511,7 +505,7 @@ def analyze_one_file(file_path: Path) -> Path:
             return sum(vals) / len(vals)
 
         # Cờ văn bản: "không yêu cầu" (no-exp) và ngược lại là "có yêu cầu"
-        df["_no_exp_flag"] = df[EXP_COL].map(lambda x: 1 if "khong yeu cau" in _norm_text_no_accent(x) else 0)
+        df["_no_exp_flag"] = textnorm.fold_series(df[EXP_COL]).str.contains("khong yeu cau", regex=False).astype(int)
         df["_has_exp_flag"] = (df["_no_exp_flag"] == 0).astype(int)
 
         # Suy ra số năm kinh nghiệm chuẩn hoá (float) chỉ cho các bản ghi có yêu cầu
@@ -625,7 +619,7 @@ def analyze_one_file(file_path: Path) -> Path:
             return sum(vals) / len(vals)
 
         # Cờ văn bản: "không yêu cầu" (no-exp) và ngược lại là "có yêu cầu"
-        df["_no_exp_flag"] = df[EXP_COL].map(lambda x: 1 if "khong yeu cau" in _norm_text_no_accent(x) else 0)
+        df["_no_exp_flag"] = textnorm.fold_series(df[EXP_COL]).str.contains("khong yeu cau", regex=False).astype(int)
         df["_has_exp_flag"] = (df["_no_exp_flag"] == 0).astype(int)
 
         # Suy ra số năm kinh nghiệm chuẩn hoá (float) chỉ cho các bản ghi có yêu cầu
@@ -703,7 +697,6 @@ def analyze_one_file(file_path: Path) -> Path:
         LANG_COL = "ngon_ngu_cv"
         TARGET_COL = "nganh"  # Đã được sử dụng ở các bước trước (cột ngành chuẩn)
 
-        import unicodedata as _ud
         from collections import Counter
 
         def _no_accent(s: str) -> str:
@@ -711,10 +704,7 @@ def analyze_one_file(file_path: Path) -> Path:
             Chuẩn hoá chuỗi về dạng không dấu, lower-case, trim.
             Trả về "" nếu đầu vào là None.
             """
-            if s is None:
-                return ""
-            s = _ud.normalize("NFD", str(s))
-            return "".join(ch for ch in s if _ud.category(ch) != "Mn").lower().strip()
+            return textnorm.no_accent_lower(s)
 
         # Từ điển ngôn ngữ → các alias (bao gồm tên ngôn ngữ & chứng chỉ liên quan)
         # Lưu ý: phát hiện theo "substring contains" sau khi normalize không dấu
@@ -975,10 +965,7 @@ def analyze_one_file(file_path: Path) -> Path:
 
         def _no_accent(s: str) -> str:
             # Chuẩn hoá không dấu, lower, trim; None -> ""
-            if s is None:
-                return ""
-            s = unicodedata.normalize("NFD", str(s))
-            return "".join(ch for ch in s if unicodedata.category(ch) != "Mn").lower().strip()
+            return textnorm.no_accent_lower(s)
 
         def _to_num(x):
             # Ép kiểu số an toàn (lỗi -> NaN)
@@ -1182,21 +1169,8 @@ def analyze_one_file(file_path: Path) -> Path:
         NGAY_COL = "ngay_lam_viec"  # Sửa lỗi chính tả (tên cột chuẩn)
         SONGAY_COL = "so_ngay_lam"
 
-        # Alias chuẩn hoá để tránh lỗi scope/closure:
-        # Ưu tiên dùng _norm_text_no_accent; nếu không có thì fallback sang _no_accent; cuối cùng tự định nghĩa.
-        try:
-            _NORM = _norm_text_no_accent  # Đã có sẵn ở các phần trước
-        except NameError:
-            try:
-                _NORM = _no_accent  # Fallback nếu dự án dùng tên này
-            except NameError:
-                import unicodedata as _ud
-                def _NORM(s: str) -> str:  # Fallback cuối cùng: normalize không dấu + lower + trim
-                    if s is None:
-                        return ""
-                    t = _ud.normalize("NFD", str(s))
-                    t = "".join(ch for ch in t if _ud.category(ch) != "Mn")
-                    return t.lower().strip()
+        # Alias chuẩn hoá: không dấu + lower + trim (common/textnorm.py)
+        _NORM = _norm_text_no_accent
 
         def _to_int_safe(x):
             # Ép kiểu số nguyên an toàn; lỗi/NaN -> None
@@ -1595,11 +1569,7 @@ def analyze_one_file(file_path: Path) -> Path:
             # ---------- Helpers chuẩn hoá ----------
             def _no_accent_lower(s: str) -> str:
                 # Bỏ dấu + lower + trim (dùng cho một số so khớp mềm)
-                if s is None:
-                    return ""
-                s = unicodedata.normalize("NFD", str(s))
-                s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-                return s.strip().lower()
+                return textnorm.no_accent_lower(s)
 
             # Các kỹ năng ngắn nhưng hợp lệ vẫn giữ (tránh lọc nhầm)
             ALLOWED_SHORT = {
@@ -1643,8 +1613,8 @@ def analyze_one_file(file_path: Path) -> Path:
                     model = None
                     util = None
                     try:
-                        from sentence_transformers import SentenceTransformer, util as _util
-                        model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+                        from sentence_transformers import util as _util
+                        model = get_embedder()
                         util = _util
                         print("✅ Dùng sentence-transformers để gom cụm đồng nghĩa.")
                     except Exception as _e:
@@ -1929,6 +1899,7 @@ def main():
         src = Path(file_path_env)
         out = analyze_one_file(src)
         print(f"✅ Hoàn tất: {out}")
+        emit_event("analyze_done", input=str(src), output=str(out))
         return
 
     # Nếu không có ENV → tự động quét các file chi tiết mới nhất trong thư mục preprocess và xử lý tuần tự
@@ -1941,14 +1912,18 @@ def main():
         print(" -", f.name)
 
     ok, fail = 0, 0
+    progress = ProgressReporter("analyzer", "files", total=len(files), unit="file")
     for fp in files:
         try:
             out = analyze_one_file(fp)
             print(f"✅ Hoàn tất: {out}")
+            emit_event("analyze_done", input=str(fp), output=str(out))
             ok += 1
         except Exception as e:
             print(f"❌ Lỗi khi xử lý {fp.name}: {e}")
             fail += 1
+        progress.update(done=ok + fail)
+    progress.finish()
 
     # Tổng kết kết quả chạy batch
     print("\n========== TỔNG KẾT ==========")
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# ===========================================================
+# MỤC ĐÍCH TỆP: ĐO TRƯỚC/SAU VIỆC BỎ CHECKPOINT EXCEL SAU TỪNG BƯỚC PREPROCESS
+#
+#   python processor/bench_preprocess.py <file chi tiết của 1 ngành> [--repeat 3] [--json out.json]
+#   python processor/bench_preprocess.py --synthetic 5000 [--seed 42] ...   (khi chưa có file crawl thật)
+#
+# Chạy _apply_pipeline + xuất file kết quả trên cùng 1 file đầu vào theo 2 chế độ:
+#   - "trước": PREPROCESS_CHECKPOINT_STEPS=all, PREPROCESS_CHECKPOINT_FORMAT=xlsx (ghi lại workbook sau
+#              mọi bước như cách cũ)
+#   - "sau"  : mặc định (không checkpoint, chỉ xuất 1 lần ở cuối)
+# Có 1 lượt chạy nóng máy (không tính) để memo/cache GPT/tỷ giá đã đầy ở cả 2 chế độ; mỗi chế độ chạy
+# --repeat lần, lấy lần nhanh nhất. In bảng thời gian từng bước (cùng khoá với "timings" của sự kiện
+# preprocess_done) và tổng. Mọi file ghi ra nằm trong thư mục tạm, xoá khi xong.
+# --synthetic: bóc trang chi tiết thật đã lưu (htmldetails.txt) bằng chính _parse_job_fields của crawler
+# để có đúng bộ cột, rồi sinh ROWS dòng với lương/địa điểm/tuổi/quy mô/phúc lợi/mô tả thay đổi ngẫu nhiên.
+# ===========================================================
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_ROOT_DIR = Path(__file__).resolve().parents[1]
+for _p in (_ROOT_DIR, _ROOT_DIR / "processor"):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
+
+from common import frames, fx_rates  # noqa: E402
+from preprocess import _apply_pipeline  # noqa: E402
+
+MODES = {
+    "before": {"PREPROCESS_CHECKPOINT_STEPS": "all", "PREPROCESS_CHECKPOINT_FORMAT": "xlsx"},
+    "after": {"PREPROCESS_CHECKPOINT_STEPS": "", "PREPROCESS_CHECKPOINT_FORMAT": "pickle"},
+}
+
+_SALARIES = ["Thương lượng", "15 tr-25 tr ₫/tháng", "Tới 30 tr ₫/tháng", "$1,000-$2,000 /tháng",
+             "Từ 12 tr ₫/tháng", "8 tr-12 tr ₫/tháng", "Tới $3,500 /tháng", "Trên 40 tr ₫/tháng", "Cạnh tranh"]
+_CITIES = ["Hồ Chí Minh", "Hà Nội", "Đà Nẵng", "Bình Dương", "Hồ Chí Minh, Hà Nội", "Cần Thơ", "Đồng Nai"]
+_AGES = ["20-27", "22-35", "25-40", "Không hiển thị", "18-30"]
+_SIZES = ["100-499nhân viên", "25-99nhân viên", "1.000-4.999nhân viên", "10-24nhân viên", "500-999nhân viên"]
+_BENEFITS = ["Thưởng tháng 13", "Bảo hiểm sức khỏe", "Laptop", "Du lịch hàng năm", "Đào tạo", "Lương cạnh tranh",
+             "Thưởng KPI", "Work from home", "Khám sức khỏe định kỳ", "Phụ cấp ăn trưa", "Nghỉ phép 15 ngày/năm",
+             "Team building", "Performance bonus", "Premium health insurance"]
+_EXTRA = ["Ưu tiên ứng viên biết tiếng Anh (IELTS 6.0) hoặc tiếng Nhật N2.", "Làm việc từ thứ 2 đến thứ 6.",
+          "Thu nhập 20-30 triệu tuỳ năng lực.", "Good communication skills in English.",
+          "Có ít nhất 2 năm kinh nghiệm ở vị trí tương đương."]
+
+
+def make_sample(n_rows: int, seed: int):
+    """Sinh DataFrame giống file chi tiết của 1 ngành, từ trang chi tiết thật đã lưu (xem đầu tệp)."""
+    import pandas as pd
+    from bs4 import BeautifulSoup
+    from crawler.selenium_scraper import _parse_job_fields
+
+    html = (_ROOT_DIR / "htmldetails.txt").read_text(encoding="utf-8")
+    base = _parse_job_fields(BeautifulSoup(html, "html.parser"), "", 0, "")
+    rnd = random.Random(seed)
+    desc = [ln for ln in str(base.get("Mô tả công việc", "")).split("\n") if ln.strip()]
+    req = [ln for ln in str(base.get("Yêu cầu công việc", "")).split("\n") if ln.strip()]
+    rows = []
+    for i in range(n_rows):
+        row = dict(base)
+        row.update({
+            "ID": 1000001 + i,
+            "Tên công việc": f"{base['Tên công việc']} #{i}",
+            "Lương": rnd.choice(_SALARIES),
+            "Lượt xem": f"{rnd.randint(10, 5000)}lượt xem",
+            "Địa điểm tuyển dụng": rnd.choice(_CITIES),
+            "Mô tả công việc": "\n".join(rnd.sample(desc, len(desc)) + rnd.sample(_EXTRA, 2)),
+            "Yêu cầu công việc": "\n".join(rnd.sample(req, len(req)) + rnd.sample(_EXTRA, 1)),
+            "Phúc lợi": "\n".join(rnd.sample(_BENEFITS, rnd.randint(2, 6))),
+            "ĐỘ TUỔI MONG MUỐN": rnd.choice(_AGES),
+            "Quy mô công ty": rnd.choice(_SIZES),
+            "HREF": f"https://www.vietnamworks.com/sample-{i}-jv",
+        })
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def run_once(df, out_file: Path, env: dict) -> dict:
+    """1 lượt pipeline + xuất file với biến môi trường env; trả về timings (giây) + 'total'."""
+    saved = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    try:
+        timings = {}
+        t_all = time.perf_counter()
+        df_done = _apply_pipeline(df.copy(), out_file, timings)
+        t0 = time.perf_counter()
+        frames.write_frame(df_done, out_file)
+        timings["export"] = round(time.perf_counter() - t0, 3)
+        timings["total"] = round(time.perf_counter() - t_all, 3)
+        return timings
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _bench(df, src: Path, repeat: int, tmp: Path) -> dict:
+    """Lượt nóng máy + repeat vòng (xen kẽ 2 chế độ); trả về lượt nhanh nhất của từng chế độ."""
+    best = {}
+    out_file = tmp / f"{src.stem}_preprocessed{frames.interchange_suffix()}"
+    print("Lượt nóng máy (không tính)...")
+    run_once(df, out_file, MODES["after"])
+    for i in range(max(1, repeat)):
+        # Xen kẽ 2 chế độ để nhiễu của máy chia đều
+        for mode, env in MODES.items():
+            t = run_once(df, out_file, env)
+            print(f"  [{i + 1}] {mode:6s}: {t['total']:8.2f}s")
+            if mode not in best or t["total"] < best[mode]["total"]:
+                best[mode] = t
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark preprocess: checkpoint Excel mọi bước vs mặc định")
+    ap.add_argument("input", type=Path, nargs="?", help="file chi tiết đầu vào (parquet / xlsx) của 1 ngành")
+    ap.add_argument("--synthetic", type=int, default=0, help="không có input: sinh N dòng (xem đầu tệp)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeat", type=int, default=1, help="số lượt mỗi chế độ (lấy lượt nhanh nhất)")
+    ap.add_argument("--json", type=Path, default=None, help="ghi kết quả ra file JSON")
+    args = ap.parse_args()
+    if args.input is None and args.synthetic <= 0:
+        ap.error("cần file input hoặc --synthetic N")
+
+    with tempfile.TemporaryDirectory(prefix="bench_preprocess_") as tmp:
+        if args.input is not None:
+            src = args.input
+            df = frames.read_frame(src)
+        else:
+            # Ghi ra xlsx như file chi tiết của crawler rồi đọc lại -> kiểu dữ liệu giống đầu vào thật
+            src = Path(tmp) / f"job_detail_output_synthetic_{args.synthetic}.xlsx"
+            make_sample(args.synthetic, args.seed).to_excel(src, index=False)
+            df = frames.read_frame(src)
+        n_bytes = src.stat().st_size
+        print(f"Input: {src.name} — {df.shape[0]} dòng × {df.shape[1]} cột ({n_bytes / 1e6:.1f} MB)")
+        fx_rates.refresh_if_stale()
+        best = _bench(df, src, args.repeat, Path(tmp))
+
+    tail = ["checkpoint", "export", "total"]
+    steps = [k for k in best["before"] if k not in tail]
+    steps += [k for k in best["after"] if k not in steps and k not in tail]
+    print(f"\n{'bước':16s} {'trước (s)':>10s} {'sau (s)':>10s}")
+    for k in steps + tail:
+        b, a = best["before"].get(k), best["after"].get(k)
+        print(f"{k:16s} {b if b is not None else '-':>10} {a if a is not None else '-':>10}")
+    speedup = best["before"]["total"] / best["after"]["total"] if best["after"]["total"] else float("nan")
+    print(f"Nhanh hơn: ×{speedup:.2f}")
+
+    if args.json is not None:
+        report = {"input": str(args.input) if args.input is not None else f"synthetic:{args.synthetic}:seed={args.seed}",
+                  "rows": int(df.shape[0]), "cols": int(df.shape[1]), "bytes": n_bytes, "repeat": args.repeat,
+                  "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                              "cpus": os.cpu_count()},
+                  "before": best["before"], "after": best["after"], "speedup": round(speedup, 2)}
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Đã ghi {args.json}")
+
+
+if __name__ == "__main__":
+    main()
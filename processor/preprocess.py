@@ -1,62 +1,43 @@
 # -*- coding: utf-8 -*-
 from pathlib import Path
-import requests
 import time
-from typing import Dict, Any, List, Tuple, Optional, Callable, Iterable
-import os, re, sys
+from typing import Dict, Any, List, Tuple, Optional, Callable, Iterable, NamedTuple
+from functools import lru_cache
+import os, re, sys, json, io, contextlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 import pandas as pd
 
-# Mẫu: job_detail_output_giao duc_g1_1001_2025-09-01_091843.xlsx
-# Biểu thức chính quy để bắt tên file chi tiết theo cấu trúc cố định.
-# Nhóm đặt tên (slug, gid, loc, date, time) giúp tách thông tin phục vụ xử lý tiếp theo:
-#   - slug: tên ngành đã slug hoá (có thể chứa khoảng trắng/underscore), dùng non-greedy (.+?)
-#   - gid : group id (chỉ số), bắt \d+ để đảm bảo là số
-#   - loc : mã địa điểm 4 chữ số (ví dụ 1001)
-#   - date: ngày dạng YYYY-MM-DD
-#   - time: giờ dạng HHMMSS
-# Lưu ý: re.IGNORECASE để không nhạy hoa/thường; nếu thay đổi mẫu tên tệp → cần cập nhật lại regex này.
-FNAME_RE = re.compile(
-    r"^job_detail_output_(?P<slug>.+?)_g(?P<gid>\d+)_(?P<loc>\d{4})_(?P<date>\d{4}-\d{2}-\d{2})_(?P<time>\d{6})\.xlsx$",
-    re.IGNORECASE
-)
+# cho phép import module dùng chung (common.*) khi chạy `python processor/preprocess.py`
+_ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(_ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(_ROOT_DIR))
+
+from common.events import ProgressReporter, emit_event
+from common import artifacts, frames, fx_rates, llm_cache, memo, stage_cache, textnorm
+from common.textnorm import strip_accents
+from common.memo import memo_apply, memo_apply_rows
 
-def _parse_dt(date_str: str, time_str: str) -> datetime:
-    # Chuyển cặp chuỗi (YYYY-MM-DD, HHMMSS) → đối tượng datetime
-    # Dùng khi so sánh “mới nhất” giữa các file có cùng (slug, gid, loc).
-    # Ưu điểm: so sánh datetime an toàn hơn so sánh chuỗi.
-    return datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H%M%S")
+_PARSER_VERSION: Optional[str] = None
+
+def _parser_version() -> str:
+    # Phiên bản bảng nhớ parser (common/memo.py) = hash mã nguồn file này + bỏ dấu (textnorm, parser gọi
+    # strip_accents/fold) + chính memo.py -> sửa parser hoặc cách bỏ dấu thì bảng cũ trên đĩa tự bỏ
+    global _PARSER_VERSION
+    if _PARSER_VERSION is None:
+        _PARSER_VERSION = stage_cache.code_version(Path(__file__), Path(textnorm.__file__), Path(memo.__file__))
+    return _PARSER_VERSION
 
 def get_latest_detail_files(base_dir: Path) -> list[Path]:
     """
-    Quét base_dir, gom nhóm theo (slug, gid, loc), chọn file có timestamp mới nhất.
-    Trả về list Path các file mới nhất (mỗi nhóm 1 file).
-
-    Cách làm:
-    - Duyệt tất cả tệp trong thư mục; khớp tên bằng FNAME_RE để loại những tệp ngoại lệ.
-    - Với mỗi key (slug, gid, loc), lưu lại (datetime, path) mới nhất.
-    - Kết quả trả về chỉ còn path của phần tử mới nhất cho từng nhóm.
+    File chi tiết mới nhất cho mỗi (slug, gid, loc) trong base_dir.
+    Tra từ catalog (common/artifacts.py) — crawler ghi nhận file khi tạo, không phải quét & parse tên file.
     """
-    latest: dict[tuple, tuple[datetime, Path]] = {}
     if not base_dir.exists():
         raise FileNotFoundError(f"Không tìm thấy thư mục: {base_dir}")
-
-    for p in base_dir.iterdir():
-        if not p.is_file():
-            continue
-        m = FNAME_RE.match(p.name)
-        if not m:
-            continue
-        slug = m.group("slug")
-        gid = m.group("gid")
-        loc = m.group("loc")
-        dt = _parse_dt(m.group("date"), m.group("time"))
-        key = (slug, gid, loc)
-        cur = latest.get(key)
-        if cur is None or dt > cur[0]:
-            latest[key] = (dt, p)
-
-    return [info[1] for info in latest.values()]
+    return artifacts.catalog().latest_paths("detail", base_dir)
 
 def save_combined_with_timestamp(df: pd.DataFrame, out_dir: Path, prefix: str = "job_detail_output__combined"):
     # Gộp nhiều file → xuất 1 file mới kèm timestamp, tránh ghi đè và giúp truy vết lần chạy.
@@ -69,13 +50,8 @@ def save_combined_with_timestamp(df: pd.DataFrame, out_dir: Path, prefix: str =
 # TIỀN XỬ LÝ: ĐỔI TÊN CỘT KHÔNG DẤU, NGẮN GỌN
 # ==========================
 def strip_diacritics(s: str) -> str:
-    # chuẩn hoá về ascii: bỏ dấu, lower, gọn khoảng trắng
-    # Lưu ý QUAN TRỌNG: Hàm này dùng unicodedata nhưng module chưa được import ở đầu file.
-    # Khi chạy thực tế cần `import unicodedata` (không thay vào đây theo yêu cầu “không đổi code”).
-    s_norm = unicodedata.normalize("NFD", str(s))
-    s_ascii = "".join(ch for ch in s_norm if unicodedata.category(ch) != "Mn")
-    s_ascii = s_ascii.replace("Đ", "D").replace("đ", "d")
-    return " ".join(s_ascii.lower().split())
+    # chuẩn hoá về ascii: bỏ dấu (kể cả Đ/đ), lower, gọn khoảng trắng
+    return " ".join(textnorm.no_accent_lower(s).split())
 
 def build_column_map():
     """
@@ -168,7 +144,8 @@ def call_gpt(prompt: str, model: str = "gpt-4o-mini") -> str:
     # - Lỗi ở cả 2 nhánh → ném RuntimeError để caller biết nguyên nhân (ghi rõ 2 lỗi new/legacy).
     # Lưu ý vận hành:
     # - Cần biến môi trường OPENAI_API_KEY khi dùng SDK cũ; SDK mới cũng yêu cầu cấu hình khoá phù hợp.
-    # - Khi chạy trong môi trường offline/CI không có internet → sẽ fail, cần chặn hoặc mock ở tầng gọi.
+    # - Khi chạy trong môi trường offline/CI không có internet → sẽ fail; dùng server giả lập common/llm_stub.py
+    #   qua OPENAI_BASE_URL=http://127.0.0.1:8765/v1 (SDK mới tự đọc biến này).
     try:
         from openai import OpenAI  # type: ignore
         client = OpenAI()
@@ -187,6 +164,8 @@ def call_gpt(prompt: str, model: str = "gpt-4o-mini") -> str:
         try:
             import openai as openai_legacy  # type: ignore
             openai_legacy.api_key = os.getenv("OPENAI_API_KEY")
+            if os.getenv("OPENAI_BASE_URL"):
+                openai_legacy.api_base = os.getenv("OPENAI_BASE_URL")
             completion = openai_legacy.ChatCompletion.create(
                 model=model,
                 messages=[
@@ -230,22 +209,20 @@ CURRENCY_MAP = {
 # Các biến thể có dấu/gạch chéo/gạch nối cũng được liệt kê để tăng độ phủ.
 VIET_VND_HINTS = [" tr", "tr/", "tr-", "triệu", "trieu", " triệu", "tr/tháng", "tr/thang", "k/", "k/thang", "k/tháng"]
 
-def normalize_text(s: str) -> str:
-    # Chuẩn hoá chuỗi trước khi dò: None -> "", ép str, lower, trim,
-    # rồi bỏ dấu bằng strip_accents (HÀM NÀY PHẢI TỒN TẠI ở nơi khác — nếu chưa có, cần định nghĩa).
-    # Mục tiêu: tăng độ “khớp” token cho tiếng Việt có/không dấu.
-    if s is None:
-        return ""
-    return strip_accents(str(s).lower().strip())
-
-
 def is_negotiation(s: str) -> bool:
     # Phát hiện “thương lượng/negotiable” dựa trên danh sách NEGOTIATION_TOKENS đã chuẩn bị.
     # Ý nghĩa: phân tách nhóm lương không có con số cụ thể ra khỏi nhóm có thể định lượng.
-    txt = normalize_text(s)
+    return _is_negotiation_norm(normalize_text(s))
+
+def _is_negotiation_norm(txt: str) -> bool:
+    # Như is_negotiation nhưng nhận chuỗi đã normalize_text (dùng trong parse_salary)
     return any(tok in txt for tok in NEGOTIATION_TOKENS)
 
 def regex_currency_guess(s: str) -> str | None:
+    # Xem _regex_currency_guess_norm; hàm này chỉ chuẩn hoá chuỗi trước.
+    return _regex_currency_guess_norm(normalize_text(s))
+
+def _regex_currency_guess_norm(txt: str) -> str | None:
     """Đoán nhanh loại tiền tệ bằng regex/ký hiệu/hints thường gặp để giảm số lần gọi GPT.
     Chiến lược theo tầng:
       (1) Ký hiệu/cụm từ đặc thù → chắc chắn (₫, vnđ, vnd, đồng; €, eur; £, gbp; ₩, krw; ฿, thb; s$, sgd).
@@ -253,8 +230,8 @@ def regex_currency_guess(s: str) -> str | None:
       (3) Ký hiệu ¥: phân rẽ JPY/CNY bằng ngữ cảnh đi kèm (yen/jpy hay cny/rmb/yuan/人民币/元).
       (4) Heuristic tiếng Việt: “tr/triệu/k …/tháng” → VND.
       (5) Không xác định được → None để upper-layer hỏi GPT.
-    Lưu ý: đây là "best-effort", chấp nhận một số biên lỗi và sẽ được vá bằng fix rules phía sau."""
-    txt = normalize_text(s)
+    Lưu ý: đây là "best-effort", chấp nhận một số biên lỗi và sẽ được vá bằng fix rules phía sau.
+    Đầu vào là chuỗi đã normalize_text."""
 
     # 1) Ký hiệu đặc thù ⇒ chắc chắn
     if any(sym in txt for sym in ["₫", "vnđ", "vnd", "đồng"]):  # VND
@@ -290,24 +267,118 @@ def regex_currency_guess(s: str) -> str | None:
     # 5) Không chắc
     return None
 
+CURRENCY_CODES = ("VND", "USD", "EUR", "GBP", "JPY", "CNY", "KRW", "SGD", "THB")
+
+# Gọi GPT theo lô: mỗi prompt gom tối đa GPT_BATCH_SIZE chuỗi (trả về JSON), tối đa GPT_MAX_CONCURRENCY
+# prompt song song, và không quá GPT_MAX_CALLS prompt cho mỗi lượt (mỗi file) -> chi phí có trần.
+GPT_BATCH_SIZE = int(os.getenv("GPT_BATCH_SIZE", "25"))
+GPT_MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", "4"))
+GPT_MAX_CALLS = int(os.getenv("GPT_MAX_CALLS", "40"))
+
+# Thống kê GPT của file đang xử lý (process_one_file reset + đưa vào sự kiện preprocess_done)
+GPT_STATS: Dict[str, float] = {}
+
+def _gpt_stats_reset() -> None:
+    GPT_STATS.clear()
+    GPT_STATS.update(strings=0, cache_hits=0, asked=0, answered=0, skipped=0,
+                     api_calls=0, api_errors=0, wall_s=0.0, call_s=0.0)
+
+_gpt_stats_reset()
+
 def gpt_currency_guess(s: str, model: str = "gpt-4o-mini") -> str | None:
-    """Hỏi GPT để xác định mã tiền tệ khi regex không chắc. Trả về 1 mã trong {VND,USD,EUR,GBP,JPY,CNY,KRW,SGD,THB}.
-    Lưu ý vận hành:
-    - Chỉ gọi khi regex_currency_guess trả None để tiết kiệm chi phí.
-    - Prompt yêu cầu trả đúng một mã, viết in hoa, không giải thích.
-    - Có khối try/except để không làm gãy pipeline khi GPT lỗi (mạng/model)."""
-    prompt = f"""Bạn là bộ phân loại tiền tệ. Văn bản lương: {s!r}
-Hãy trả về đúng một mã tiền tệ trong tập sau: VND, USD, EUR, GBP, JPY, CNY, KRW, SGD, THB.
-Chỉ trả về duy nhất mã (ví dụ: VND). Không giải thích thêm."""
-    try:
-        raw = call_gpt(prompt, model=model)
-        code = (raw or "").strip().upper()
-        if code in {"VND","USD","EUR","GBP","JPY","CNY","KRW","SGD","THB"}:
-            return code
-    except Exception as e:
-        # Không fail pipeline; chỉ cảnh báo để có thể kiểm tra log khi cần.
-        print(f"[WARN] GPT nhận dạng tiền tệ lỗi: {e}")
-    return None
+    """Hỏi GPT loại tiền tệ của 1 chuỗi lương (giữ cho tương thích; pipeline dùng gpt_currency_guess_batch).
+    Trả về 1 mã trong CURRENCY_CODES hoặc None nếu GPT lỗi/trả lời không hợp lệ."""
+    return gpt_currency_guess_batch([s], model=model).get(s)
+
+def _currency_batch_prompt(items: List[Tuple[int, str]]) -> str:
+    # Dòng ITEMS_JSON cuối prompt là dữ liệu; server giả lập (common/llm_stub.py) cũng đọc dòng này.
+    return ("Bạn là bộ phân loại tiền tệ cho văn bản lương tuyển dụng.\n"
+            f"Với mỗi mục, chọn đúng một mã tiền tệ trong tập sau: {', '.join(CURRENCY_CODES)}.\n"
+            'Chỉ trả về một object JSON dạng {"<id>": "<MÃ>"} cho đủ mọi id. Không giải thích thêm.\n'
+            "ITEMS_JSON: " + json.dumps([{"id": i, "text": t} for i, t in items], ensure_ascii=False))
+
+def _parse_currency_batch_answer(raw: str, n: int) -> Dict[int, str]:
+    # Lấy object JSON đầu tiên trong câu trả lời (model đôi khi bọc trong ```json ... ```); mã lạ thì bỏ.
+    m = re.search(r"\{.*\}", raw or "", re.DOTALL)
+    data = json.loads(m.group(0)) if m else {}
+    out = {}
+    for i in range(n):
+        code = str(data.get(str(i), "")).strip().upper()
+        if code in CURRENCY_CODES:
+            out[i] = code
+    return out
+
+def gpt_currency_guess_batch(texts: Iterable[str], model: str = "gpt-4o-mini") -> Dict[str, Optional[str]]:
+    """
+    Hỏi GPT loại tiền tệ cho nhiều chuỗi lương 1 lượt. Trả về {chuỗi: mã | None}.
+    - Khoá cache = normalize_text(chuỗi) + model; trúng cache bền (common/llm_cache.py) thì không gọi.
+    - Phần còn lại: gom GPT_BATCH_SIZE chuỗi/prompt (trả lời JSON), chạy song song GPT_MAX_CONCURRENCY prompt,
+      tối đa GPT_MAX_CALLS prompt; vượt trần thì các chuỗi còn lại trả None (như khi GPT lỗi).
+    - Chỉ lưu cache các mã hợp lệ; lô lỗi (mạng/JSON hỏng) chỉ cảnh báo, không làm gãy pipeline.
+    """
+    texts = [t for t in dict.fromkeys(texts) if t]
+    key_of = {t: normalize_text(t) for t in texts}
+    sample: Dict[str, str] = {}
+    for t, k in key_of.items():
+        sample.setdefault(k, t)          # gửi GPT chuỗi gốc (còn dấu) đại diện cho mỗi khoá
+    keys = list(sample)
+
+    store = llm_cache.cache()
+    known = store.get_many("currency", model, keys) if store and keys else {}
+    misses = [k for k in keys if k not in known]
+    batches = [misses[i:i + GPT_BATCH_SIZE] for i in range(0, len(misses), max(1, GPT_BATCH_SIZE))]
+    skipped = sum(len(b) for b in batches[GPT_MAX_CALLS:])
+    if skipped:
+        print(f"[WARN] GPT: vượt trần {GPT_MAX_CALLS} lần gọi -> bỏ qua {skipped} chuỗi (loai_tien_te để trống)")
+    batches = batches[:GPT_MAX_CALLS]
+
+    def _ask(batch: List[str]):
+        t0 = time.perf_counter()
+        try:
+            raw = call_gpt(_currency_batch_prompt([(i, sample[k]) for i, k in enumerate(batch)]), model=model)
+            got = _parse_currency_batch_answer(raw, len(batch))
+            return {batch[i]: code for i, code in got.items()}, time.perf_counter() - t0, None
+        except Exception as e:
+            return {}, time.perf_counter() - t0, e
+
+    fresh: Dict[str, str] = {}
+    t_wall = time.perf_counter()
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(GPT_MAX_CONCURRENCY, len(batches)))) as ex:
+            for got, dt, err in ex.map(_ask, batches):
+                GPT_STATS["api_calls"] += 1
+                GPT_STATS["call_s"] += dt
+                if err is not None:
+                    GPT_STATS["api_errors"] += 1
+                    # Không fail pipeline; chỉ cảnh báo để có thể kiểm tra log khi cần.
+                    print(f"[WARN] GPT nhận dạng tiền tệ lỗi: {err}")
+                fresh.update(got)
+        if store:
+            store.put_many("currency", model, fresh)
+    GPT_STATS["wall_s"] += time.perf_counter() - t_wall
+    GPT_STATS["strings"] += len(keys)
+    GPT_STATS["cache_hits"] += len(keys) - len(misses)
+    GPT_STATS["asked"] += len(misses) - skipped
+    GPT_STATS["answered"] += len(fresh)
+    GPT_STATS["skipped"] += skipped
+
+    known.update(fresh)
+    return {t: known.get(key_of[t]) for t in texts}
+
+def gpt_stats_summary() -> Dict[str, float]:
+    """
+    Số lần gọi/độ trễ tiết kiệm được so với cách cũ (1 lần gọi tuần tự cho mỗi chuỗi):
+    calls_saved = số chuỗi - số lần gọi thật; latency_saved_s ước lượng = calls_saved × độ trễ TB mỗi lần gọi
+    (cận trên: 1 prompt nhiều chuỗi thường chậm hơn 1 prompt 1 chuỗi) + phần song song hoá.
+    """
+    st = dict(GPT_STATS)
+    calls = st["api_calls"]
+    avg = st["call_s"] / calls if calls else None
+    st["calls_saved"] = max(0, st["strings"] - calls)
+    st["avg_call_s"] = round(avg, 3) if avg else None
+    st["latency_saved_s"] = round(st["strings"] * avg - st["wall_s"], 1) if avg else None
+    st["wall_s"], st["call_s"] = round(st["wall_s"], 3), round(st["call_s"], 3)
+    return st
 
 def add_salary_columns_check_loai(df: pd.DataFrame, model: str = "gpt-4o-mini") -> pd.DataFrame:
     """
@@ -340,89 +411,103 @@ def add_salary_columns_check_loai(df: pd.DataFrame, model: str = "gpt-4o-mini")
         else:
             df["check_luong"] = None
 
-    for idx, val in df["luong"].items():
-        # Xử lý từng ô lương: chuẩn hoá text, check "thương lượng", suy đoán tiền tệ.
+    def _check_one(val):
+        # Xử lý 1 ô lương: chuẩn hoá text, check "thương lượng", suy đoán tiền tệ.
+        # Trả về (check_luong, loai_tien_te, có_ghi_loai_tien_te_không)
         text = str(val) if pd.notna(val) else ""
         if not text:
-            df.at[idx, "check_luong"] = False
-            continue
+            return False, None, False
 
-        # 1) check_luong
-        negotiable = is_negotiation(text)
-        df.at[idx, "check_luong"] = not negotiable
+        # 1) check_luong (parse_salary: chuẩn hoá + dò 1 lần cho mọi bước lương)
+        info = parse_salary(text)
 
         # 2) Điền loai_tien_te
-        if negotiable:
+        if info.negotiable:
             # Thương lượng ⇒ không suy đoán tiền tệ (đánh dấu 'no_info' để downstream biết lý do trống)
-            df.at[idx, "loai_tien_te"] = "no_info"
-            continue
-
-        # Ưu tiên regex (nhanh, rẻ)
-        code = regex_currency_guess(text)
-        if code is None:
-            # Cuối cùng mới hỏi GPT (tốn phí/thời gian)
-            code = gpt_currency_guess(text, model=model)
-        df.at[idx, "loai_tien_te"] = code
+            return False, "no_info", True
+
+        # Ưu tiên regex (nhanh, rẻ); None -> hỏi GPT theo lô ở dưới
+        return True, info.currency, True
+
+    # Mỗi chuỗi lương khác nhau chỉ xử lý 1 lần
+    res = memo_apply(df["luong"], _check_one).tolist()
+
+    # Cuối cùng mới hỏi GPT (tốn phí/thời gian): gom mọi chuỗi regex chưa đoán được -> 1 lượt theo lô,
+    # qua cache bền (chuỗi mập mờ lặp lại mỗi tuần không phải hỏi lại)
+    pending = [str(v) for v, r in zip(df["luong"], res) if r[0] and r[1] is None]
+    if pending:
+        guessed = gpt_currency_guess_batch(pending, model=model)
+        res = [(r[0], guessed.get(str(v)), r[2]) if r[0] and r[1] is None else r
+               for v, r in zip(df["luong"], res)]
+        st = gpt_stats_summary()
+        print(f"  🤖 GPT tiền tệ: {st['strings']} chuỗi, trúng cache {st['cache_hits']}, "
+              f"{st['api_calls']} lần gọi (lỗi {st['api_errors']}), tiết kiệm {st['calls_saved']} lần gọi"
+              + (f" ≈ {st['latency_saved_s']}s" if st["latency_saved_s"] is not None else ""))
+
+    df["check_luong"] = [r[0] for r in res]
+    has_code = [r[2] for r in res]
+    df.loc[has_code, "loai_tien_te"] = [r[1] for r in res if r[2]]
     return df
 #============================================
+def _salary_num_mean(text: str):
+    # Lấy trung bình các số xuất hiện trong chuỗi (hỗ trợ "10-15", "10,000", "1.2")
+    # Dùng làm "độ lớn" xấp xỉ để áp quy tắc phân biệt VND/USD ở một số câu chữ mập mờ.
+    s = str(text)
+    s = s.replace(",", "")  # bỏ dấu phẩy ngăn cách nghìn
+    nums = re.findall(r"\d+(?:\.\d+)?", s)
+    if not nums:
+        return None
+    vals = [float(n) for n in nums]
+    return sum(vals) / len(vals)
+
+def _has_tr_token(text: str) -> bool:
+    # Phát hiện token “tr” (triệu) theo cách khoan dung (có thể dính số).
+    t = str(text).lower()
+    return bool(re.search(r"\d+\s*tr\b", t) or re.search(r"\btr\b", t))
+
+def _currency_conflict_hint(t: str) -> tuple[str | None, str]:
+    # Tín hiệu xung đột tiền tệ trong chuỗi lương gốc -> (mã tiền nên sửa thành, lý do) hoặc (None, "").
+    t_lower = t.lower()
+    has_dollar = "$" in t
+    has_tr = _has_tr_token(t_lower)
+    has_d = ("đ" in t_lower) or ("₫" in t)
+    has_ty = ("tỷ" in t_lower) or ("ty" in t_lower)
+
+    # 1) Có cả $ và tr -> VND
+    # Lý do: nhiều JD ghi "20-30tr$" (hoặc "$ 20-30tr") theo thói quen, thực chất là triệu VND.
+    if has_dollar and has_tr:
+        return "VND", "Có cả ký hiệu $ và 'tr' → sửa loại tiền tệ thành VND"
+
+    # 2) Chỉ có đ/₫ (không có $, không có 'tr', không có 'tỷ/ty') và giá trị < 500000 -> USD
+    # Trực giác: số nhỏ kèm đ/₫ đôi khi là đơn giá/giờ theo USD nhưng viết nhầm/ký hiệu gây nhiễu.
+    # Quy tắc này "mạnh tay", có thể điều chỉnh ngưỡng/điều kiện khi đánh giá thực tế.
+    if has_d and (not has_dollar) and (not has_tr) and (not has_ty):
+        val = _salary_num_mean(t)
+        if val is not None and val < 500000:
+            return "USD", "Chỉ có ký hiệu đ/₫, không có $/tr/tỷ/ty và giá trị < 500000 → sửa loại tiền tệ thành USD"
+    return None, ""
+
 def fix_currency_conflict(df, col_salary="luong", col_currency="loai_tien_te"):
     # Sửa/chuẩn hoá loại tiền tệ khi phát hiện xung đột tín hiệu trong chuỗi lương.
     # Đây là “hậu kiểm” (post-fix) sau khi đã đoán tiền tệ, nhằm giảm lỗi phổ biến:
     #   (1) Có đồng thời "$" và "tr" → nhiều khả năng là VND (đơn vị hiển thị dùng $, nhưng thực chất là triệu VND).
     #   (2) Có đ/₫ nhưng số nhỏ bất thường (val < 500000) và không có dấu hiệu VND khác → có thể là USD (ví dụ "400 đ/giờ").
-    import re
-
-    def _num_mean(text: str):
-        # Lấy trung bình các số xuất hiện trong chuỗi (hỗ trợ "10-15", "10,000", "1.2")
-        # Dùng làm "độ lớn" xấp xỉ để áp quy tắc phân biệt VND/USD ở một số câu chữ mập mờ.
-        s = str(text)
-        s = s.replace(",", "")  # bỏ dấu phẩy ngăn cách nghìn
-        nums = re.findall(r"\d+(?:\.\d+)?", s)
-        if not nums:
-            return None
-        vals = [float(n) for n in nums]
-        return sum(vals) / len(vals)
-
-    def _has_tr_token(text: str) -> bool:
-        # Phát hiện token “tr” (triệu) theo cách khoan dung (có thể dính số).
-        t = str(text).lower()
-        return bool(re.search(r"\d+\s*tr\b", t) or re.search(r"\btr\b", t))
-
-    fixes = []
-    for i, row in df.iterrows():
-        text = row.get(col_salary, "")
-        cur = row.get(col_currency, None)
-
-        t = str(text)
-        t_lower = t.lower()
-        has_dollar = "$" in t
-        has_tr = _has_tr_token(t_lower)
-        has_d = ("đ" in t_lower) or ("₫" in t)
-        has_ty = ("tỷ" in t_lower) or ("ty" in t_lower)
-
-        val = _num_mean(t)
-        new_cur = cur
-        reason = ""
-
-        # 1) Có cả $ và tr -> VND
-        # Lý do: nhiều JD ghi "20-30tr$" (hoặc "$ 20-30tr") theo thói quen, thực chất là triệu VND.
-        if has_dollar and has_tr:
-            if new_cur != "VND":
-                new_cur = "VND"
-                reason = "Có cả ký hiệu $ và 'tr' → sửa loại tiền tệ thành VND"
-
-        # 2) Chỉ có đ/₫ (không có $, không có 'tr', không có 'tỷ/ty') và giá trị < 500000 -> USD
-        # Trực giác: số nhỏ kèm đ/₫ đôi khi là đơn giá/giờ theo USD nhưng viết nhầm/ký hiệu gây nhiễu.
-        # Quy tắc này "mạnh tay", có thể điều chỉnh ngưỡng/điều kiện khi đánh giá thực tế.
-        elif has_d and (not has_dollar) and (not has_tr) and (not has_ty) \
-                and (val is not None) and (val < 500000):
-            if new_cur != "USD":
-                new_cur = "USD"
-                reason = "Chỉ có ký hiệu đ/₫, không có $/tr/tỷ/ty và giá trị < 500000 → sửa loại tiền tệ thành USD"
-
-        # Ghi kết quả
-        df.at[i, col_currency] = new_cur
-        fixes.append(reason)
+    # Tín hiệu lấy từ parse_salary (_currency_conflict_hint), mỗi chuỗi lương chỉ dò 1 lần.
+    def _fix_one(key):
+        text, cur = key
+        hint_cur, hint_reason = parse_salary(str(text)).conflict
+        if hint_cur is not None and cur != hint_cur:
+            return hint_cur, hint_reason
+        return cur, ""
+
+    # Xử lý theo từng cặp (chuỗi lương, tiền tệ) khác nhau thay vì từng dòng
+    keys = pd.DataFrame({
+        "text": df[col_salary] if col_salary in df.columns else "",
+        "cur": df[col_currency] if col_currency in df.columns else None,
+    }, index=df.index)
+    res = memo_apply_rows(keys, ["text", "cur"], _fix_one)
+    df[col_currency] = [r[0] for r in res]
+    fixes = [r[1] for r in res]
 
     # Lưu cột lý do để phục vụ audit/debug về sau (biết vì sao bị đổi).
     df["fix_reason"] = fixes
@@ -436,8 +521,10 @@ def detect_period(text: str) -> str | None:
     # Trả về một trong: {'thang','nam','tuan','gio'} hoặc None nếu không xác định được.
     if not isinstance(text, str):
         return None
-    t = strip_accents(text.lower())
+    return _detect_period_noacc(strip_accents(text.lower()))
 
+def _detect_period_noacc(t: str) -> str | None:
+    # Như detect_period nhưng nhận chuỗi đã lower + bỏ dấu (dùng trong parse_salary)
     if re.search(r'(thang|/thang|month|/month|per month|mo|mth)', t):
         return 'thang'
     if re.search(r'(nam|/nam|year|/year|per year|yr)', t):
@@ -448,12 +535,6 @@ def detect_period(text: str) -> str | None:
         return 'gio'
     return None
 
-# Bỏ dấu
-def strip_accents(s: str) -> str:
-    # Chuẩn hoá chuỗi về dạng “không dấu” bằng Unicode NFD.
-    # Lưu ý: cần import unicodedata ở phạm vi module trước khi gọi (đã dùng ở các phần khác).
-    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-
 # --- Helpers số ---
 def _parse_number_million(raw_num: str) -> float | None:
     """Dùng khi có đơn vị 'tr/triệu' => trả về số TRIỆU (float).
@@ -505,15 +586,16 @@ def parse_salary_cell(cell: str):
     # Nếu không bóc được → (None, None, None, period) hoặc nếu “thương lượng” → ('no_info', ...).
     if not isinstance(cell, str):
         return ("no_info", "no_info", "no_info", "no_info")
+    return parse_salary(cell).amounts
 
-    text = cell.strip()
-    text_noacc = strip_accents(text.lower())
+def _parse_salary_amounts(text: str, text_noacc: str):
+    # Thân của parse_salary_cell: text đã strip, text_noacc = strip_accents(text.lower()).
 
     # Nếu là thương lượng → không định lượng được
     if "thuong luong" in text_noacc or "thương lượng" in text.lower():
         return ("no_info", "no_info", "no_info", "no_info")
 
-    period = detect_period(text)
+    period = _detect_period_noacc(text_noacc)
 
     # 1) Khoảng: [num1][tr?] - [num2][tr?]
     m_range = re.search(
@@ -559,6 +641,50 @@ def parse_salary_cell(cell: str):
     # Không match gì đáng tin → trả None cho 3 giá trị, vẫn giữ 'period' nếu có
     return (None, None, None, period)
 
+# --- Đơn vị lương trong văn bản (dùng khi quy đổi VND, xem exchange_luong) ---
+# regex phát hiện 'tỷ/tỉ' (sau khi bỏ dấu: 'ty' hoặc 'ti')
+# Lý do dùng regex thay vì contains đơn thuần: bắt được cả dạng dính số (vd: "20ty").
+RE_UNIT_TY = re.compile(r"(?:(?<=\d)\s*t[yi]\b|\bt[yi]\b)", re.IGNORECASE)
+RE_UNIT_TRIEU = re.compile(r"(?:(?<=\d)\s*tr\b|\btr\b|tri[eê]u)", re.IGNORECASE)
+RE_UNIT_DONG = re.compile(r"(?:\bvn?đ\b|₫|\bđ\b|\bd\b|\bvnd\b|\bdong\b|\bđong\b)", re.IGNORECASE)
+
+class SalaryInfo(NamedTuple):
+    # Kết quả parse_salary cho 1 chuỗi lương
+    negotiable: bool               # is_negotiation
+    currency: Optional[str]        # regex_currency_guess (None nếu thương lượng/không chắc -> hỏi GPT)
+    amounts: tuple                 # parse_salary_cell: (min, max, med, ky_tra_luong)
+    conflict: tuple                # (mã tiền nên sửa thành | None, lý do) cho fix_currency_conflict
+    has_ty: bool                   # đơn vị 'tỷ/tỉ'
+    has_trieu: bool                # đơn vị 'triệu/tr'
+    has_dong: bool                 # đơn vị 'đ/vnđ/₫/dong'
+
+SALARY_PARSE_CACHE = int(os.getenv("SALARY_PARSE_CACHE", "65536"))
+
+@lru_cache(maxsize=SALARY_PARSE_CACHE)
+def parse_salary(text: str) -> SalaryInfo:
+    """
+    Parser lương gộp: mỗi chuỗi lương khác nhau chỉ chuẩn hoá (lower/bỏ dấu) và dò regex 1 lần,
+    trả về đủ thông tin cho mọi bước lương của pipeline:
+      check_loai (negotiable, currency) -> maxminmed (amounts) -> fix_currency_conflict (conflict)
+      -> exchange_luong (has_ty / has_trieu / has_dong).
+    Kết quả giống hệt các hàm lẻ is_negotiation / regex_currency_guess / parse_salary_cell / ...
+    (các hàm đó vẫn giữ để gọi lẻ). lru_cache: cùng chuỗi ở bước sau không phải parse lại.
+    """
+    text = "" if text is None else str(text)
+    norm = normalize_text(text)                    # cho thương lượng / đoán tiền tệ
+    stripped = text.strip()
+    noacc = strip_accents(stripped.lower())        # cho bóc số / kỳ trả / đơn vị
+    negotiable = _is_negotiation_norm(norm)
+    return SalaryInfo(
+        negotiable=negotiable,
+        currency=None if negotiable else _regex_currency_guess_norm(norm),
+        amounts=_parse_salary_amounts(stripped, noacc),
+        conflict=_currency_conflict_hint(text),
+        has_ty=bool(RE_UNIT_TY.search(noacc)),
+        has_trieu=bool(RE_UNIT_TRIEU.search(noacc)),
+        has_dong=bool(RE_UNIT_DONG.search(noacc)),
+    )
+
 
 def add_salary_columns_maxminmed_ky(df: pd.DataFrame, salary_col: str = 'luong') -> pd.DataFrame:
     # Thêm các cột suy diễn từ cột 'luong':
@@ -566,8 +692,9 @@ def add_salary_columns_maxminmed_ky(df: pd.DataFrame, salary_col: str = 'luong')
     #   - ky_tra_luong: kỳ trả lương do detect_period xác định.
     # Đồng thời đảm bảo có cột 'check_luong' (nếu chưa có thì thêm vào cuối để giữ tương thích pipeline).
     df = df.copy()
-    results = [parse_salary_cell(val) for val in df[salary_col].fillna('')]
-    min_vals, max_vals, med_vals, periods = zip(*results)
+    results = memo_apply(df[salary_col].fillna(''), parse_salary_cell,
+                         name="parse_salary_cell", version=_parser_version()).tolist()
+    min_vals, max_vals, med_vals, periods = zip(*results) if results else ((), (), (), ())
 
     # Nếu chưa có check_luong thì thêm cuối
     if "check_luong" not in df.columns:
@@ -747,10 +874,12 @@ def enrich_work_schedule_columns(
         df[col_gio_lam_viec] = None
 
     # so_ngay_lam (số ngày làm/tuần)
-    df["so_ngay_lam"] = df[col_ngay_lam_viec].apply(count_workdays_week)
+    df["so_ngay_lam"] = memo_apply(df[col_ngay_lam_viec], count_workdays_week,
+                                   name="count_workdays_week", version=_parser_version())
 
     # gio_bat_dau, gio_ket_thuc, so_gio_lam_ngay (từ cột giờ làm việc tự do)
-    res = df[col_gio_lam_viec].apply(parse_longest_time_span)
+    res = memo_apply(df[col_gio_lam_viec], parse_longest_time_span,
+                     name="parse_longest_time_span", version=_parser_version())
     df["gio_bat_dau"]     = res.map(lambda x: x[0])
     df["gio_ket_thuc"]    = res.map(lambda x: x[1])
     df["so_gio_lam_ngay"] = res.map(lambda x: x[2])
@@ -781,89 +910,21 @@ def enrich_work_schedule_columns(
     return df
 
 # ===================== FX helpers =====================
-
-# Cache để tránh gọi API nhiều lần cho cùng 1 base
-# Ý tưởng: khi nhiều hàng trong df có cùng loại tiền (USD/EUR...), chỉ fetch 1 lần rồi tái sử dụng.
-_FX_CACHE: Dict[str, float] = {}  # base -> rate_to_VND
+# Tỷ giá lấy từ kho trên đĩa (common/fx_rates.py): làm mới 1 lần ở đầu bước nếu quá hạn,
+# lúc quy đổi từng dòng chỉ tra bộ nhớ -> không gọi mạng trong vòng dữ liệu.
 
 # Tập mã tiền tệ được hỗ trợ trong hàm get_fx_rate_to_vnd.
-SUPPORTED = {"VND","USD","EUR","GBP","JPY","CNY","KRW","SGD","THB","AUD","CAD"}
-
-def _fetch_rate_open_erapi(base: str) -> Optional[float]:
-    """Nguồn 1: open.er-api.com (free, ổn định). Trả về rate VND cho base.
-    Quy trình:
-    - Gọi /v6/latest/{base} → JSON {'result':'success', 'rates': {'VND': value, ...}}
-    - Trả về float nếu lấy được VND > 0, ngược lại trả None để caller fallback.
-    Lưu ý: có timeout 15s để tránh treo pipeline.
-    """
-    url = f"https://open.er-api.com/v6/latest/{base}"
-    r = requests.get(url, timeout=15)
-    r.raise_for_status()
-    data = r.json()
-    if data.get("result") == "success":
-        rates = data.get("rates", {})
-        vnd = rates.get("VND")
-        if isinstance(vnd, (int, float)) and vnd > 0:
-            return float(vnd)
-    return None
-
-def _fetch_rate_exchangerate_host(base: str) -> Optional[float]:
-    """Nguồn 2: exchangerate.host làm fallback.
-    - Gọi /latest?base={base}&symbols=VND → JSON {'rates': {'VND': value}}
-    - Trả về float nếu thành công; nếu lỗi/thiếu → None.
-    """
-    url = f"https://api.exchangerate.host/latest?base={base}&symbols=VND"
-    r = requests.get(url, timeout=15)
-    r.raise_for_status()
-    data = r.json()
-    rates = data.get("rates", {})
-    vnd = rates.get("VND")
-    if isinstance(vnd, (int, float)) and vnd > 0:
-        return float(vnd)
-    return None
+SUPPORTED = fx_rates.SUPPORTED
 
 def get_fx_rate_to_vnd(base: str, retries: int = 2, sleep_sec: float = 0.8) -> float:
     """
-    Lấy tỷ giá 1 BASE = ? VND. Có cache + retry + 2 nguồn.
+    Lấy tỷ giá 1 BASE = ? VND từ kho tỷ giá (fx_rates.rate_to_vnd), không gọi mạng.
     - Trả về 1.0 nếu base == 'VND' (đơn vị chuẩn hoá sẵn).
     - Kiểm tra base thuộc SUPPORTED; nếu không → ValueError.
-    - Nếu đã có trong _FX_CACHE → trả ngay.
-    - Nếu chưa có: thử nguồn 1 (open.er-api), nếu fail → nguồn 2 (exchangerate.host);
-      lặp tối đa 'retries' lần, có sleep giữa các lần.
-    - Nếu hết lượt vẫn thất bại → RuntimeError, kèm thông tin lỗi cuối để debug.
-    Ghi chú vận hành:
-    - Hạn chế gọi mạng trong vòng lặp dữ liệu lớn: nên gom unique currencies rồi gọi get_fx_rate_to_vnd từng loại.
+    - Kho và snapshot đều không có mã này → RuntimeError.
+    retries/sleep_sec: giữ cho tương thích chữ ký cũ (việc gọi mạng giờ nằm ở fx_rates.refresh_if_stale).
     """
-    base = (base or "").upper().strip()
-    if base == "VND":
-        return 1.0
-    if base not in SUPPORTED:
-        raise ValueError(f"Unsupported currency: {base}")
-
-    if base in _FX_CACHE:
-        return _FX_CACHE[base]
-
-    last_err = None
-    for i in range(retries + 1):
-        try:
-            rate = _fetch_rate_open_erapi(base)
-            if rate:
-                _FX_CACHE[base] = rate
-                return rate
-        except Exception as e:
-            last_err = e
-        # fallback
-        try:
-            rate = _fetch_rate_exchangerate_host(base)
-            if rate:
-                _FX_CACHE[base] = rate
-                return rate
-        except Exception as e:
-            last_err = e
-
-        time.sleep(sleep_sec)
-
-    raise RuntimeError(f"FX fetch failed for {base}: {last_err}")
+    return fx_rates.rate_to_vnd(base)
 
 # ===================== Pay period helpers =====================
 def exchange_luong(
@@ -891,7 +952,7 @@ def exchange_luong(
     - Với ngoại tệ (USD/EUR/...): lấy tỷ giá → quy đổi sang VND → đổi kỳ như VND 'đ'.
 
     Lưu ý vận hành/điều kiện tiên quyết:
-    - Cần đã import 'unicodedata' và 'numpy as np' ở cấp module vì hàm dùng chúng trong helpers.
+    - Cần đã import 'numpy as np' ở cấp module vì hàm dùng trong helpers.
     - Các cột 'so_gio_lam_ngay' và 'so_ngay_lam' nếu không có/không hợp lệ, mặc định hpd=8, dpw=6 (quy ước thực dụng).
 
     Chi tiết logic kỳ:
@@ -910,14 +971,6 @@ def exchange_luong(
     """
 
     # ===== Helpers =====
-    def _strip_accents_lower(s: str) -> str:
-        # Bỏ dấu + lower + trim: chuẩn hoá văn bản để dò đơn vị ('ty', 'tr', 'dong') không phụ thuộc dấu/hoa-thường.
-        # Cảnh báo: cần `import unicodedata` ở đầu file.
-        s = "" if s is None else str(s)
-        s = unicodedata.normalize("NFD", s)
-        s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-        return s.lower().strip()
-
     def _to_num(x):
         # Chuyển x về float “khoan dung”:
         # - Chuỗi: bỏ ',' và space trước khi float().
@@ -936,7 +989,7 @@ def exchange_luong(
     def _norm_period(val: str) -> str:
         # Chuẩn hoá kỳ trả về {year, month, week, hour}; mặc định 'month' nếu không rõ.
         # Chấp nhận nhiều biến thể viết tắt: y/yr, m/month, w/week, h/hour; và tiếng Việt không dấu.
-        v = _strip_accents_lower(val)
+        v = textnorm.no_accent_lower(val)
         if not v: return "month"
         if "nam"   in v or v in {"y","year","yr"}:   return "year"
         if "thang" in v or v in {"m","month"}:       return "month"
@@ -961,23 +1014,7 @@ def exchange_luong(
         if period == "hour":  return val * hpd * dpw * 4.0
         return val
 
-    # --- regex phát hiện 'tỷ/tỉ' (sau khi bỏ dấu: 'ty' hoặc 'ti')
-    # Lý do dùng regex thay vì contains đơn thuần: bắt được cả dạng dính số (vd: "20ty").
-    RE_TY = re.compile(r"(?:(?<=\d)\s*t[yi]\b|\bt[yi]\b)", re.IGNORECASE)
-    RE_TRIEU = re.compile(r"(?:(?<=\d)\s*tr\b|\btr\b|tri[eê]u)", re.IGNORECASE)
-    RE_DONG = re.compile(r"(?:\bvn?đ\b|₫|\bđ\b|\bd\b|\bvnd\b|\bdong\b|\bđong\b)", re.IGNORECASE)
-
-    def _is_ty(text: str) -> bool:
-        t = _strip_accents_lower(text)
-        return bool(RE_TY.search(t))
-
-    def _is_trieu(text: str) -> bool:
-        t = _strip_accents_lower(text)
-        return bool(RE_TRIEU.search(t))
-
-    def _is_dong(text: str) -> bool:
-        t = _strip_accents_lower(text)
-        return bool(RE_DONG.search(t))
+    # Đơn vị 'tỷ'/'triệu'/'đ' lấy từ parse_salary (RE_UNIT_*): chuỗi đã dò ở các bước trước -> trúng lru_cache.
 
     def quy_doi_vnd(value: Optional[float], period: str, salary_text: str, hpd: float, dpw: float) -> Optional[float]:
         """
@@ -992,9 +1029,8 @@ def exchange_luong(
         if value is None:
             return None
 
-        has_ty = _is_ty(salary_text)
-        has_trieu = _is_trieu(salary_text)
-        has_dong = _is_dong(salary_text)
+        info = parse_salary("" if salary_text is None else str(salary_text))
+        has_ty, has_trieu, has_dong = info.has_ty, info.has_trieu, info.has_dong
 
         # 1) ƯU TIÊN 'tỷ/tỉ'
         if has_ty:
@@ -1531,12 +1567,6 @@ BENEFIT_TOKENS = {
     },
 }
 #============================================================
-def strip_accents(s: str) -> str:
-    # Bỏ dấu tiếng Việt: chuẩn hoá NFD rồi loại bỏ các ký tự Mn (dấu, dấu thanh)
-    if not isinstance(s, str): return ""
-    return "".join(c for c in unicodedata.normalize("NFD", s)
-                   if unicodedata.category(c) != "Mn")
-
 def normalize_text(*parts: str) -> str:
     # Ghép nhiều chuỗi đầu vào, bỏ None/rỗng, chuẩn hoá chữ thường, bỏ dấu, gọn khoảng trắng
     txt = " \n ".join([p for p in parts if isinstance(p, str) and p.strip()])
@@ -1576,8 +1606,9 @@ def _contains_all(text: str, token_sets: List[List[str]]) -> bool:
             return True
     return False
 
-def detect_benefits_tokens(text_norm: str, BENEFIT_TOKENS: Dict) -> Dict[str, List[str]]:
-    # Tìm các phúc lợi xuất hiện trong văn bản đã chuẩn hoá dựa trên cấu hình BENEFIT_TOKENS
+def detect_benefits_tokens_naive(text_norm: str, BENEFIT_TOKENS: Dict) -> Dict[str, List[str]]:
+    # Bản gốc (dò từng token bằng 1 regex riêng): giữ làm chuẩn đối chiếu cho BenefitMatcher
+    # (xem processor/bench_benefits.py). Pipeline dùng detect_benefits_tokens.
     found: Dict[str, List[str]] = {}
     for g_key, g_val in BENEFIT_TOKENS.items():
         for i_key, i_val in g_val.get("items", {}).items():
@@ -1599,46 +1630,115 @@ def detect_benefits_tokens(text_norm: str, BENEFIT_TOKENS: Dict) -> Dict[str, Li
         found[g] = sorted(set(found[g]))
     return found
 
-def _scan_row(row):
+def _trie_regex(tokens: Iterable[str], word_bounded: bool) -> str:
+    """
+    Gộp nhiều token thành 1 regex dạng trie (các token chung tiền tố dùng chung nhánh):
+    sre rẽ nhánh theo ký tự đầu thay vì thử lần lượt hàng trăm lựa chọn ở mỗi vị trí.
+    Nhánh dài được thử trước -> ở mỗi vị trí bắt được token DÀI NHẤT hợp lệ.
+    word_bounded: token kết thúc bằng \b (như _contains_any với token không có khoảng trắng).
+    """
+    trie: Dict = {}
+    for t in tokens:
+        node = trie
+        for ch in t:
+            node = node.setdefault(ch, {})
+        node[""] = True  # đánh dấu kết thúc token
+
+    def _build(node: Dict) -> str:
+        alts = [re.escape(ch) + _build(child) for ch, child in sorted(node.items()) if ch]
+        if "" in node:
+            alts.append(r"\b" if word_bounded else "")
+        if len(alts) == 1:
+            return alts[0]
+        return "(?:" + "|".join(alts) + ")"
+
+    return _build(trie)
+
+class BenefitMatcher:
+    """
+    BENEFIT_TOKENS biên dịch 1 lần thành 2 regex trie (token 1 từ: có \b hai đầu; token có khoảng trắng:
+    khớp chuỗi con) -> mỗi văn bản chỉ quét 1 lượt cho mỗi regex, thu mọi token xuất hiện, rồi suy ra
+    item theo 'any' (có 1 token) / 'all' (đủ mọi token của 1 bộ). Kết quả giống hệt detect_benefits_tokens_naive.
     """
-    Ghép 3 cột văn bản (mô tả công việc, yêu cầu công việc, phúc lợi),
-    chuẩn hoá rồi dò tìm phúc lợi dựa vào BENEFIT_TOKENS.
+
+    def __init__(self, benefit_tokens: Dict):
+        self.items: List[Tuple[str, str, frozenset, List[frozenset]]] = []
+        words, phrases = set(), set()
+        for g_key, g_val in benefit_tokens.items():
+            for i_key, i_val in g_val.get("items", {}).items():
+                any_tokens = frozenset(i_val.get("any", []))
+                all_sets = [frozenset(group) for group in i_val.get("all", [])]
+                self.items.append((g_key, i_key, any_tokens, all_sets))
+                for t in set(any_tokens).union(*all_sets):
+                    (phrases if " " in t else words).add(t)
+        # Lookahead bắt nhóm: finditer thử ở MỌI vị trí (kể cả chồng lấn) mà vẫn trả về token khớp
+        self._re_words = re.compile(r"(?=\b(" + _trie_regex(words, True) + "))") if words else None
+        self._re_phrases = re.compile("(?=(" + _trie_regex(phrases, False) + "))") if phrases else None
+        # Ở 1 vị trí regex chỉ trả token dài nhất; token ngắn hơn cùng vị trí là tiền tố của nó -> kiểm riêng
+        self._word_prefixes = {t: [p for p in words if p != t and t.startswith(p)] for t in words}
+        self._phrase_prefixes = {t: [p for p in phrases if p != t and t.startswith(p)] for t in phrases}
+        self._word_end = {t: re.compile(re.escape(t) + r"\b") for t in words}
+
+    def tokens_in(self, text: str) -> set:
+        found = set()
+        if self._re_words is not None:
+            for m in self._re_words.finditer(text):
+                tok = m.group(1)
+                found.add(tok)
+                for p in self._word_prefixes[tok]:
+                    if p not in found and self._word_end[p].match(text, m.start()):
+                        found.add(p)
+        if self._re_phrases is not None:
+            for m in self._re_phrases.finditer(text):
+                tok = m.group(1)
+                found.add(tok)
+                found.update(self._phrase_prefixes[tok])
+        return found
+
+    def detect(self, text_norm: str) -> Dict[str, List[str]]:
+        hits = self.tokens_in(text_norm)
+        found: Dict[str, List[str]] = {}
+        for g_key, i_key, any_tokens, all_sets in self.items:
+            if (any_tokens and not any_tokens.isdisjoint(hits)) or any(group <= hits for group in all_sets):
+                found.setdefault(g_key, []).append(i_key)
+        # Loại bỏ trùng lặp, sắp xếp kết quả
+        for g in list(found.keys()):
+            found[g] = sorted(set(found[g]))
+        return found
+
+_BENEFIT_MATCHERS: Dict[int, BenefitMatcher] = {}
+
+def detect_benefits_tokens(text_norm: str, BENEFIT_TOKENS: Dict) -> Dict[str, List[str]]:
+    # Tìm các phúc lợi xuất hiện trong văn bản đã chuẩn hoá dựa trên cấu hình BENEFIT_TOKENS
+    # (BenefitMatcher biên dịch 1 lần cho mỗi cấu hình, dùng lại cho mọi dòng)
+    matcher = _BENEFIT_MATCHERS.get(id(BENEFIT_TOKENS))
+    if matcher is None:
+        matcher = _BENEFIT_MATCHERS[id(BENEFIT_TOKENS)] = BenefitMatcher(BENEFIT_TOKENS)
+    return matcher.detect(text_norm)
+
+def _scan_row(key: tuple):
+    """
+    key = (mô tả công việc, yêu cầu công việc, phúc lợi) của 1 dòng:
+    ghép 3 cột, chuẩn hoá rồi dò tìm phúc lợi dựa vào BENEFIT_TOKENS.
     Trả về tuple:
       - nhom_phuc_loi (chuỗi mô tả nhóm và item phúc lợi)
       - so_phuc_loi_tim_duoc (số lượng phúc lợi tìm được)
+    Hàm cấp module (không lồng) để chạy được trong pool tiến trình (common/chunked.py).
     """
-    try:
-        # Ghép text từ 3 cột chính
-        raw = " \n ".join([
-            str(row.get("mo_ta_cong_viec", "")),
-            str(row.get("yeu_cau_cong_viec", "")),
-            str(row.get("phuc_loi", ""))
-        ])
-        text_norm = normalize_text(raw)
-
-        # Phát hiện token phúc lợi
-        found = detect_benefits_tokens(text_norm, BENEFIT_TOKENS)
-
-        parts, total = [], 0
-        for g_key, g_val in BENEFIT_TOKENS.items():
-            items = sorted(set(found.get(g_key, [])))
-            if not items:
-                continue
-
-            # Lấy nhãn hiển thị (label) nếu có, fallback về key nếu thiếu
-            labels = []
-            item_map = g_val.get("items", {})
-            for i_key in items:
-                labels.append(item_map.get(i_key, {}).get("label", i_key))
+    raw_text = " \n ".join(str(v) for v in key)
+    text_norm = normalize_text(raw_text)
+    found = detect_benefits_tokens(text_norm, BENEFIT_TOKENS)
 
-            title = g_val.get("title", g_key)
-            parts.append(f"{title}: " + ", ".join(labels))
-            total += len(items)
-
-        return " | ".join(parts), int(total)
-    except Exception:
-        # Nếu lỗi trong quá trình xử lý → trả về mặc định rỗng
-        return "", 0
+    parts, total = [], 0
+    for g_key, g_val in BENEFIT_TOKENS.items():
+        items = found.get(g_key, [])
+        if not items:
+            continue
+        # Lấy nhãn hiển thị (label) nếu có, fallback về key nếu thiếu
+        labels = [g_val["items"].get(i, {}).get("label", i) for i in items]
+        parts.append(f"{g_val.get('title', g_key)}: " + ", ".join(labels))
+        total += len(items)
+    return " | ".join(parts), total
 #============================================================
 NGANH_NGHE = {
     "Bán Lẻ/Tiêu Dùng": [
@@ -1884,7 +1984,7 @@ def extract_nganh_nghe(df: pd.DataFrame,
             return p.strip(), c.strip() if c.strip() else "no_info"
         return text if text else "no_info", "no_info"
 
-    parsed = s.apply(_parse)
+    parsed = memo_apply(s, _parse, name="nganh_nghe", version=_parser_version())
     df[col]       = parsed.apply(lambda x: x[0])  # Cha -> ghi đè vào nganh_nghe
     df[child_col] = parsed.apply(lambda x: x[1])  # Con -> ghi vào nganh
 
@@ -1917,7 +2017,10 @@ def extract_age_range(df: pd.DataFrame, col: str = "do_tuoi") -> pd.DataFrame:
         med_t = (min_t + max_t) / 2
         return (min_t, max_t, med_t)
 
-    df[["min_tuoi", "max_tuoi", "med_tuoi"]] = df[col].apply(lambda x: pd.Series(parse_age(x)))
+    # Mỗi chuỗi tuổi khác nhau parse 1 lần, rồi dựng 3 cột 1 lượt (thay vì 1 pd.Series cho mỗi dòng)
+    parsed = memo_apply(df[col], parse_age, name="parse_age", version=_parser_version())
+    df[["min_tuoi", "max_tuoi", "med_tuoi"]] = pd.DataFrame(
+        parsed.tolist(), index=df.index, columns=["min_tuoi", "max_tuoi", "med_tuoi"])
     return df
 
 def split_quymo(df: pd.DataFrame, col: str) -> pd.DataFrame:
@@ -1954,17 +2057,11 @@ def split_quymo(df: pd.DataFrame, col: str) -> pd.DataFrame:
         return ("no_info", "no_info", "no_info")
 
     # áp dụng
-    df["min_quymo"], df["max_quymo"], df["med_quymo"] = zip(*df[col].map(_parse_quymo))
+    parsed = memo_apply(df[col], _parse_quymo, name="quy_mo", version=_parser_version())
+    df["min_quymo"], df["max_quymo"], df["med_quymo"] = zip(*parsed) if len(parsed) else ((), (), ())
     return df
-import unicodedata
 import pandas as pd
 
-def _strip_accents(s: str) -> str:
-    """Bỏ dấu tiếng Việt, giữ chữ thường.
-    Dùng cho chuẩn hoá giá trị 'thiếu' (không hiển thị/none/nan...) trước khi quyết định thay bằng 'no_info'."""
-    return "".join(c for c in unicodedata.normalize("NFD", s)
-                   if unicodedata.category(c) != "Mn").lower()
-
 def xu_ly_thieu(df: pd.DataFrame) -> pd.DataFrame:
     # Chuẩn hoá giá trị thiếu/rác thành "no_info" trên toàn DataFrame:
     # - NaN/None -> "no_info"
@@ -1974,16 +2071,17 @@ def xu_ly_thieu(df: pd.DataFrame) -> pd.DataFrame:
         if pd.isna(x):
             return "no_info"
         s = str(x).strip()
-        s_norm = _strip_accents(s)
+        s_norm = textnorm.no_accent_lower(s, strip=False)
 
         if s_norm in {"", "nan", "khong hien thi", "none"}:
             return "no_info"
         return x
 
-    # pandas >= 2.1 có DataFrame.map
-    if hasattr(df, "map"):
-        return df.map(_clean_cell)
-    return df.applymap(_clean_cell)
+    # Từng cột: mỗi giá trị khác nhau chỉ chuẩn hoá 1 lần (theo vị trí cột để an toàn khi trùng tên)
+    out = pd.DataFrame({i: memo_apply(df.iloc[:, i], _clean_cell) for i in range(df.shape[1])},
+                       index=df.index)
+    out.columns = df.columns
+    return out
 #================
 def reorder_columns(df: pd.DataFrame) -> pd.DataFrame:
     # Sắp xếp lại cột theo nhóm logic phục vụ phân tích/đọc hiểu:
@@ -2061,16 +2159,6 @@ def clean_nganh_nghe(df: pd.DataFrame, col: str = "nganh_nghe") -> pd.DataFrame:
     df[col] = df[col].astype(str).str.split(">").str[0].str.strip()
     return df
 #=================================================================
-def _norm_no_accent(s: str) -> str:
-    """Lowercase + bỏ dấu tiếng Việt để so khớp không dấu.
-    Dùng cho module phát hiện ngôn ngữ từ mô tả công việc."""
-    if s is None:
-        return ""
-    s = str(s)
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-    return s.lower()
-
 # Từ khóa nhận diện (đã bỏ dấu, viết thường)
 # Gợi ý: mở rộng dần theo tập dữ liệu thực tế (ví dụ thêm chứng chỉ/kiểu viết tắt mới).
 _LANG_PATTERNS = {
@@ -2119,13 +2207,35 @@ _LANG_ORDER = [
 def _detect_languages(text: str) -> set[str]:
     """Trả về tập các nhãn ngôn ngữ chuẩn tìm thấy trong text.
     Cách làm: bỏ dấu + lower → so khớp regex đã biên dịch theo từng ngôn ngữ."""
-    norm = _norm_no_accent(text)
+    norm = textnorm.no_accent_lower(text, strip=False)
     found = set()
     for lang, rx in _COMPILED.items():
         if rx.search(norm):
             found.add(lang)
     return found
 
+def _resolve_lang(key: tuple) -> str:
+    """key = (các cột mô tả..., giá trị ngon_ngu_cv hiện tại) của 1 dòng -> giá trị ngon_ngu_cv mới.
+    Hàm cấp module để chạy được trong pool tiến trình (common/chunked.py)."""
+    *texts, current = key
+    text_all = " | ".join(str(t) if pd.notna(t) else "" for t in texts)
+    found = _detect_languages(text_all)
+
+    # Bước 2: nếu có 'Tiếng Việt' -> Bất Kỳ
+    if "Tiếng Việt" in found:
+        return "Bất Kỳ"
+
+    # Không có -> giữ nguyên hiện tại
+    if not found:
+        return current if pd.notna(current) and str(current).strip() else None
+
+    # Có nhiều -> sắp theo thứ tự ưu tiên rồi join
+    ordered = [lang for lang in _LANG_ORDER if lang in found]
+    # Nếu có lang khác không nằm trong danh sách ưu tiên (hiếm), thêm vào cuối
+    others = sorted(l for l in found if l not in _LANG_ORDER)
+    result_list = ordered + others
+    return ", ".join(result_list) if result_list else None
+
 def update_ngon_ngu_cv(
     df: pd.DataFrame,
     desc_cols=("mo_ta_cong_viec", "yeu_cau_cong_viec"),
@@ -2146,26 +2256,9 @@ def update_ngon_ngu_cv(
     if out_col not in df.columns:
         df[out_col] = None
 
-    def _resolve_lang(row) -> str:
-        text_all = " | ".join(str(row[c]) if pd.notna(row[c]) else "" for c in desc_cols)
-        found = _detect_languages(text_all)
-
-        # Bước 2: nếu có 'Tiếng Việt' -> Bất Kỳ
-        if "Tiếng Việt" in found:
-            return "Bất Kỳ"
-
-        # Không có -> giữ nguyên hiện tại
-        if not found:
-            return row[out_col] if pd.notna(row[out_col]) and str(row[out_col]).strip() else None
-
-        # Có nhiều -> sắp theo thứ tự ưu tiên rồi join
-        ordered = [lang for lang in _LANG_ORDER if lang in found]
-        # Nếu có lang khác không nằm trong danh sách ưu tiên (hiếm), thêm vào cuối
-        others = sorted(l for l in found if l not in _LANG_ORDER)
-        result_list = ordered + others
-        return ", ".join(result_list) if result_list else None
-
-    df[out_col] = df.apply(_resolve_lang, axis=1)
+    # Bài đăng lặp lại (cùng mô tả/yêu cầu) chỉ quét 1 lần; các bộ khác nhau chia khúc chạy song song
+    # (CHUNK_WORKERS, xem common/chunked.py)
+    df[out_col] = memo_apply_rows(df, list(desc_cols) + [out_col], _resolve_lang, parallel=True)
 
     # Lần quét thứ hai độc lập (nếu ai muốn chắc chắn):
     # nếu ngay trong out_col vẫn còn 'Tiếng Việt' (do nguồn trước đó), đổi thành Bất Kỳ
@@ -2181,46 +2274,117 @@ def _project_root() -> Path:
     # Ưu điểm: không phụ thuộc vào nơi chạy script, đường dẫn IO ổn định theo cấu trúc repo.
     return Path(__file__).resolve().parents[1]
 
-def _apply_pipeline(df: pd.DataFrame, out_file: Path) -> pd.DataFrame:
-    """Chạy toàn bộ các bước xử lý lên df và GHI ĐÈ dần vào out_file sau mỗi bước.
+# ====== CHECKPOINT GIỮA CÁC BƯỚC (tuỳ chọn, để debug) ======
+# Trước đây sau gần như mỗi bước đều df.to_excel(out_file): ghi lại cả workbook qua openpyxl ~14 lần/file,
+# là phần tốn thời gian nhất của preprocess. Giờ mặc định KHÔNG checkpoint, chỉ xuất Excel 1 lần ở cuối.
+#   PREPROCESS_CHECKPOINT_STEPS  = ""                 -> tắt (mặc định)
+#                                = "all"              -> sau mọi bước
+#                                = "fx,benefits"      -> chỉ sau các bước này (tên bước: PIPELINE_STEPS)
+#   PREPROCESS_CHECKPOINT_FORMAT = pickle (mặc định) | parquet | feather (cần pyarrow)
+#                                | xlsx (như cách cũ — chỉ để so sánh thời gian trước/sau)
+# So sánh trước/sau trên 1 file thật: python processor/bench_preprocess.py <file chi tiết> --json kq.json
+# File: <thư mục preprocess>/checkpoints/<stem>/<stt>_<bước>.<đuôi>
+PIPELINE_STEPS = ("rename", "currency", "salary_minmax", "schedule", "currency_fix", "fx", "salary_outlier",
+                  "numbers", "languages", "benefits", "industry", "age", "company_size", "no_info",
+                  "drop_sparse", "reorder")
+_CHECKPOINT_EXT = {"pickle": ".pkl", "parquet": ".parquet", "feather": ".feather", "xlsx": ".xlsx"}
+
+
+def _checkpoint_steps() -> set:
+    raw = os.getenv("PREPROCESS_CHECKPOINT_STEPS", "").strip().lower()
+    if raw in ("", "0", "off", "none"):
+        return set()
+    if raw in ("1", "all", "*"):
+        return set(PIPELINE_STEPS)
+    return {s.strip() for s in raw.split(",") if s.strip()}
+
+
+def _write_checkpoint(df: pd.DataFrame, out_file: Path, step: str) -> Path:
+    fmt = os.getenv("PREPROCESS_CHECKPOINT_FORMAT", "pickle").strip().lower()
+    fmt = fmt if fmt in _CHECKPOINT_EXT else "pickle"
+    ck_dir = out_file.parent / "checkpoints" / out_file.stem
+    ck_dir.mkdir(parents=True, exist_ok=True)
+    idx = PIPELINE_STEPS.index(step) + 1 if step in PIPELINE_STEPS else 0
+    path = ck_dir / f"{idx:02d}_{step}{_CHECKPOINT_EXT[fmt]}"
+    try:
+        if fmt == "parquet":
+            frames.arrow_safe(df).to_parquet(path, index=False)
+        elif fmt == "feather":
+            frames.arrow_safe(df).reset_index(drop=True).to_feather(path)
+        elif fmt == "xlsx":
+            df.to_excel(path, index=False)
+        else:
+            df.to_pickle(path)
+    except Exception as e:
+        # Thiếu pyarrow hoặc cột object lẫn kiểu (Arrow không ghi được) -> pickle luôn ghi được
+        path = path.with_suffix(".pkl")
+        df.to_pickle(path)
+        print(f"  ❕ [WARN] Checkpoint {fmt} lỗi ({e}), ghi pickle: {path.name}")
+    return path
+
+
+class _PipelineSteps:
+    """Đo thời gian từng bước của _apply_pipeline + ghi checkpoint cho các bước được chọn.
+    Thời gian 1 bước = từ lúc bước trước xong tới lúc bước này xong (không tính thời gian ghi checkpoint);
+    tổng thời gian ghi checkpoint nằm riêng ở khoá "checkpoint" (chỉ có khi bật checkpoint)."""
+
+    def __init__(self, out_file: Path):
+        self.out_file = Path(out_file)
+        self.checkpoint = _checkpoint_steps()
+        self.timings: Dict[str, float] = {}
+        self._t = time.perf_counter()
+
+    def done(self, df: pd.DataFrame, step: str) -> None:
+        self.timings[step] = round(time.perf_counter() - self._t, 3)
+        if step in self.checkpoint:
+            t0 = time.perf_counter()
+            _write_checkpoint(df, self.out_file, step)
+            self.timings["checkpoint"] = round(self.timings.get("checkpoint", 0.0) + time.perf_counter() - t0, 3)
+        self._t = time.perf_counter()
+
+
+def _apply_pipeline(df: pd.DataFrame, out_file: Path, timings: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+    """Chạy toàn bộ các bước xử lý lên df (KHÔNG ghi out_file — người gọi xuất Excel 1 lần ở cuối).
     Mục tiêu:
       - Biến đổi dữ liệu thô (crawl) → dữ liệu phân tích được (đã chuẩn hoá).
-      - Mỗi bước đều 'checkpoint' ra Excel để tiện debug/so sánh diff giữa các giai đoạn.
+      - Checkpoint sau từng bước chỉ khi bật PREPROCESS_CHECKPOINT_STEPS (định dạng nhị phân, xem _PipelineSteps).
+      - timings (nếu truyền vào): nhận thời gian (giây) của từng bước.
     Lưu ý:
       - Mỗi khối try/except tự chịu lỗi: pipeline không dừng toàn cục khi một bước fail.
       - Đảm bảo hiệu ứng từng bước độc lập và có log rõ ràng để truy vết.
     """
     import os
 
+    steps = _PipelineSteps(out_file)
+
     # 1) Đổi tên cột về không dấu
     try:
         # Chuẩn hoá header: bỏ dấu, snake_case ngắn gọn → thuận tiện cho xử lý & join về sau.
         df = rename_columns_no_diacritics(df)
-        df.to_excel(out_file, index=False)
         print("  ✅ Đổi tên cột về không dấu")
     except NameError:
         # Trường hợp module đổi tên chưa được import/định nghĩa → giữ nguyên cột để pipeline đi tiếp.
         print("  ❕ [WARN] rename_columns_no_diacritics chưa có, giữ nguyên tên cột.")
     except Exception as e:
         print(f"  ❌ Lỗi đổi tên cột: {e}")
+    steps.done(df, "rename")
 
     # 2) Điền loại tiền tệ/Thương lượng
     try:
         # Suy luận 'loai_tien_te' (VND/USD/...) và 'check_luong' (True/False nếu thương lượng)
         # Ưu tiên heuristic; nếu cần mới hỏi model (qua biến môi trường OPENAI_MODEL).
         df = add_salary_columns_check_loai(df, model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
-        df.to_excel(out_file, index=False)
         print("  ✅ Điền loại tiền tệ/Thương lượng")
     except NameError as ne:
         print(f"  ❕ [WARN] Thiếu helper check_luong ({ne}). Bỏ qua.")
     except Exception as e:
         print(f"  ❌ Lỗi điền loại tiền tệ/Thương lượng: {e}")
+    steps.done(df, "currency")
 
     # 3) Tạo min/max/med/kỳ trả lương từ cột lương thô
     try:
         # Parse text lương tự do (ví dụ '15-20tr/tháng', 'từ 500$') → min/max/med + kỳ trả (giờ/tuần/tháng/năm).
         df = add_salary_columns_maxminmed_ky(df, salary_col="luong")
-        df.to_excel(out_file, index=False)
         print("  ✅ Tạo min/max/med/kỳ trả lương")
     except NameError:
         print("  ❕ [WARN] add_salary_columns_maxminmed_ky chưa có, bỏ qua.")
@@ -2229,6 +2393,7 @@ def _apply_pipeline(df: pd.DataFrame, out_file: Path) -> pd.DataFrame:
         print(f"  ❕ [WARN] add_salary_columns_maxminmed_ky chữ ký khác. Bỏ qua. {te}")
     except Exception as e:
         print(f"  ❌ Lỗi tạo min/max/med/kỳ trả lương: {e}")
+    steps.done(df, "salary_minmax")
 
     # 4) Ngày/giờ làm việc
     try:
@@ -2240,17 +2405,17 @@ def _apply_pipeline(df: pd.DataFrame, out_file: Path) -> pd.DataFrame:
             col_gio_lam_viec="gio_lam_viec",
             anchor_col="ky_tra_luong"
         )
-        df.to_excel(out_file, index=False)
         print("  ✅ Xử lý ngày/giờ làm việc")
     except Exception as e:
         print(f"  ❌ Lỗi xử lý ngày/giờ làm việc: {e}")
+    steps.done(df, "schedule")
     try:
         # Vá lỗi phổ biến về nhận diện loại tiền tệ từ text (vd có cả '$' và 'tr' → ưu tiên VND).
         fix_currency_conflict(df, col_salary="luong", col_currency="loai_tien_te")
-        df.to_excel(out_file, index=False)
         print("  ✅ chỉnh loai tien ")
     except Exception as e:
         print(f"  ❌ chỉnh loai tien {e}")
+    steps.done(df, "currency_fix")
     # 5) Quy đổi lương về VND/tháng
     try:
         # Chuẩn hoá quy đổi: tất cả min/med/max đưa về VND theo THÁNG.
@@ -2266,10 +2431,10 @@ def _apply_pipeline(df: pd.DataFrame, out_file: Path) -> pd.DataFrame:
             days_per_week_col="so_ngay_lam",
             salary_text_col="luong",
         )
-        df.to_excel(out_file, index=False)
         print("  ✅ Quy đổi lương về VND/tháng")
     except Exception as e:
         print(f"  ❌ Lỗi quy đổi lương: {e}")
+    steps.done(df, "fx")
 
     try:
         # Đánh dấu các trường hợp lương bất thường (outlier) theo tiêu chí riêng (hàm do người viết định nghĩa).
@@ -2277,53 +2442,41 @@ def _apply_pipeline(df: pd.DataFrame, out_file: Path) -> pd.DataFrame:
         min_col = "min_luong",
         med_col = "med_luong",
         max_col = "max_luong")
-        df.to_excel(out_file, index=False)
         print("  ✅ Đánh dấu bất thường lương ")
     except Exception as e:
         print(f"  ❌ Đánh dấu bất thường lương {e}")
+    steps.done(df, "salary_outlier")
     # 6) Chuẩn hóa het_han/luot_xem (giữ số)
     try:
         # Trích số nguyên từ text (ví dụ 'Còn 12 ngày' → 12), tiện cho thống kê/sắp xếp.
         for col in ["het_han", "luot_xem"]:
             if col in df.columns:
-                df[col] = df[col].apply(extract_number)
-        df.to_excel(out_file, index=False)
+                df[col] = memo_apply(df[col], extract_number, name="extract_number", version=_parser_version())
         print("  ✅ Chuẩn hóa 'het_han' & 'luot_xem'")
     except Exception as e:
         print(f"  ❌ Lỗi chuẩn hóa het_han/luot_xem: {e}")
+    steps.done(df, "numbers")
     try:
         # Suy luận ngôn ngữ hồ sơ (ngon_ngu_cv) từ mô tả & yêu cầu công việc (token hoá không dấu).
         df = update_ngon_ngu_cv(df)
         print(f"  ✅ Đã update ngôn ngữ")
     except Exception as e:
         print(f"  ⚠️ Lỗi khi quét ngôn ngữ trong preprocess: {e}")
+    steps.done(df, "languages")
     # 7) Phúc lợi
     try:
         # Gán nhãn phúc lợi theo cấu hình BENEFIT_TOKENS (any/all tokens).
         # Kết quả:
         #  - 'nhom_phuc_loi': chuỗi tóm tắt theo nhóm + item
         #  - 'so_phuc_loi_tim_duoc': đếm số item match
-        def _scan_row(row):
-            raw_text = " \n ".join([
-                str(row.get("mo_ta_cong_viec", "")),
-                str(row.get("yeu_cau_cong_viec", "")),
-                str(row.get("phuc_loi", "")),
-            ])
-            text_norm = normalize_text(raw_text)
-            found = detect_benefits_tokens(text_norm, BENEFIT_TOKENS)
-
-            parts, total = [], 0
-            for g_key, g_val in BENEFIT_TOKENS.items():
-                items = found.get(g_key, [])
-                if not items:
-                    continue
-                labels = [g_val["items"].get(i, {}).get("label", i) for i in items]
-                parts.append(f"{g_val.get('title', g_key)}: " + ", ".join(labels))
-                total += len(items)
-            return " | ".join(parts), total
-
-        # Áp trên từng dòng: result_type="expand" để nhận 2 cột kết quả
-        results = df.apply(_scan_row, axis=1, result_type="expand")
+        benefit_cols = ["mo_ta_cong_viec", "yeu_cau_cong_viec", "phuc_loi"]
+
+        # Quét theo bộ (mô tả, yêu cầu, phúc lợi) khác nhau; cột thiếu coi như "" (như row.get cũ).
+        # Văn bản dài -> các bộ khác nhau được chia khúc chạy nhiều tiến trình nếu bật CHUNK_WORKERS
+        keys = pd.DataFrame({c: df[c] if c in df.columns else "" for c in benefit_cols}, index=df.index)
+        scanned = memo_apply_rows(keys, benefit_cols, _scan_row, parallel=True)
+        results = pd.DataFrame(scanned.tolist(), index=df.index) if len(scanned) else \
+            pd.DataFrame({0: pd.Series(dtype=object), 1: pd.Series(dtype=object)}, index=df.index)
         pos = df.columns.get_loc("phuc_loi") if "phuc_loi" in df.columns else len(df.columns) - 1
         # Tránh trùng cột cũ nếu từng chạy trước đó
         for c in ["nhom_phuc_loi", "so_phuc_loi_tim_duoc"]:
@@ -2332,10 +2485,10 @@ def _apply_pipeline(df: pd.DataFrame, out_file: Path) -> pd.DataFrame:
         # Chèn cột mới cạnh 'phuc_loi' (nếu có), đảm bảo thứ tự hợp lý
         df.insert(min(pos + 1, len(df.columns)), "nhom_phuc_loi", results[0])
         df.insert(min(pos + 2, len(df.columns) + 1), "so_phuc_loi_tim_duoc", results[1])
-        df.to_excel(out_file, index=False)
         print("  ✅ Gắn nhãn phúc lợi")
     except Exception as e:
         print(f"  ❌ Lỗi phúc lợi: {e}")
+    steps.done(df, "benefits")
 
     # 8) Ngành nghề
     try:
@@ -2344,32 +2497,33 @@ def _apply_pipeline(df: pd.DataFrame, out_file: Path) -> pd.DataFrame:
         print("  ✅ Đã tách nganh_nghe.")
     except Exception as e:
         print(f"⚠️ Bỏ qua tách nganh_nghe->nganh: {e}")
+    steps.done(df, "industry")
     # 9) Độ tuổi
     try:
         # Parse 'do_tuoi' → min/max/med_tuoi (hỗ trợ '22-30', '25', ...)
         df = extract_age_range(df, "do_tuoi")
-        df.to_excel(out_file, index=False)
         print("  ✅ Xử lý độ tuổi")
     except Exception as e:
         print(f"  ❌ Lỗi độ tuổi: {e}")
+    steps.done(df, "age")
 
     # 10) Quy mô công ty
     try:
         # Chuẩn hoá 'quy_mo_cong_ty' → min/max/med_quymo (hỗ trợ dấu nghìn, '10+', '50-100 nhân viên', ...)
         df = split_quymo(df, "quy_mo_cong_ty")
-        df.to_excel(out_file, index=False)
         print("  ✅ Xử lý quy_mo_cong_ty")
     except Exception as e:
         print(f"  ❌ Lỗi quy_mo_cong_ty: {e}")
+    steps.done(df, "company_size")
 
     # 11) Điền no_info
     try:
         # Quy về 'no_info' cho NaN/chuỗi rỗng/các biến thể 'không hiển thị' → thống nhất dữ liệu thiếu.
         df = xu_ly_thieu(df)
-        df.to_excel(out_file, index=False)
         print("  ✅ Điền 'no_info'")
     except Exception as e:
         print(f"  ❌ Lỗi điền 'no_info': {e}")
+    steps.done(df, "no_info")
     try:
         # Loại các dòng quá thiếu dữ liệu (tỷ lệ 'no_info' > 85% số cột) để nâng chất lượng tập phân tích.
         df = drop_rows_with_too_much_noinfo(df, threshold=0.85)
@@ -2377,6 +2531,7 @@ def _apply_pipeline(df: pd.DataFrame, out_file: Path) -> pd.DataFrame:
 
     except Exception as e:
         print(f"❌ Lỗi khi xử lý no_info: {e}")
+    steps.done(df, "drop_sparse")
     # 12) Làm sạch & sắp xếp cột
     try:
         try:
@@ -2387,23 +2542,195 @@ def _apply_pipeline(df: pd.DataFrame, out_file: Path) -> pd.DataFrame:
             print(f"  [WARN] clean_nganh_nghe: {e}")
         # Sắp theo thứ tự cột chuẩn hoá (ID, lương, ngày/giờ, phúc lợi, ứng viên, công ty, ...).
         df = reorder_columns(df)
-        df.to_excel(out_file, index=False)
         print("  ✅ Sắp xếp lại cột")
     except Exception as e:
         print(f"  ❌ Lỗi sắp xếp cột: {e}")
+    steps.done(df, "reorder")
 
+    if timings is not None:
+        timings.update(steps.timings)
     return df
 ###########################################
 
+# Mọi file mã nguồn/dữ liệu quyết định kết quả preprocess: file này + module dùng chung
+# (bỏ dấu, bảng nhớ parser, ép kiểu khi ghi parquet, tỷ giá + snapshot, cache GPT)
+_STAGE_SOURCES = (Path(__file__), Path(textnorm.__file__), Path(memo.__file__), Path(frames.__file__),
+                  Path(fx_rates.__file__), fx_rates.FX_SNAPSHOT, Path(llm_cache.__file__))
+
+def _stage_cache() -> "stage_cache.StageCache":
+    # Phiên bản = mã nguồn (_STAGE_SOURCES) + model GPT (đổi code/model -> cache cũ tự vô hiệu)
+    version = stage_cache.code_version(*_STAGE_SOURCES,
+                                       config={"OPENAI_MODEL": os.getenv("OPENAI_MODEL", "gpt-4o-mini")})
+    return stage_cache.StageCache("preprocess", version)
+
+def process_one_file(fp: Path, out_dir: Path) -> Path:
+    """Preprocess 1 file chi tiết → <out_dir>/<stem>_preprocessed.parquet (định dạng trung gian, xem common/frames.py).
+    Trả về đường dẫn file kết quả.
+    Đầu vào trùng từng byte với lần chạy trước (cùng phiên bản) → dùng lại kết quả cũ."""
+    print("\n" + "=" * 80)
+    print(f"[RUN] Đang xử lý: {fp.name}")
+    out_file = out_dir / f"{fp.stem}_preprocessed{frames.interchange_suffix()}"
+    cache = _stage_cache()
+
+    # Chỉ khoá theo byte: cùng tập dòng nhưng khác ID/thứ tự (crawl lại) phải chạy lại,
+    # vì file kết quả cũ mang ID và thứ tự dòng của lần crawl trước
+    keys = [f"bytes:{stage_cache.file_sha256(fp)}"]
+    hit = cache.lookup(keys[0])
+    if hit is not None:
+        stage_cache.link_forward(hit[0], out_file)
+        cache.store(keys, [out_file])
+        artifacts.register(out_file, "preprocessed", parent=fp)
+        print(f"♻️  Bỏ qua (không đổi so với lần trước): {out_file}")
+        emit_event("preprocess_done", input=str(fp), output=str(out_file), cached=True)
+        return out_file
+    # Parquet (hoặc .xlsx cũ từ trước khi đổi định dạng)
+    df = frames.read_frame(fp)
+    print(f"  ✅ Đọc {fp.name}: {df.shape[0]} dòng × {df.shape[1]} cột")
+    # File đích có thể là hard link tới kết quả cache cũ -> gỡ link trước khi ghi để không sửa nhầm bản cũ
+    if out_file.exists():
+        out_file.unlink()
+    n_in = int(df.shape[0])
+
+    # Chạy pipeline và nhận DataFrame đã xử lý; ghi file kết quả đúng 1 lần ở cuối
+    timings: Dict[str, float] = {}
+    _gpt_stats_reset()
+    # Tỷ giá: làm mới (nếu quá hạn) ở đây, ngoài vòng dữ liệu; lúc quy đổi chỉ tra bộ nhớ
+    fx_rates.refresh_if_stale()
+    t0 = time.perf_counter()
+    df_done = _apply_pipeline(df, out_file, timings)
+    t_pipeline = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    frames.write_frame(df_done, out_file)
+    timings["export"] = round(time.perf_counter() - t0, 3)
+    slowest = sorted(timings.items(), key=lambda kv: kv[1], reverse=True)[:5]
+    print(f"  ⏱️ pipeline {t_pipeline:.1f}s + ghi {out_file.suffix} {timings['export']:.1f}s | chậm nhất: "
+          + ", ".join(f"{k}={v:.1f}s" for k, v in slowest))
+    print(f"🎉 Hoàn tất file: {out_file} ({df_done.shape[0]} dòng)")
+    cache.store(keys, [out_file])
+    memo.save_all()
+    artifacts.register(out_file, "preprocessed", rows=int(df_done.shape[0]), parent=fp)
+    emit_event("preprocess_done", input=str(fp), output=str(out_file),
+               rows_in=n_in, rows=int(df_done.shape[0]), timings=timings, llm=gpt_stats_summary())
+    return out_file
+
+# ====== CHẠY SONG SONG NHIỀU FILE (nhiều tiến trình) ======
+# Mỗi file đi qua _apply_pipeline độc lập và phần lớn là regex/apply thuần Python -> luồng bị GIL chặn,
+# nên song song bằng tiến trình: mỗi file chạy trọn trong 1 tiến trình con.
+#   PREPROCESS_WORKERS      = 1 (mặc định, tuần tự như cũ) | N | auto (= số lõi)
+#   PREPROCESS_FOOTPRINT_MB = RAM dự kiến cho 1 file (cùng biến main.py dùng để xếp lịch), mặc định 450
+# Số tiến trình thật = min(N, số file, số lõi, RAM trống / PREPROCESS_FOOTPRINT_MB), tối thiểu 1.
+# Log của mỗi file được gom lại trong tiến trình con rồi in thành 1 khối liền khi file đó xong
+# (kể cả dòng @@EVENT) -> các file không xen dòng vào nhau, thứ tự log trong 1 file giữ nguyên.
+# Khi chạy theo file, pool chia khúc theo dòng (CHUNK_WORKERS, common/chunked.py) bị tắt trong tiến trình con.
+PREPROCESS_WORKERS = os.getenv("PREPROCESS_WORKERS", "1").strip().lower()
+PREPROCESS_FOOTPRINT_MB = float(os.getenv("PREPROCESS_FOOTPRINT_MB", "450"))
+
+def _available_mb() -> Optional[float]:
+    # RAM trống (MB): psutil nếu có, không thì /proc/meminfo (Linux); không đo được -> None (bỏ giới hạn RAM)
+    try:
+        import psutil
+        return psutil.virtual_memory().available / 2**20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _file_pool_size(n_files: int) -> int:
+    """Số tiến trình preprocess song song cho n_files file (1 = chạy tuần tự trong tiến trình hiện tại)."""
+    cores = os.cpu_count() or 1
+    if PREPROCESS_WORKERS in ("auto", "0", ""):
+        want = cores
+    else:
+        try:
+            want = int(PREPROCESS_WORKERS)
+        except ValueError:
+            print(f"[WARN] PREPROCESS_WORKERS={PREPROCESS_WORKERS!r} không hợp lệ -> chạy tuần tự")
+            return 1
+    n = min(want, n_files, cores)
+    avail = _available_mb()
+    if n > 1 and avail is not None and PREPROCESS_FOOTPRINT_MB > 0:
+        by_mem = max(1, int(avail // PREPROCESS_FOOTPRINT_MB))
+        if by_mem < n:
+            print(f"[INFO] RAM trống {avail:.0f} MB / {PREPROCESS_FOOTPRINT_MB:.0f} MB mỗi file -> "
+                  f"giảm còn {by_mem} tiến trình")
+            n = by_mem
+    # Warm worker của main.py là tiến trình daemon -> không được tạo tiến trình con
+    if n > 1 and multiprocessing.current_process().daemon:
+        print("[INFO] Đang chạy trong tiến trình daemon (warm worker) -> preprocess tuần tự")
+        return 1
+    return max(1, n)
+
+def _init_file_worker() -> None:
+    # Đã song song theo file -> tắt pool chia khúc theo dòng (common/chunked.py) trong tiến trình con,
+    # tránh mỗi tiến trình con lại tạo thêm 1 pool (số tiến trình nhân lên, tranh lõi/RAM)
+    os.environ["CHUNK_WORKERS"] = "1"
+
+def _process_file_buffered(fp: Path, out_dir: Path) -> Tuple[Optional[Path], str, Optional[str]]:
+    """Chạy trong tiến trình con: process_one_file với stdout/stderr gom vào bộ đệm.
+    Trả về (file kết quả | None, log của file, thông báo lỗi | None) — lỗi không ném ra ngoài."""
+    buf = io.StringIO()
+    out, err = None, None
+    with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+        try:
+            out = process_one_file(fp, out_dir)
+        except Exception as e:
+            err = str(e)
+    return out, buf.getvalue(), err
+
+def _run_files_parallel(files: List[Path], out_dir: Path, workers: int, progress: ProgressReporter) -> None:
+    print(f"[INFO] Preprocess song song: {workers} tiến trình cho {len(files)} file")
+    # Làm mới tỷ giá 1 lần ở tiến trình cha; tiến trình con chỉ đọc kho (không cùng lúc gọi mạng)
+    fx_rates.refresh_if_stale()
+    done, leftover = 0, []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_file_worker) as ex:
+        futs = {ex.submit(_process_file_buffered, fp, out_dir): fp for fp in files}
+        for fut in as_completed(futs):
+            fp = futs[fut]
+            try:
+                _, log_text, err = fut.result()
+            except BrokenProcessPool:
+                # 1 tiến trình con chết hẳn (vd. bị OOM kill) làm hỏng cả pool -> các file chưa xong chạy lại sau
+                leftover.append(fp)
+                continue
+            except Exception as e:
+                log_text, err = "", str(e)
+            _flush_file_log(fp, log_text, err)
+            done += 1
+            progress.update(done=done)
+    if leftover:
+        leftover.sort(key=files.index)
+        print(f"[WARN] Pool tiến trình bị hỏng -> chạy lại lần lượt {len(leftover)} file chưa xong")
+        # Mỗi file 1 tiến trình riêng: file làm chết tiến trình chỉ hỏng chính nó, không kéo theo tiến trình cha
+        for fp in leftover:
+            try:
+                with ProcessPoolExecutor(max_workers=1, initializer=_init_file_worker) as ex:
+                    _, log_text, err = ex.submit(_process_file_buffered, fp, out_dir).result()
+            except BrokenProcessPool:
+                log_text, err = "", "tiến trình con bị dừng đột ngột (hết RAM?)"
+            _flush_file_log(fp, log_text, err)
+            done += 1
+            progress.update(done=done)
+
+def _flush_file_log(fp: Path, log_text: str, err: Optional[str]) -> None:
+    sys.stdout.write(log_text)
+    if err:
+        print(f"[ERROR] Lỗi xử lý {fp.name}: {err}")
+    sys.stdout.flush()
+
 def main():
     from dotenv import load_dotenv
-    import pandas as pd
 
     load_dotenv()
 
     # --- Định vị project root & thư mục IO ---
     # - JOBSDETAIL_DIR: đầu vào là các file chi tiết đã crawl (mỗi ngành/mỗi lần chạy 1 file).
-    # - PREPROCESS_DIR: đầu ra của pipeline preprocess (mỗi file input → 1 file _preprocessed.xlsx).
+    # - PREPROCESS_DIR: đầu ra của pipeline preprocess (mỗi file input → 1 file _preprocessed.parquet).
     ROOT = _project_root()
     JOBSDETAIL_DIR = Path(os.getenv("JOBSDETAIL_DIR", ROOT / "output" / "jobsdetail"))
     PREPROCESS_DIR = Path(os.getenv("PREPROCESS_DIR", ROOT / "output" / "preprocess"))
@@ -2414,6 +2741,16 @@ def main():
     print(f"[DEBUG] READ  FROM    = {JOBSDETAIL_DIR}")
     print(f"[DEBUG] WRITE TO      = {PREPROCESS_DIR}")
 
+    # PREPROCESS_INPUT: chỉ xử lý đúng 1 file (orchestrator chạy pipelined theo từng ngành)
+    single = os.getenv("PREPROCESS_INPUT")
+    if single:
+        try:
+            process_one_file(Path(single), PREPROCESS_DIR)
+        except Exception as e:
+            print(f"[ERROR] Lỗi xử lý {single}: {e}", file=sys.stderr)
+            sys.exit(5)
+        return
+
     try:
         # Lấy danh sách file mới nhất theo từng nhóm (slug, gid, loc)
         # — tránh trộn nhiều phiên bản cũ/mới của cùng một ngành/địa phương.
@@ -2426,25 +2763,19 @@ def main():
             print(" -", f.name)
 
         # Xử lý từng file độc lập để nếu 1 file lỗi vẫn không ảnh hưởng các file khác
-        for fp in files:
-            print("\n" + "=" * 80)
-            print(f"[RUN] Đang xử lý: {fp.name}")
-            try:
-                # Đọc Excel bằng openpyxl (an toàn với định dạng mới)
-                df = pd.read_excel(fp, engine="openpyxl")
-                print(f"  ✅ Đọc {fp.name}: {df.shape[0]} dòng × {df.shape[1]} cột")
-
-                out_file = PREPROCESS_DIR / f"{fp.stem}_preprocessed.xlsx"
-                # Ghi bản gốc ngay lập tức: tiện theo dõi chênh lệch sau từng bước pipeline
-                df.to_excel(out_file, index=False)
-
-                # Chạy pipeline và nhận DataFrame đã xử lý
-                df_done = _apply_pipeline(df, out_file)
-                print(f"🎉 Hoàn tất file: {out_file} ({df_done.shape[0]} dòng)")
-
-            except Exception as e:
-                # Không dừng toàn bộ: log lỗi file hiện tại và chuyển sang file kế tiếp
-                print(f"[ERROR] Lỗi xử lý {fp.name}: {e}")
+        progress = ProgressReporter("preprocess", "files", total=len(files), unit="file")
+        workers = _file_pool_size(len(files))
+        if workers > 1:
+            _run_files_parallel(files, PREPROCESS_DIR, workers, progress)
+        else:
+            for i, fp in enumerate(files, 1):
+                try:
+                    process_one_file(fp, PREPROCESS_DIR)
+                except Exception as e:
+                    # Không dừng toàn bộ: log lỗi file hiện tại và chuyển sang file kế tiếp
+                    print(f"[ERROR] Lỗi xử lý {fp.name}: {e}")
+                progress.update(done=i)
+        progress.finish()
 
         print("\n✅ Tất cả file đã được xử lý xong.")
 
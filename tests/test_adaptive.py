@@ -0,0 +1,148 @@
+# Kiểm thử AIMDController / run_lanes bằng SimulatedServer (không cần mạng, không cần Chrome).
+#       python -m pytest -q tests
+import sys
+import threading
+from pathlib import Path
+
+_ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(_ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(_ROOT_DIR))
+
+import pytest  # noqa: E402
+
+from crawler.adaptive import (OK, THROTTLED, TIMEOUT, AIMDController, SimulatedServer,  # noqa: E402
+                              run_lanes, simulate)
+
+
+class _FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _round(ctrl, latency=1.0, outcome=OK):
+    """1 "vòng" = limit request hoàn tất."""
+    n = ctrl.current
+    epochs = [ctrl.acquire() for _ in range(n)]
+    for e in epochs:
+        ctrl.release(latency, outcome, e)
+
+
+def test_additive_increase_per_healthy_round():
+    ctrl = AIMDController("t", initial=1, max_limit=5, p95_target_s=10, clock=_FakeClock())
+    for expected in (2, 3, 4, 5, 5):
+        _round(ctrl)
+        assert ctrl.current == expected
+
+
+def test_multiplicative_decrease_once_per_congestion_episode():
+    ctrl = AIMDController("t", initial=8, max_limit=8, clock=_FakeClock())
+    epochs = [ctrl.acquire() for _ in range(8)]
+    for e in epochs:   # cả 8 request của cùng 1 đợt bị 429 -> chỉ giảm 1 lần
+        ctrl.release(0.1, THROTTLED, e)
+    assert ctrl.current == 4
+    assert ctrl.counts[THROTTLED] == 8
+
+
+def test_high_p95_decreases_limit():
+    ctrl = AIMDController("t", initial=4, max_limit=8, p95_target_s=2.0, clock=_FakeClock())
+    _round(ctrl, latency=5.0)
+    assert ctrl.current == 2
+
+
+def test_limit_respects_bounds():
+    ctrl = AIMDController("t", initial=1, min_limit=1, max_limit=3, clock=_FakeClock())
+    e = ctrl.acquire()
+    ctrl.release(1.0, TIMEOUT, e)
+    assert ctrl.current == 1
+    for _ in range(10):
+        _round(ctrl)
+    assert ctrl.current == 3
+
+
+def test_lanes_follow_limit_and_share():
+    ctrl = AIMDController("t", initial=5, max_limit=9, share=2)
+    assert ctrl.lanes() == 3
+    assert ctrl.max_lanes() == 5
+
+
+def test_simulation_ramps_up_real_concurrency():
+    # Server khoẻ tới 4 đồng thời: limit phải tăng từ 1 và số làn / request đồng thời thật cũng tăng theo
+    ctrl = AIMDController("sim", initial=1, max_limit=4, p95_target_s=4.0, window=20)
+    srv = SimulatedServer(capacity=4, base_latency_s=2.0, throttle_at=6, seed=1)
+    snap = simulate(ctrl, srv, n_requests=300)
+    assert snap["peak_limit"] == 4
+    assert snap["peak_lanes"] > 1
+    assert srv.max_active > 1
+    assert snap["outcomes"].get(OK) == 300
+
+
+def test_simulation_backs_off_when_throttled():
+    # Trần cho phép 10 nhưng server trả 429 khi > 3 đồng thời -> limit dò lên tới ngưỡng rồi bị cắt nửa
+    # (răng cưa quanh ngưỡng), không bao giờ leo tới trần
+    ctrl = AIMDController("sim", initial=1, max_limit=10, p95_target_s=4.0, window=20)
+    srv = SimulatedServer(capacity=2, base_latency_s=1.0, throttle_at=3, seed=2)
+    snap = simulate(ctrl, srv, n_requests=600)
+    assert snap["outcomes"].get(THROTTLED, 0) > 0
+    assert snap["peak_limit"] <= srv.throttle_at + 1
+    cuts = [a for a in snap["adjustments"] if a["reason"] == THROTTLED]
+    assert cuts and all(a["limit"] <= (srv.throttle_at + 1) // 2 for a in cuts)
+    assert srv.max_active <= srv.throttle_at + 1
+
+
+def test_run_lanes_without_controller_is_sequential():
+    items = list(range(20))
+    seen, active, peak = [], [0], [0]
+    lock = threading.Lock()
+
+    def next_item():
+        with lock:
+            return items.pop(0) if items else None
+
+    def work(_state, item):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        seen.append(item)
+        with lock:
+            active[0] -= 1
+
+    assert run_lanes(None, next_item, work) == 1
+    assert seen == list(range(20))
+    assert peak[0] == 1
+
+
+def test_run_lanes_opens_and_closes_lane_resources():
+    ctrl = AIMDController("t", initial=3, max_limit=3)
+    opened, closed = [], []
+    items = list(range(30))
+    lock = threading.Lock()
+
+    def next_item():
+        with lock:
+            return items.pop(0) if items else None
+
+    def open_lane(i):
+        opened.append(i)
+        return {"lane": i}
+
+    run_lanes(ctrl, next_item, lambda state, item: None, open_lane=open_lane, close_lane=closed.append)
+    assert not items
+    assert len(opened) == len(closed) >= 1
+    assert set(opened) <= {0, 1, 2}
+
+
+def test_run_lanes_reraises_worker_error():
+    items = list(range(5))
+
+    def next_item():
+        return items.pop(0) if items else None
+
+    def work(_state, item):
+        if item == 2:
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run_lanes(AIMDController("t", initial=2, max_limit=2), next_item, work)
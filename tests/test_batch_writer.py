@@ -0,0 +1,52 @@
+# Kiểm thử _BatchWriter của crawler: batch ghi lỗi không được mất âm thầm (close() phải ném lỗi).
+#       python -m pytest -q tests      (cần pandas/openpyxl/selenium như requirements.txt, thiếu thì bỏ qua)
+import sys
+from pathlib import Path
+
+_ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(_ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(_ROOT_DIR))
+
+import pytest  # noqa: E402
+
+pytest.importorskip("pandas")
+pytest.importorskip("openpyxl")
+pytest.importorskip("selenium")
+scraper = pytest.importorskip("crawler.selenium_scraper")
+
+
+def _rows(start, n):
+    return [{"ID": start + i, "Tên công việc": f"job {start + i}"} for i in range(n)]
+
+
+def test_writer_writes_all_batches(tmp_path):
+    out = tmp_path / "detail.xlsx"
+    w = scraper._BatchWriter(str(out))
+    w.submit(_rows(0, 3))
+    w.submit(_rows(3, 2))
+    assert w.close() == 5
+    assert out.exists() and not scraper._xlsx_part_path(out).exists()
+    assert len(scraper.frames.read_frame(out)) == 5
+
+
+def test_writer_failed_batch_raises_and_publishes_nothing(tmp_path, monkeypatch):
+    out = tmp_path / "detail.xlsx"
+    real_append = scraper._append_batch
+    calls = {"n": 0}
+
+    def _flaky(path, records, sheet_name="jobs"):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise OSError("disk full")
+        real_append(path, records, sheet_name=sheet_name)
+
+    monkeypatch.setattr(scraper, "_append_batch", _flaky)
+    w = scraper._BatchWriter(str(out))
+    for start in (0, 3, 6):
+        w.submit(_rows(start, 3))
+    with pytest.raises(RuntimeError, match="3 dòng chưa ghi") as exc:
+        w.close()
+    assert isinstance(exc.value.__cause__, OSError)
+    assert w.stats()["writer_lost_rows"] == 3
+    # Không công bố file thiếu dòng, không để lại file tạm cho lần thử lại
+    assert not out.exists() and not scraper._xlsx_part_path(out).exists()
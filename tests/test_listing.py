@@ -0,0 +1,119 @@
+# Kiểm thử pha listing (get_vietnamworks_jobs_by_group) bằng driver giả: không cần mạng, không cần Chrome.
+#       python -m pytest -q tests      (cần pandas/selenium như requirements.txt, thiếu thì bỏ qua)
+import contextlib
+import sys
+import threading
+from pathlib import Path
+
+_ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(_ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(_ROOT_DIR))
+
+import pytest  # noqa: E402
+
+pytest.importorskip("pandas")
+pytest.importorskip("selenium")
+scraper = pytest.importorskip("crawler.selenium_scraper")
+
+
+class _Block:
+    def __init__(self, hrefs):
+        self.hrefs = hrefs
+
+    def find_elements(self, by, sel):
+        return [[h] for h in self.hrefs]   # 1 "card" = list 1 href (xem _card_links bên dưới)
+
+
+class _FakeDriver:
+    """Site giả: pages[n] = list href của trang n; ngoài phạm vi -> trang rỗng.
+    Dùng chung giữa các làn -> trang đang mở lưu theo thread."""
+
+    def __init__(self, pages, total):
+        self.pages, self.total = pages, total
+        self.visited = []
+        self.title = "Việc làm"
+        self._local = threading.local()
+
+    def get(self, url):
+        self.visited.append(url)
+        self._local.page = int(url.rsplit("&page=", 1)[1]) if "&page=" in url else 1
+
+    @property
+    def page_source(self):
+        return f'{{"nbHits":{self.total}}}'
+
+    def find_element(self, by, sel):
+        return _Block(self.pages.get(self._local.page, []))
+
+
+class _FakeWatchdog:
+    def __init__(self, driver):
+        self.driver = driver
+
+    @contextlib.contextmanager
+    def deadline(self, url):
+        yield self.driver
+
+    def stats(self):
+        return {"watchdog_kills": 0, "driver_replacements": 0}
+
+    def quit(self):
+        pass
+
+
+class _NoWait:
+    def __init__(self, *a, **k):
+        pass
+
+    def until(self, *a, **k):
+        return True
+
+
+@pytest.fixture
+def site(monkeypatch):
+    pages = {n: [f"https://x/job-{n}-{i}-jv" for i in range(3)] for n in range(1, 5)}   # 4 trang × 3 job
+    driver = _FakeDriver(pages, total=12)
+    monkeypatch.setattr(scraper, "DriverWatchdog", lambda *a, **k: _FakeWatchdog(driver))
+    monkeypatch.setattr(scraper, "WebDriverWait", _NoWait)
+    monkeypatch.setattr(scraper, "_scroll_lazy", lambda *a, **k: None)
+    monkeypatch.setattr(scraper, "_extract_links_stepwise_from_card", lambda card: card)
+    return driver
+
+
+def _crawl(**kw):
+    stats = {}
+    rows = scraper.get_vietnamworks_jobs_by_group(group_id=7, group_name="g", delay=0, stats=stats, **kw)
+    return [r["href"] for r in rows], stats
+
+
+def test_reuses_planner_first_page(site):
+    first = site.pages[1]
+    hrefs, stats = _crawl(expected_total=12, first_page_hrefs=first)
+    assert len(hrefs) == 12 and set(first) <= set(hrefs)
+    assert not any("&page=" not in u for u in site.visited)   # trang 1 không bị tải lại
+    assert stats["first_page_reused"] and stats["stop_reason"] == "plan_complete"
+
+
+def test_jobs_posted_after_plan_are_not_cut(site):
+    # Kế hoạch cũ: 6 job (2 trang). Trang 1 tải mới báo 12 -> phải đi hết 4 trang, không dừng ở trang 2
+    hrefs, stats = _crawl(expected_total=6)
+    assert len(hrefs) == 12
+    assert stats["pages_fetched"] == 4 and stats["stop_reason"] == "plan_complete"
+
+
+def test_without_total_stops_on_empty_page(site):
+    site.total = 0   # trang không hiển thị tổng -> chỉ còn dừng theo trang rỗng / no_gain_patience
+    hrefs, stats = _crawl()
+    assert len(hrefs) == 12
+    assert stats["stop_reason"] == "empty_page" and stats["pages_fetched"] == 5
+
+
+def test_parallel_lanes_process_pages_in_order(site):
+    from crawler.adaptive import AIMDController
+
+    site.total = 0
+    ctrl = AIMDController("listing", initial=3, max_limit=3)
+    hrefs, stats = _crawl(limiter=ctrl)
+    # Trang tải song song nhưng ghép theo thứ tự trang -> kết quả như chạy tuần tự
+    assert hrefs == [h for n in range(1, 5) for h in site.pages[n]]
+    assert stats["stop_reason"] == "empty_page" and stats["pages_fetched"] == 5
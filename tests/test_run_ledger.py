@@ -0,0 +1,74 @@
+# Kiểm thử RunLedger.resume_run: không tiếp tục lần chạy mà tiến trình chủ vẫn đang chạy.
+#       python -m pytest -q tests
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+_ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(_ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(_ROOT_DIR))
+
+import pytest  # noqa: E402
+
+from common.run_ledger import RunInProgressError, RunLedger  # noqa: E402
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return RunLedger(tmp_path / "ledger.sqlite")
+
+
+def _run_row(ledger, run_id):
+    return ledger._query("SELECT * FROM runs WHERE run_id=?", (run_id,))[0]
+
+
+def _stage_status(ledger, run_id):
+    return [r["status"] for r in ledger.stages(run_id)]
+
+
+def _set_owner(ledger, run_id, **cols):
+    sets = ", ".join(f"{k}=?" for k in cols)
+    ledger._exec(f"UPDATE runs SET {sets} WHERE run_id=?", (*cols.values(), run_id))
+
+
+def test_refuses_run_owned_by_live_process(ledger):
+    run_id = ledger.start_run(mode="grouped", run_id="r1")
+    ledger.start_stage(run_id, "crawl_group", "crawl_g5", 5)
+    owner = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    try:
+        time.sleep(0.2)
+        _set_owner(ledger, run_id, pid=owner.pid, claimed_at=time.time())
+        with pytest.raises(RunInProgressError):
+            ledger.resume_run(run_id)
+        # Lần chạy đang sống không bị đụng tới
+        assert _stage_status(ledger, run_id) == ["running"]
+        assert _run_row(ledger, run_id)["pid"] == owner.pid
+    finally:
+        owner.kill()
+        owner.wait()
+    # Tiến trình chủ đã chết -> được tiếp tục, bước dở thành interrupted, quyền chuyển sang tiến trình này
+    ledger.resume_run(run_id)
+    assert _stage_status(ledger, run_id) == ["interrupted"]
+    row = _run_row(ledger, run_id)
+    assert row["status"] == "running" and row["pid"] != owner.pid
+
+
+def test_finished_run_and_legacy_rows_resume(ledger):
+    ledger.start_run(run_id="done")
+    ledger.finish_run("done", "partial", "1 ngành lỗi")
+    ledger.resume_run("done")
+    assert _run_row(ledger, "done")["status"] == "running"
+
+    ledger.start_run(run_id="old")
+    _set_owner(ledger, "old", pid=None, claimed_at=None)   # bản ghi từ trước khi có cột pid
+    ledger.resume_run("old")
+
+
+def test_other_host_needs_force(ledger):
+    ledger.start_run(run_id="r2")
+    _set_owner(ledger, "r2", host="another-box", pid=123)
+    with pytest.raises(RunInProgressError, match="another-box"):
+        ledger.resume_run("r2")
+    ledger.resume_run("r2", force=True)
+    assert _run_row(ledger, "r2")["host"] != "another-box"
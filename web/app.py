@@ -1,17 +1,28 @@
-import unicodedata
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from datetime import datetime
+import os
+import time
 import pandas as pd
 import re
 import uvicorn
-import unicodedata as _ud
 from typing import Optional
 import traceback
 import regex as re
+import sys
+import json
+import asyncio
+import threading
+from collections import OrderedDict
+
+# web/app.py chạy như script/uvicorn -> đưa project root vào sys.path để import common.*
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import artifacts, textnorm
+from common.data_manifest import manifest_path, read_manifest
+from common.progress_board import PROGRESS_PATH, read_progress
 MAPPING = {
     "ban le tieu dung": "Bán lẻ Tiêu dùng",
     "bao hiem": "Bảo hiểm",
@@ -199,11 +210,7 @@ ALIASES = {
 def _no_accent_lower(s: str) -> str:
     if not s:
         return ""
-    s = _ud.normalize("NFD", str(s))
-    s = "".join(ch for ch in s if _ud.category(ch) != "Mn")
-    s = s.lower().strip()
-    s = re.sub(r"\s+", " ", s)
-    return s
+    return re.sub(r"\s+", " ", textnorm.no_accent_lower(s))
 
 def _ranked_suggestions(latest: dict, q: str) -> list[dict]:
 
@@ -260,12 +267,6 @@ ROOT = HERE.parent                          # .../<root>
 ANALYZER_DIR = ROOT / "output" / "analyzer" # đúng vị trí dữ liệu
 INDEX_HTML   = HERE / "index.html"          # index.html nằm cạnh app.py
 
-FNAME_RE = re.compile(
-    r"^job_detail_output_(?P<slug>.+?)_g(?P<gid>\d+)_(?P<loc>\d{4})_"
-    r"(?P<date>\d{4}-\d{2}-\d{2})_(?P<time>\d{6})_analyzed\.xlsx$",
-    re.IGNORECASE,
-)
-
 app = FastAPI(title="One-Page Analyzer (React+FastAPI)")
 
 app.add_middleware(
@@ -278,11 +279,7 @@ app.mount("/web", StaticFiles(directory=HERE), name="web")
 
 # ----------------- Helpers -----------------
 def _strip_accents_lower(s):
-    if s is None:
-        return ""
-    s = unicodedata.normalize("NFD", str(s))
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-    return s.lower().strip()
+    return textnorm.no_accent_lower(s)
 def _norm_slug_key(s: str) -> str:
     if s is None:
         return ""
@@ -298,43 +295,118 @@ def slug_to_label(slug: str) -> str:
     key = _norm_slug_key(slug)
     return MAPPING.get(key, key.title())
 
-def _parse_dt(date_str: str, time_str: str) -> datetime:
-    # date: YYYY-MM-DD, time: HHMMSS
-    return datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H%M%S")
-
 def _scan_latest_by_key() -> dict:
+    # Không còn quét thư mục: tra bảng `latest` của catalog (common/artifacts.py)
     ANALYZER_DIR.mkdir(parents=True, exist_ok=True)
 
     latest: dict[tuple[str, str, str], dict] = {}
-    for p in ANALYZER_DIR.glob("*.xlsx"):
-        m = FNAME_RE.match(p.name)
-        if not m:
-            continue
+    for r in artifacts.catalog().latest("analyzed", ANALYZER_DIR):
+        slug_key = r["slug"]  # catalog đã chuẩn hoá slug giống _norm_slug_key
+        latest[(slug_key, r["gid"], r["loc"])] = {
+            "file": Path(r["path"]),
+            "dt": datetime.strptime(r["run_ts"], "%Y-%m-%d_%H%M%S"),
+            "label": slug_to_label(slug_key),  # <-- tên có dấu
+            "slug": slug_key,                  # <-- slug đã chuẩn hoá (dùng cho API/search)
+            "gid": r["gid"],
+            "loc": r["loc"],
+        }
+    return latest
 
-        slug_raw = m.group("slug")
-        gid      = m.group("gid")
-        loc      = m.group("loc")
-        dt       = _parse_dt(m.group("date"), m.group("time"))
-
-        # CHUẨN HOÁ slug để so sánh & làm key
-        slug_key = _norm_slug_key(slug_raw)
-        key      = (slug_key, gid, loc)
-
-        cur = latest.get(key)
-        if cur is None or dt > cur["dt"]:
-            latest[key] = {
-                "file": p,
-                "dt": dt,
-                "label": slug_to_label(slug_key),  # <-- tên có dấu
-                "slug": slug_key,                  # <-- slug đã chuẩn hoá (dùng cho API/search)
-                "gid": gid,
-                "loc": loc,
-            }
+# ----------------- Nạp dữ liệu nóng theo manifest -----------------
+# Pipeline ghi output/analyzer/manifest.json (xem common/data_manifest.py) mỗi khi có dữ liệu mới.
+# Mỗi request chỉ stat() manifest (tối đa 1 lần / MANIFEST_POLL_S); version đổi -> nạp lại danh sách
+# ngành và bỏ cache của những file có nội dung đổi. Cache sheet đánh khoá theo sha256 nội dung nên
+# ngành không đổi (file mới chỉ là hard link của kết quả cũ) vẫn giữ cache.
+MANIFEST_PATH = manifest_path(ANALYZER_DIR)
+MANIFEST_POLL_S = float(os.getenv("MANIFEST_POLL_S", "2"))
+ANALYSIS_CACHE_MAX = int(os.getenv("ANALYSIS_CACHE_MAX", "64"))
+
+_data_lock = threading.Lock()
+_data_state = {"version": None, "mtime_ns": None, "checked": 0.0, "latest": None, "sha": {}}
+_sheet_cache: "OrderedDict[str, list]" = OrderedDict()
+
+
+def _latest_from_manifest(man: dict) -> dict:
+    latest = {}
+    for e in man.get("industries", {}).values():
+        p = ANALYZER_DIR / e["file"]
+        if not p.exists():
+            continue
+        latest[(e["slug"], e["gid"], e["loc"])] = {
+            "file": p,
+            "dt": datetime.fromisoformat(e["dt"]),
+            "label": slug_to_label(e["slug"]),
+            "slug": e["slug"],
+            "gid": e["gid"],
+            "loc": e["loc"],
+        }
     return latest
 
+
+def _current_latest() -> dict:
+    """Danh sách ngành hiện hành: theo manifest nếu có, không có manifest thì quét thư mục như cũ."""
+    now = time.monotonic()
+    with _data_lock:
+        st = _data_state
+        if st["latest"] is not None and now - st["checked"] < MANIFEST_POLL_S:
+            return st["latest"]
+        st["checked"] = now
+        try:
+            mtime_ns = MANIFEST_PATH.stat().st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if mtime_ns is None:
+            st.update(version=None, mtime_ns=None, sha={}, latest=_scan_latest_by_key())
+            return st["latest"]
+        if mtime_ns == st["mtime_ns"] and st["latest"] is not None:
+            return st["latest"]
+        man = read_manifest(MANIFEST_PATH)
+        if man is None:   # không đọc được (hiếm vì ghi nguyên tử) -> giữ bản cũ, thử lại lần sau
+            return st["latest"] if st["latest"] is not None else _scan_latest_by_key()
+        if man["version"] != st["version"]:
+            sha = {e["file"]: e["sha256"] for e in man.get("industries", {}).values()}
+            live = set(sha.values())
+            dropped = [k for k in _sheet_cache if k not in live]
+            for k in dropped:
+                _sheet_cache.pop(k, None)
+            print(f"[DATA] Manifest {st['version']} -> {man['version']}: {len(sha)} ngành, "
+                  f"bỏ {len(dropped)} cache, giữ {len(_sheet_cache)}")
+            st.update(version=man["version"], sha=sha, latest=_latest_from_manifest(man))
+        st["mtime_ns"] = mtime_ns
+        return st["latest"]
+
+
+def _cached_sheets(fp: Path) -> list:
+    with _data_lock:
+        key = _data_state["sha"].get(fp.name)
+    if key is None:
+        try:
+            stt = fp.stat()
+            key = f"{fp}:{stt.st_size}:{stt.st_mtime_ns}"
+        except OSError:
+            key = str(fp)
+    with _data_lock:
+        if key in _sheet_cache:
+            _sheet_cache.move_to_end(key)
+            return _sheet_cache[key]
+    sheets = _build_sheets(fp)
+    with _data_lock:
+        _sheet_cache[key] = sheets
+        while len(_sheet_cache) > ANALYSIS_CACHE_MAX:
+            _sheet_cache.popitem(last=False)
+    return sheets
+
+
+@app.get("/api/data-version")
+def data_version():
+    _current_latest()
+    return JSONResponse({"version": _data_state["version"], "industries": len(_data_state["latest"] or {}),
+                         "cached": len(_sheet_cache)})
+
+
 def _latest_for_slug(slug_pick: str) -> Path:
     slug_pick_norm = _norm_slug_key(slug_pick)
-    latest = _scan_latest_by_key()
+    latest = _current_latest()
 
     # Khớp chính xác trước
     best = None
@@ -365,7 +437,7 @@ def serve_index():
 
 @app.get("/api/industries")
 def list_industries(q: Optional[str] = None):
-    latest = _scan_latest_by_key()
+    latest = _current_latest()
 
     if not q:
         items = []
@@ -400,28 +472,8 @@ SHEET_MAPPING = {
     "phuc_loi_nhom_theo_nganh": "Phúc lợi nhận được",
 }
 
-@app.get("/api/analysis/{slug}")
-def get_analysis(slug: str):
-    try:
-        fp = _latest_for_slug(slug)
-    except FileNotFoundError:
-        raise HTTPException(404, detail=f"Không tìm thấy file cho slug: {slug}")
-    except Exception as e:
-        raise HTTPException(400, detail=f"Lỗi tìm file cho slug {slug}: {e}")
-
-    # Lấy slug từ tên file
-    m = re.match(r"^job_detail_output_(.+?)_g\d+", fp.name)
-    if not m:
-        raise HTTPException(400, detail=f"Không parse được ngành từ tên file: {fp.name}")
-    slug_raw = m.group(1).strip()
-    slug_clean = slug_raw.replace("_", " ")
-    nganh_text = MAPPING.get(slug_clean.lower(), slug_clean.title())
-
-    print(f"[DEBUG] File: {fp.name}")
-    print(f"[DEBUG] Slug raw: {slug_raw}")
-    print(f"[DEBUG] Slug clean: {slug_clean}")
-    print(f"[DEBUG] Ngành mapped: {nganh_text}")
-
+def _build_sheets(fp: Path) -> list:
+    """Đọc file phân tích -> danh sách sheet (html + json) cho UI."""
     try:
         xls = pd.ExcelFile(fp, engine="openpyxl")
     except Exception as e:
@@ -544,12 +596,6 @@ def get_analysis(slug: str):
                 col_name = next((c for c in ["Tên ngành", "ten_nganh", "Tên Ngành", "nganh"]
                                  if c in df_for_table.columns), None)
                 if col_name:
-                    import unicodedata
-                    def _norm(s):
-                        if s is None: return ""
-                        s = unicodedata.normalize("NFD", str(s))
-                        s = "".join(ch for ch in s if unicodedata.category(s) != "Mn")
-                        return s.strip().lower()
                     mask = ~df_for_table[col_name].map(_strip_accents_lower).isin(["top nganh"])
                     df_for_table = df_for_table[mask]
 
@@ -561,13 +607,7 @@ def get_analysis(slug: str):
                 col_name = next((c for c in ["Tên ngành", "ten_nganh", "Tên Ngành", "nganh"]
                                  if c in df_for_table.columns), None)
                 if col_name:
-                    import unicodedata
-                    def _norm(s):
-                        if s is None: return ""
-                        s = unicodedata.normalize("NFD", str(s))
-                        s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-                        return s.strip().lower()
-                    mask = ~df_for_table[col_name].map(_norm).isin(["top nganh"])
+                    mask = ~df_for_table[col_name].map(_strip_accents_lower).isin(["top nganh"])
                     df_for_table = df_for_table[mask]
 
             if display_name == "Giờ làm việc":
@@ -589,6 +629,32 @@ def get_analysis(slug: str):
         print("[ERROR] Lỗi xử lý sheet:")
         print(traceback.format_exc())
         raise HTTPException(500, detail=f"Lỗi xử lý sheet: {e}")
+    return sheets
+
+
+@app.get("/api/analysis/{slug}")
+def get_analysis(slug: str):
+    try:
+        fp = _latest_for_slug(slug)
+    except FileNotFoundError:
+        raise HTTPException(404, detail=f"Không tìm thấy file cho slug: {slug}")
+    except Exception as e:
+        raise HTTPException(400, detail=f"Lỗi tìm file cho slug {slug}: {e}")
+
+    # Lấy slug từ tên file
+    m = re.match(r"^job_detail_output_(.+?)_g\d+", fp.name)
+    if not m:
+        raise HTTPException(400, detail=f"Không parse được ngành từ tên file: {fp.name}")
+    slug_raw = m.group(1).strip()
+    slug_clean = slug_raw.replace("_", " ")
+    nganh_text = MAPPING.get(slug_clean.lower(), slug_clean.title())
+
+    print(f"[DEBUG] File: {fp.name}")
+    print(f"[DEBUG] Slug raw: {slug_raw}")
+    print(f"[DEBUG] Slug clean: {slug_clean}")
+    print(f"[DEBUG] Ngành mapped: {nganh_text}")
+
+    sheets = _cached_sheets(fp)
 
     meta = {
         "file": fp.name,
@@ -601,6 +667,41 @@ def get_analysis(slug: str):
 
 
 
+# ----------------- Tiến độ lần chạy (orchestrator ghi output/progress.json) -----------------
+@app.get("/api/progress")
+def get_progress():
+    data = read_progress(PROGRESS_PATH)
+    if data is None:
+        raise HTTPException(404, detail="Chưa có lần chạy nào")
+    return JSONResponse(data)
+
+
+@app.get("/api/progress/stream")
+async def stream_progress():
+    """SSE: đẩy progress.json mỗi khi file đổi; gửi comment giữ kết nối mỗi 15s."""
+    async def _gen():
+        last_mtime = None
+        last_ping = time.monotonic()
+        while True:
+            try:
+                mtime = PROGRESS_PATH.stat().st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != last_mtime:
+                data = read_progress(PROGRESS_PATH)
+                if data is not None:
+                    last_mtime = mtime
+                    yield f"event: progress\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                    last_ping = time.monotonic()
+            if time.monotonic() - last_ping > 15:
+                yield ": ping\n\n"
+                last_ping = time.monotonic()
+            await asyncio.sleep(1.0)
+
+    return StreamingResponse(_gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 # ========== MAIN ==========
 if __name__ == "__main__":
    import uvicorn